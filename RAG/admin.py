@@ -0,0 +1,24 @@
+from django.contrib import admin
+
+from RAG.models import NodeMetric
+
+
+# Register your models here.
+@admin.register(NodeMetric)
+class NodeMetricAdmin(admin.ModelAdmin):
+    """Admin View for NodeMetric"""
+
+    list_display = (
+        "node",
+        "duration_ms",
+        "input_tokens",
+        "output_tokens",
+        "cached_tokens",
+        "route",
+        "created_at",
+    )
+    list_filter = (
+        "node",
+        "route",
+        "error",
+    )
@@ -0,0 +1,143 @@
+import random
+from dataclasses import dataclass, field
+from typing import List
+
+# Corpus sizes in pages, selectable by name in the benchmark commands
+CORPUS_SIZES = {"small": 5, "medium": 50, "large": 250}
+
+LINES_PER_PAGE = 45
+
+SUBJECTS = [
+    "the reactor",
+    "the northern warehouse",
+    "project atlas",
+    "the billing service",
+    "the research team",
+    "the supply contract",
+    "the training program",
+    "the mobile app",
+    "the quarterly budget",
+    "the data center",
+]
+ATTRIBUTES = [
+    "operating cost",
+    "launch date",
+    "project lead",
+    "failure rate",
+    "storage capacity",
+    "primary supplier",
+    "headcount",
+    "response time",
+]
+FILLER = (
+    "The committee reviewed the report and agreed to revisit the figures "
+    "during the next planning cycle, pending further analysis of the "
+    "operational constraints described in the previous section."
+)
+
+
+@dataclass
+class SyntheticFact:
+    """A statement planted in the corpus, with a question it answers."""
+
+    subject: str
+    attribute: str
+    value: str
+    page: int
+
+    @property
+    def sentence(self) -> str:
+        return f"The {self.attribute} of {self.subject} is {self.value}."
+
+    @property
+    def question(self) -> str:
+        return f"What is the {self.attribute} of {self.subject}?"
+
+
+@dataclass
+class SyntheticDocument:
+    """Pages of text plus the facts they contain."""
+
+    pages: List[List[str]] = field(default_factory=list)
+    facts: List[SyntheticFact] = field(default_factory=list)
+
+
+def generate_document(num_pages: int, seed: int = 0, facts_per_page: int = 3):
+    """
+    Generate a synthetic document made of filler text with planted facts.
+
+    :param num_pages: Number of pages.
+    :param seed: Random seed, so corpora are reproducible.
+    :param facts_per_page: Number of facts planted on each page.
+    :return: A SyntheticDocument.
+    """
+    rng = random.Random(seed)
+    document = SyntheticDocument()
+    for page_number in range(num_pages):
+        lines = []
+        for _ in range(facts_per_page):
+            fact = SyntheticFact(
+                subject=f"{rng.choice(SUBJECTS)} {rng.randint(1, 999)}",
+                attribute=rng.choice(ATTRIBUTES),
+                value=f"{rng.randint(10, 99999)} units",
+                page=page_number,
+            )
+            document.facts.append(fact)
+            lines.append(fact.sentence)
+        while len(lines) < LINES_PER_PAGE:
+            lines.append(FILLER[: rng.randint(60, len(FILLER))])
+        rng.shuffle(lines)
+        document.pages.append(lines)
+    return document
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """
+    Write text pages to a minimal, valid PDF file (Helvetica, one text
+    line per entry) without any third-party dependency.
+
+    :param path: Destination file path.
+    :param pages: List of pages, each a list of text lines.
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_numbers = []
+    for lines in pages:
+        stream = "BT /F1 9 Tf 11 TL 40 760 Td " + " ".join(
+            f"({_escape(line)}) Tj T*" for line in lines
+        )
+        stream += " ET"
+        content = stream.encode("latin-1", "replace")
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_numbers.append(len(objects))
+    kids = " ".join(f"{number} 0 R" for number in page_numbers).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(pages))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref_offset,
+    )
+    with open(path, "wb") as f:
+        f.write(output)
@@ -0,0 +1,306 @@
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from RAG.conf import get_rag_settings
+
+WORD_PATTERN = re.compile(r"\w+")
+# Like OpenAI's prompt caching: prompts of at least 1024 tokens, cached in
+# 128 token increments of their prefix
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT_TOKENS = 128
+
+
+def _feature_vector(features, dimensions: int) -> list:
+    """
+    Deterministic hashed bag-of-features embedding, L2-normalised, so texts
+    sharing words (or token ids) end up close to each other.
+    """
+    vector = [0.0] * dimensions
+    for feature in features:
+        digest = hashlib.blake2b(str(feature).encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def __send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/embeddings"):
+            self.__send(200, self.server.fake.embeddings(request))
+        elif self.path.endswith("/chat/completions"):
+            self.__send(200, self.server.fake.chat_completion(request))
+        else:
+            self.__send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+class FakeOpenAIServer:
+    """
+    Local stand-in for the OpenAI chat completions and embeddings endpoints,
+    so the whole stack can be benchmarked offline with a fixed, configurable
+    latency. Point the OpenAI client at it with `OPENAI_BASE_URL=server.url`.
+
+    - Embeddings are hashed bag-of-words vectors (or bag-of-token-ids, since
+      `OpenAIEmbeddings` sends pre-tokenized input).
+    - Structured output requests get a JSON instance of their schema; enums
+      containing "irrelevant" pick it with probability `irrelevant_rate`.
+    - Requests with tools call the first tool until a tool result is present,
+      then answer in text.
+    - With `prompt_caching`, prompt prefixes seen before are reported as
+      cached tokens, as OpenAI's automatic prompt caching does.
+    """
+
+    def __init__(
+        self,
+        chat_latency_ms: float = 0,
+        embedding_latency_ms: float = 0,
+        irrelevant_rate: float = 0.0,
+        dimensions: int = 256,
+        seed: int = 0,
+        prompt_caching: bool = True,
+    ):
+        self.chat_latency_ms = chat_latency_ms
+        self.embedding_latency_ms = embedding_latency_ms
+        self.irrelevant_rate = irrelevant_rate
+        self.dimensions = dimensions
+        self.prompt_caching = prompt_caching
+        self.__prefixes = set()
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server = None
+        self.__thread = None
+        self.reset_counters()
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.__server.daemon_threads = True
+        self.__server.fake = self
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever, name="fake-openai", daemon=True
+        )
+        self.__thread.start()
+        return self
+
+    def gateway_settings(self) -> dict:
+        """
+        `RAG_GATEWAY` settings for models served by this server. Embedding
+        inputs are sent as text, so no tiktoken encoding is downloaded and
+        benchmarks run without network access.
+        """
+        return {**get_rag_settings("GATEWAY"), "EMBEDDING_CHECK_CTX_LENGTH": False}
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_counters(self):
+        with self.__lock:
+            self.counters = {
+                "chat_calls": 0,
+                "embedding_calls": 0,
+                "embedding_inputs": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "completion_tokens": 0,
+            }
+
+    def __count(self, **increments):
+        with self.__lock:
+            for key, value in increments.items():
+                self.counters[key] += value
+
+    def embeddings(self, request: dict) -> dict:
+        time.sleep(self.embedding_latency_ms / 1000)
+        inputs = request.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            features = (
+                WORD_PATTERN.findall(text.lower()) if isinstance(text, str) else text
+            )
+            vector = _feature_vector(features, self.dimensions)
+            if request.get("encoding_format") == "base64":
+                vector = base64.b64encode(
+                    struct.pack(f"<{len(vector)}f", *vector)
+                ).decode()
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        tokens = sum(
+            len(text) // 4 if isinstance(text, str) else len(text) for text in inputs
+        )
+        self.__count(
+            embedding_calls=1, embedding_inputs=len(inputs), prompt_tokens=tokens
+        )
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def __cached_tokens(self, prompt: str) -> int:
+        """
+        Tokens of the longest cacheable prefix of a prompt seen before,
+        counting 4 characters per token. Remembers the prompt's prefixes.
+        """
+        tokens = len(prompt) // 4
+        if not self.prompt_caching or tokens < CACHE_MIN_TOKENS:
+            return 0
+        cached = 0
+        with self.__lock:
+            for size in range(CACHE_MIN_TOKENS, tokens + 1, CACHE_INCREMENT_TOKENS):
+                digest = hashlib.blake2b(prompt[: size * 4].encode()).digest()
+                if digest in self.__prefixes:
+                    cached = size
+                else:
+                    self.__prefixes.add(digest)
+        return cached
+
+    def __instance(self, schema: dict, definitions: dict, text: str):
+        """Builds a JSON value matching a (subset of) JSON schema."""
+        if "$ref" in schema:
+            schema = definitions[schema["$ref"].split("/")[-1]]
+        if "enum" in schema:
+            values = schema["enum"]
+            if "irrelevant" in values:
+                with self.__lock:
+                    irrelevant = self.__random.random() < self.irrelevant_rate
+                return "irrelevant" if irrelevant else values[0]
+            return values[0]
+        for key in ("anyOf", "oneOf", "allOf"):
+            if key in schema:
+                options = [s for s in schema[key] if s.get("type") != "null"]
+                return self.__instance(options[0], definitions, text)
+        schema_type = schema.get("type", "string")
+        if isinstance(schema_type, list):
+            schema_type = next(t for t in schema_type if t != "null")
+        if schema_type == "object":
+            return {
+                name: self.__instance(property_schema, definitions, text)
+                for name, property_schema in schema.get("properties", {}).items()
+            }
+        if schema_type == "array":
+            item_schema = schema.get("items", {})
+            return [
+                self.__instance(item_schema, definitions, f"{text} (variant {i + 1})")
+                for i in range(3)
+            ]
+        if schema_type in ("integer", "number"):
+            return 0
+        if schema_type == "boolean":
+            return True
+        return text
+
+    def chat_completion(self, request: dict) -> dict:
+        time.sleep(self.chat_latency_ms / 1000)
+        messages = request.get("messages", [])
+
+        def content(message):
+            value = message.get("content") or ""
+            if isinstance(value, list):
+                value = " ".join(part.get("text", "") for part in value)
+            return value
+
+        prompt_tokens = sum(len(content(message)) // 4 for message in messages)
+        cached_tokens = min(
+            prompt_tokens,
+            self.__cached_tokens(
+                "".join(f"{m.get('role')}:{content(m)}" for m in messages)
+            ),
+        )
+        user_messages = [content(m) for m in messages if m.get("role") == "user"]
+        last_user = user_messages[-1] if user_messages else ""
+        question = last_user.strip().splitlines()[-1][:200] if last_user.strip() else ""
+
+        message = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+        response_format = request.get("response_format") or {}
+        tools = request.get("tools") or []
+        tool_choice = request.get("tool_choice")
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            instance = self.__instance(schema, schema.get("$defs", {}), question)
+            message["content"] = json.dumps(instance)
+        elif tools and (
+            tool_choice not in (None, "auto", "none")
+            or messages[-1].get("role") != "tool"
+        ):
+            function = tools[0]["function"]
+            if isinstance(tool_choice, dict):
+                name = tool_choice["function"]["name"]
+                function = next(
+                    t["function"] for t in tools if t["function"]["name"] == name
+                )
+            schema = function.get("parameters") or {}
+            arguments = self.__instance(schema, schema.get("$defs", {}), question)
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {
+                        "name": function["name"],
+                        "arguments": json.dumps(arguments),
+                    },
+                }
+            ]
+            finish_reason = "tool_calls"
+        else:
+            message["content"] = f"Synthetic answer to: {question}"
+
+        completion_tokens = len(json.dumps(message)) // 4
+        self.__count(
+            chat_calls=1,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            completion_tokens=completion_tokens,
+        )
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake-chat"),
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": finish_reason}
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
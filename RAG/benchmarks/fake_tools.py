@@ -0,0 +1,34 @@
+import time
+from langchain_core.tools import Tool
+
+# Simulated latency of every fake search, set by the benchmark commands
+TOOL_LATENCY_MS = 300
+
+
+def _fake_search(name: str):
+    def search(query: str) -> str:
+        time.sleep(TOOL_LATENCY_MS / 1000)
+        return (
+            f"[{name}] Result for '{query}': this is a synthetic search result "
+            "returned by the benchmark stand-in tool."
+        )
+
+    return search
+
+
+def get_fake_tools():
+    """
+    Offline stand-ins for `RAG.tools.get_default_tools`, with the same tool
+    names and a configurable latency.
+    """
+    tools = {
+        "web_search": "Useful for searching the web.",
+        "wikipedia_search": "Useful for searching on Wikipedia.",
+        "wikidata_search": "Useful for searching on Wikidata.",
+        "youtube_search": "Useful for searching on youtube.",
+        "latest_news_search": "Useful for searching latest news articles.",
+    }
+    return [
+        Tool(name=name, description=description, func=_fake_search(name))
+        for name, description in tools.items()
+    ]
@@ -0,0 +1,339 @@
+import bisect
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List
+from urllib.parse import urlsplit
+from .stats import summarize_latencies
+
+VARIABLE_PATTERN = re.compile(r"{{\s*([\w.-]+)\s*}}")
+ID_PATTERN = re.compile(r"/\d+(?=/|$)")
+
+
+@dataclass
+class RecordedRequest:
+    """
+    One request of a replayed stream. A recording is a JSONL file with one
+    object per line using these keys, e.g.
+    `{"method": "POST", "path": "/api/ask/", "json": {"question": "...", "thread_id": "1"}}`.
+    """
+
+    method: str
+    path: str
+    json: dict | list | None = None
+    data: dict | None = None
+    # Form field name -> local file path, sent as multipart
+    files: dict | None = None
+    auth: bool = True
+    # Time since the start of the recording, honoured with `preserve_timing`
+    offset_ms: float | None = None
+
+    @property
+    def endpoint(self) -> str:
+        # IDs in paths are folded so /api/documents/1/ and /2/ share a row
+        return f"{self.method} {ID_PATTERN.sub('/{id}', self.path)}"
+
+
+def load_recording(path: str) -> List[RecordedRequest]:
+    """
+    Load a recorded request stream.
+
+    :param path: JSONL file, one `RecordedRequest` per line.
+    :return: List of requests in recording order.
+    """
+    with open(path) as f:
+        return [RecordedRequest(**json.loads(line)) for line in f if line.strip()]
+
+
+def _substitute(value, variables: dict):
+    if isinstance(value, str):
+        return VARIABLE_PATTERN.sub(
+            lambda match: str(variables.get(match.group(1), match.group(0))), value
+        )
+    return value
+
+
+def load_postman_collection(
+    path: str, variables: dict | None = None, sample_file: str | None = None
+) -> List[RecordedRequest]:
+    """
+    Build a synthetic request stream from a Postman collection (v2.1),
+    flattening folders. Authentication endpoints are skipped, since tokens
+    come from the load test's token pool.
+
+    :param path: Postman collection JSON file.
+    :param variables: Values for `{{variable}}` placeholders, on top of the
+        collection's own variables.
+    :param sample_file: Local file sent for every file field of a form.
+    :return: List of requests in collection order.
+    """
+    with open(path) as f:
+        collection = json.load(f)
+    variables = {
+        **{v["key"]: v.get("value", "") for v in collection.get("variable", [])},
+        **(variables or {}),
+    }
+
+    def walk(items, inherited_auth):
+        for item in items:
+            auth = item.get("auth", {}).get("type", inherited_auth)
+            if "item" in item:
+                yield from walk(item["item"], auth)
+            else:
+                yield item["request"], item["request"].get("auth", {}).get("type", auth)
+
+    requests = []
+    collection_auth = collection.get("auth", {}).get("type", "bearer")
+    for request, auth in walk(collection["item"], collection_auth):
+        url = request["url"]
+        raw_url = _substitute(url if isinstance(url, str) else url["raw"], variables)
+        path = urlsplit(raw_url).path or "/"
+        if path.startswith("/api/auth/"):
+            continue
+        body = request.get("body") or {}
+        recorded = RecordedRequest(
+            method=request["method"], path=path, auth=auth != "noauth"
+        )
+        if body.get("mode") == "raw" and body.get("raw", "").strip():
+            recorded.json = json.loads(_substitute(body["raw"], variables))
+        elif body.get("mode") in ("formdata", "urlencoded"):
+            for entry in body.get(body["mode"], []):
+                if entry.get("disabled"):
+                    continue
+                if entry.get("type") == "file":
+                    src = sample_file or entry.get("src")
+                    if src and os.path.exists(src):
+                        recorded.files = {**(recorded.files or {}), entry["key"]: src}
+                else:
+                    recorded.data = {
+                        **(recorded.data or {}),
+                        entry["key"]: _substitute(entry.get("value", ""), variables),
+                    }
+        requests.append(recorded)
+    return requests
+
+
+class TokenPool:
+    """
+    JWT access tokens of several users, handed out round-robin so the load
+    is spread over accounts. A token rejected with 401 is refreshed once.
+    """
+
+    def __init__(self, client):
+        self.__client = client
+        self.__lock = threading.Lock()
+        self.__tokens = []
+        self.__cycle = None
+
+    def __len__(self):
+        return len(self.__tokens)
+
+    def add(self, access: str, refresh: str | None = None):
+        with self.__lock:
+            self.__tokens.append({"access": access, "refresh": refresh})
+            self.__cycle = itertools.cycle(range(len(self.__tokens)))
+
+    def login(self, username: str, password: str):
+        response = self.__client.post(
+            "/api/auth/token/", data={"username": username, "password": password}
+        )
+        response.raise_for_status()
+        self.add(response.json()["access"], response.json()["refresh"])
+
+    def signup(self, username: str, password: str):
+        response = self.__client.post(
+            "/api/auth/signup/",
+            data={
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": password,
+            },
+        )
+        response.raise_for_status()
+        self.add(response.json()["access_token"], response.json()["refresh_token"])
+
+    def acquire(self) -> tuple:
+        """
+        :return: (slot, access token), or (None, None) for an empty pool.
+        """
+        with self.__lock:
+            if not self.__tokens:
+                return None, None
+            slot = next(self.__cycle)
+            return slot, self.__tokens[slot]["access"]
+
+    def refresh(self, slot: int) -> str | None:
+        """
+        Refresh the access token of a slot.
+
+        :return: The new access token, or None if it could not be refreshed.
+        """
+        refresh = self.__tokens[slot]["refresh"]
+        if not refresh:
+            return None
+        response = self.__client.post(
+            "/api/auth/token/refresh/", data={"refresh": refresh}
+        )
+        if response.status_code != 200:
+            return None
+        with self.__lock:
+            self.__tokens[slot]["access"] = response.json()["access"]
+        return self.__tokens[slot]["access"]
+
+
+class LatencyHistogram:
+    """Fixed log-scale buckets, in milliseconds."""
+
+    BOUNDS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+
+    def add(self, latency_ms: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, latency_ms)] += 1
+
+    def render(self, width: int = 40) -> List[str]:
+        peak = max(self.counts) or 1
+        labels = [f"<= {bound} ms" for bound in self.BOUNDS]
+        labels.append(f"> {self.BOUNDS[-1]} ms")
+        return [
+            f"{label:>12} {'#' * round(width * count / peak):<{width}} {count}"
+            for label, count in zip(labels, self.counts)
+            if count
+        ]
+
+
+@dataclass
+class EndpointStats:
+    latencies_ms: List[float] = field(default_factory=list)
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    errors: Counter = field(default_factory=Counter)
+
+    def add(self, latency_ms: float, error: str | None):
+        self.latencies_ms.append(latency_ms)
+        self.histogram.add(latency_ms)
+        if error:
+            self.errors[error] += 1
+
+
+def send(client, request: RecordedRequest, token_pool: TokenPool | None = None):
+    """
+    Send a recorded request, retrying once with a refreshed token on 401.
+
+    :return: The httpx response.
+    """
+    slot, token = token_pool.acquire() if token_pool and request.auth else (None, None)
+    for attempt in range(2):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        files = None
+        if request.files:
+            files = {
+                name: (os.path.basename(path), open(path, "rb"))
+                for name, path in request.files.items()
+            }
+        try:
+            response = client.request(
+                request.method,
+                request.path,
+                json=request.json,
+                data=request.data,
+                files=files,
+                headers=headers,
+            )
+        finally:
+            for _, f in (files or {}).values():
+                f.close()
+        if response.status_code != 401 or slot is None or attempt:
+            return response
+        token = token_pool.refresh(slot)
+        if token is None:
+            return response
+    return response
+
+
+def run_load(
+    client,
+    requests: List[RecordedRequest],
+    concurrency: int = 10,
+    ramp_up_s: float = 0,
+    iterations: int = 1,
+    token_pool: TokenPool | None = None,
+    preserve_timing: bool = False,
+) -> dict:
+    """
+    Replay a request stream from `concurrency` workers.
+
+    :param client: httpx client with the target `base_url`.
+    :param requests: Requests to replay, in order.
+    :param concurrency: Number of concurrent workers.
+    :param ramp_up_s: Time over which the workers are started.
+    :param iterations: Times the stream is replayed.
+    :param token_pool: Pool of JWT access tokens for authenticated requests.
+    :param preserve_timing: Send each request at its recorded `offset_ms`.
+    :return: Dictionary with the wall time and an `EndpointStats` per endpoint.
+    """
+    pending = queue.SimpleQueue()
+    duration_ms = max((r.offset_ms or 0 for r in requests), default=0)
+    for iteration in range(iterations):
+        for request in requests:
+            pending.put((iteration * duration_ms, request))
+    stats = {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def worker(index: int):
+        time.sleep(ramp_up_s * index / max(concurrency, 1))
+        while True:
+            try:
+                base_ms, request = pending.get_nowait()
+            except queue.Empty:
+                return
+            if preserve_timing and request.offset_ms is not None:
+                delay = (base_ms + request.offset_ms) / 1000
+                time.sleep(max(0.0, started + delay - time.perf_counter()))
+            request_started = time.perf_counter()
+            error = None
+            try:
+                response = send(client, request, token_pool)
+                if response.status_code >= 400:
+                    error = str(response.status_code)
+            except Exception as e:
+                error = type(e).__name__
+            latency_ms = (time.perf_counter() - request_started) * 1000
+            with lock:
+                stats.setdefault(request.endpoint, EndpointStats()).add(
+                    latency_ms, error
+                )
+
+    threads = [
+        threading.Thread(target=worker, args=(i,), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"elapsed_s": time.perf_counter() - started, "endpoints": stats}
+
+
+def summarize_load(result: dict) -> dict:
+    """JSON-serializable summary of a `run_load` result."""
+    return {
+        endpoint: {
+            **summarize_latencies(stats.latencies_ms, result["elapsed_s"]),
+            "errors": dict(stats.errors),
+            "histogram": dict(
+                zip(
+                    [str(b) for b in LatencyHistogram.BOUNDS] + ["inf"],
+                    stats.histogram.counts,
+                )
+            ),
+        }
+        for endpoint, stats in sorted(result["endpoints"].items())
+    }
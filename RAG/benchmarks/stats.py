@@ -0,0 +1,55 @@
+import os
+import resource
+import sys
+from typing import List
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Linear-interpolated percentile of a list of values.
+
+    :param values: Samples, in any order.
+    :param percent: Percentile between 0 and 100.
+    :return: The percentile, or 0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_latencies(latencies_ms: List[float], elapsed_s: float) -> dict:
+    """
+    Throughput and latency percentiles of a benchmark phase.
+
+    :param latencies_ms: Latency of each request in milliseconds.
+    :param elapsed_s: Wall time of the whole phase in seconds.
+    :return: Dictionary of summary statistics.
+    """
+    return {
+        "requests": len(latencies_ms),
+        "throughput_rps": len(latencies_ms) / elapsed_s if elapsed_s else 0.0,
+        "p50_ms": percentile(latencies_ms, 50),
+        "p95_ms": percentile(latencies_ms, 95),
+        "p99_ms": percentile(latencies_ms, 99),
+        "max_ms": max(latencies_ms, default=0.0),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def directory_size_mb(path: str) -> float:
+    """Total size of the files under a directory in megabytes."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total / (1024 * 1024)
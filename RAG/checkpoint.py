@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    In-memory checkpointer that keeps only the latest checkpoint of each
+    thread (and the channel values it references), instead of every step
+    of every turn. Whole threads are evicted once more than `max_threads`
+    are stored, least recently used first, or after `thread_ttl` seconds
+    without being read or written. The state history of a thread is
+    therefore not available, only its current state.
+    """
+
+    def __init__(self, max_threads: int | None = None, thread_ttl: float | None = None):
+        """
+        :param max_threads: Threads kept, None keeps every thread.
+        :param thread_ttl: Seconds an idle thread is kept, None keeps it.
+        """
+        super().__init__()
+        self.max_threads = max_threads
+        self.thread_ttl = thread_ttl
+        self.__lock = threading.RLock()
+        # Keys of the blobs and writes of each thread, so pruning and
+        # evicting a thread don't scan the entries of every other thread
+        self.__blob_keys = defaultdict(set)
+        self.__write_keys = defaultdict(set)
+        self.__last_used = OrderedDict()
+
+    def get_tuple(self, config):
+        with self.__lock:
+            self.__touch(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self.__lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            self.__blob_keys[thread_id].update(
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in new_versions.items()
+            )
+            self.__prune(thread_id, checkpoint_ns, checkpoint)
+            self.__touch(thread_id)
+            self.__evict()
+        return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self.__lock:
+            checkpoints = self.storage[thread_id][checkpoint_ns]
+            if checkpoints and checkpoint_id < max(checkpoints):
+                # Writes of a checkpoint already pruned would never be read
+                return
+            super().put_writes(config, writes, task_id, task_path)
+            self.__write_keys[thread_id].add((thread_id, checkpoint_ns, checkpoint_id))
+
+    def delete_thread(self, thread_id: str):
+        with self.__lock:
+            self.storage.pop(thread_id, None)
+            for key in self.__write_keys.pop(thread_id, ()):
+                self.writes.pop(key, None)
+            for key in self.__blob_keys.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            self.__last_used.pop(thread_id, None)
+
+    def __prune(self, thread_id: str, checkpoint_ns: str, checkpoint):
+        """
+        Drops the checkpoints of a thread older than `checkpoint`, their
+        writes and the channel values it no longer references.
+        """
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if checkpoint["id"] != max(checkpoints):
+            # Saved after a newer one, its channel values are dropped later
+            del checkpoints[checkpoint["id"]]
+            return
+        for checkpoint_id in [id for id in checkpoints if id != checkpoint["id"]]:
+            del checkpoints[checkpoint_id]
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(key, None)
+            self.__write_keys[thread_id].discard(key)
+        current = {
+            (thread_id, checkpoint_ns, channel, version)
+            for channel, version in checkpoint["channel_versions"].items()
+        }
+        stale = {
+            key
+            for key in self.__blob_keys[thread_id]
+            if key[1] == checkpoint_ns and key not in current
+        }
+        for key in stale:
+            self.blobs.pop(key, None)
+        self.__blob_keys[thread_id] -= stale
+
+    def __touch(self, thread_id: str):
+        self.__last_used[thread_id] = time.monotonic()
+        self.__last_used.move_to_end(thread_id)
+
+    def __evict(self):
+        now = time.monotonic()
+        while self.__last_used:
+            thread_id, last_used = next(iter(self.__last_used.items()))
+            full = (
+                self.max_threads is not None
+                and len(self.__last_used) > self.max_threads
+            )
+            idle = self.thread_ttl is not None and now - last_used > self.thread_ttl
+            if not (full or idle):
+                break
+            self.delete_thread(thread_id)
@@ -0,0 +1,157 @@
+import re
+from enum import Enum
+from functools import partial
+from typing import List
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from .conf import get_rag_settings
+from .tokens import count_tokens
+
+
+class ChunkingStrategy(Enum):
+    # The former splitter, counted in characters
+    characters = "characters"
+    # Recursive splitting counted in model tokens
+    tokens = "tokens"
+    # Whole pages when they fit the budget, token splitting otherwise
+    pages = "pages"
+    # Sections delimited by detected headings, token splitting otherwise
+    headings = "headings"
+
+
+# Markdown headings, numbered headings ("2.1 Results") and short ALL CAPS lines
+HEADING_PATTERN = re.compile(
+    r"^(#{1,6}\s+\S.*|\d+(\.\d+)*\.?\s+[A-Z][^.]*|[A-Z][A-Z0-9 ,&:'()\-]{2,})$"
+)
+MAX_HEADING_LENGTH = 80
+
+
+def is_heading(line: str) -> bool:
+    """
+    Heuristically decide whether a line of extracted PDF text is a heading.
+
+    :param line: A single line of text.
+    :return: True if the line looks like a section heading.
+    """
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_LENGTH:
+        return False
+    return HEADING_PATTERN.match(line) is not None
+
+
+def get_text_splitter(
+    strategy: ChunkingStrategy,
+    chunk_size: int,
+    chunk_overlap: int,
+    encoding_name: str,
+):
+    """
+    Build the underlying recursive splitter for a strategy.
+
+    :param strategy: Chunking strategy in use.
+    :param chunk_size: Chunk budget, in characters for the characters
+        strategy and in tokens otherwise.
+    :param chunk_overlap: Overlap between consecutive chunks, in the same unit.
+    :param encoding_name: Tokenizer used to measure chunks.
+    :return: A configured RecursiveCharacterTextSplitter.
+    """
+    if strategy == ChunkingStrategy.characters:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=partial(count_tokens, encoding_name=encoding_name),
+    )
+
+
+def _split_sections(page: Document, heading: str | None):
+    """
+    Split a page into (heading, text) sections at detected heading lines.
+    The first section continues the heading carried over from earlier pages.
+    """
+    sections = []
+    lines = []
+    for line in page.page_content.splitlines():
+        if is_heading(line):
+            if any(l.strip() for l in lines):
+                sections.append((heading, "\n".join(lines)))
+            heading = line.strip()
+            lines = [line]
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append((heading, "\n".join(lines)))
+    return sections, heading
+
+
+def split_documents(
+    pages: List[Document],
+    strategy: ChunkingStrategy | str | None = None,
+    chunk_size: int | None = None,
+    chunk_overlap: int | None = None,
+) -> List[Document]:
+    """
+    Split document pages into chunks using the given or configured strategy.
+    The characters strategy splits exactly like the former splitter, with
+    `RAG_CHUNKING["CHARACTER_CHUNK_SIZE"]` and `["CHARACTER_CHUNK_OVERLAP"]`
+    characters; the token budget arguments don't apply to it.
+
+    :param pages: List of Document objects representing the pages.
+    :param strategy: Chunking strategy, defaults to `RAG_CHUNKING["STRATEGY"]`.
+    :param chunk_size: Chunk budget in tokens, defaults to `RAG_CHUNKING["CHUNK_SIZE"]`.
+    :param chunk_overlap: Overlap in tokens, defaults to `RAG_CHUNKING["CHUNK_OVERLAP"]`.
+    :return: List of Document chunks.
+    """
+    config = get_rag_settings("CHUNKING")
+    strategy = ChunkingStrategy(strategy or config["STRATEGY"])
+    chunk_size = chunk_size or config["CHUNK_SIZE"]
+    if chunk_overlap is None:
+        chunk_overlap = config["CHUNK_OVERLAP"]
+    encoding_name = config["TOKEN_ENCODING"]
+
+    if strategy == ChunkingStrategy.characters:
+        chunk_size = config["CHARACTER_CHUNK_SIZE"]
+        chunk_overlap = config["CHARACTER_CHUNK_OVERLAP"]
+    splitter = get_text_splitter(strategy, chunk_size, chunk_overlap, encoding_name)
+    if strategy in (ChunkingStrategy.characters, ChunkingStrategy.tokens):
+        return splitter.split_documents(pages)
+
+    def fits(text):
+        return count_tokens(text, encoding_name) <= chunk_size
+
+    chunks: List[Document] = []
+    if strategy == ChunkingStrategy.pages:
+        for page in pages:
+            if fits(page.page_content):
+                chunks.append(
+                    Document(
+                        page_content=page.page_content, metadata=dict(page.metadata)
+                    )
+                )
+            else:
+                chunks.extend(splitter.split_documents([page]))
+        return chunks
+
+    # Heading-aware: merge adjacent small sections up to the budget and
+    # only split sections that are larger than the budget on their own.
+    heading = None
+    for page in pages:
+        sections, heading = _split_sections(page, heading)
+        buffer_heading, buffer = None, []
+        for section_heading, text in sections + [(None, None)]:
+            candidate = "\n".join(buffer + [text]) if text is not None else None
+            if buffer and (candidate is None or not fits(candidate)):
+                metadata = {**page.metadata, "heading": buffer_heading or ""}
+                merged = Document(page_content="\n".join(buffer), metadata=metadata)
+                if fits(merged.page_content):
+                    chunks.append(merged)
+                else:
+                    chunks.extend(splitter.split_documents([merged]))
+                buffer_heading, buffer = None, []
+            if text is not None:
+                if not buffer:
+                    buffer_heading = section_heading
+                buffer.append(text)
+    return chunks
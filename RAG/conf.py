@@ -0,0 +1,203 @@
+from django.conf import settings
+
+# Default values for the `RAG_*` settings groups. Projects override
+# individual keys, e.g. `RAG_CHUNKING = {"STRATEGY": "pages"}`.
+DEFAULTS = {
+    "CHUNKING": {
+        # One of: "characters", "tokens", "pages", "headings"
+        "STRATEGY": "tokens",
+        # Chunk budget in tokens. The former splitter's 1000 characters were
+        # about 250 tokens, so default chunks are roughly twice as large
+        "CHUNK_SIZE": 512,
+        "CHUNK_OVERLAP": 32,
+        "TOKEN_ENCODING": "cl100k_base",
+        # Budget in characters of "characters", the former splitter
+        "CHARACTER_CHUNK_SIZE": 1000,
+        "CHARACTER_CHUNK_OVERLAP": 200,
+    },
+    "RETRIEVAL_EXPANSION": {
+        # None (disabled), "multi_query" or "hyde"; used once per turn
+        # when the first retrieval is graded irrelevant
+        "MODE": None,
+        # Number of generated query variants for "multi_query"
+        "NUM_QUERIES": 3,
+        # Number of fused chunks passed back to the grader
+        "K": 4,
+        "MAX_WORKERS": 4,
+    },
+    "RERANKING": {
+        # None (disabled), "hybrid" (vector rank combined with BM25 over the
+        # candidates) or "cross_encoder" (local ONNX cross-encoder)
+        "MODE": None,
+        # Candidates retrieved by vector similarity and reranked
+        "CANDIDATES": 50,
+        # Chunks kept per question, with or without reranking
+        "K": 4,
+        # Milliseconds a cross-encoder may spend; candidates not scored by
+        # then keep their vector rank. None waits for all of them
+        "TIMEOUT_MS": 200,
+        # Weight of the BM25 score against the vector rank ("hybrid")
+        "HYBRID_LEXICAL_WEIGHT": 0.5,
+        # Hugging Face Hub repository of the cross-encoder, or a local directory
+        "CROSS_ENCODER_MODEL": "Xenova/ms-marco-MiniLM-L-6-v2",
+        "CROSS_ENCODER_MODEL_PATH": None,
+        "CROSS_ENCODER_MODEL_FILE": "onnx/model_quantized.onnx",
+        "CROSS_ENCODER_MAX_LENGTH": 256,
+        "CROSS_ENCODER_BATCH_SIZE": 16,
+        # Batches scored in parallel; None uses the CPU count
+        "CROSS_ENCODER_THREADS": None,
+    },
+    "CONTEXT": {
+        # Maximum context tokens packed into the prompt of each node
+        "TOKEN_BUDGETS": {
+            "document_grader": 2000,
+            "responder": 3000,
+            "grade_and_answer": 3000,
+            "crawler_agent": 1500,
+        },
+        # Shingle overlap above which two chunks count as duplicates
+        "DEDUPE_THRESHOLD": 0.85,
+        # Trim chunks to the sentences sharing terms with the question
+        "TRIM_TO_RELEVANT": True,
+        "TOKEN_ENCODING": "o200k_base",
+    },
+    "HISTORY": {
+        # Questions (with their answers) kept verbatim per thread; None disables
+        "MAX_TURNS": 6,
+        # Fold older turns into a running summary instead of dropping them
+        "SUMMARIZE": True,
+        # Threads kept in process, least recently used ones evicted first
+        "MAX_THREADS": 10000,
+        # Seconds a thread without questions is kept; None keeps it
+        "THREAD_TTL": 24 * 60 * 60,
+    },
+    "BATCH": {
+        # Most questions accepted by one /api/ask/batch/ request
+        "MAX_QUESTIONS": 50,
+        # Concurrent grading calls and graph runs of a batch
+        "MAX_CONCURRENCY": 8,
+        # Chunks retrieved per question
+        "K": 4,
+    },
+    "GATEWAY": {
+        "CHAT_MODEL": "gpt-4o-mini",
+        "EMBEDDING_MODEL": "text-embedding-3-large",
+        # Split embedding inputs longer than the model's context with tiktoken,
+        # which downloads its encoding on first use; disable on offline hosts
+        "EMBEDDING_CHECK_CTX_LENGTH": True,
+        # Concurrent provider requests of the process, of which background
+        # (ingestion) requests may use at most BACKGROUND_MAX_CONCURRENCY
+        "MAX_CONCURRENCY": 16,
+        "BACKGROUND_MAX_CONCURRENCY": 4,
+        # Token bucket over all requests; None disables rate limiting
+        "RATE_LIMIT_RPS": None,
+        "RATE_LIMIT_BURST": None,
+        # Seconds a request waits for a slot or token before failing with 503/429
+        "QUEUE_TIMEOUT": 30,
+        # Retries of 408/409/429/5xx responses and connection errors, with
+        # exponential backoff and full jitter (or the provider's Retry-After)
+        "MAX_RETRIES": 3,
+        "BACKOFF_BASE": 0.5,
+        "BACKOFF_MAX": 8,
+        # Consecutive provider failures opening the circuit, and seconds
+        # until a trial request is let through
+        "BREAKER_THRESHOLD": 5,
+        "BREAKER_COOLDOWN": 30,
+        # LLM requests per user and minute; None disables quotas
+        "USER_QUOTA_PER_MINUTE": None,
+        # Keep-alive connection pool shared by all models
+        "POOL_MAX_CONNECTIONS": 32,
+        "POOL_MAX_KEEPALIVE": 16,
+        "POOL_KEEPALIVE_EXPIRY": 60,
+        "TIMEOUT": 60,
+    },
+    "VECTOR_STORE": {
+        # "embedded" opens each collection's Chroma database inside every
+        # process (development); "http" connects all processes to one
+        # Chroma server, so workers share one index in memory
+        "MODE": "embedded",
+        # Directory of embedded collections, each in a subdirectory named
+        # after it; None uses the working directory
+        "PATH": None,
+        "HOST": "localhost",
+        "PORT": 8001,
+        "SSL": False,
+        # Extra request headers, e.g. {"Authorization": "Bearer ..."}
+        "HEADERS": None,
+        "TENANT": "default_tenant",
+        "DATABASE": "default_database",
+    },
+    "HNSW": {
+        # Parameters of the vector index; None keeps Chroma's default
+        # ("l2", 16, 100, 100). SPACE ("l2", "cosine" or "ip"), M and
+        # CONSTRUCTION_EF apply when a collection is built (see
+        # `manage.py tune_vector_index --rebuild`), SEARCH_EF also to existing
+        # collections, once their index is reloaded
+        "SPACE": None,
+        "M": None,
+        "CONSTRUCTION_EF": None,
+        "SEARCH_EF": None,
+        # Parameters per collection name, e.g. {"rag_db": {"SEARCH_EF": 40}}
+        "COLLECTIONS": {},
+    },
+    "EMBEDDINGS": {
+        # "openai" (RAG_GATEWAY["EMBEDDING_MODEL"]) or "onnx" (local CPU model)
+        "BACKEND": "openai",
+        # Backend per collection name, overriding BACKEND, e.g. {"rag_db": "onnx"}
+        "COLLECTIONS": {},
+        # Hugging Face Hub repository of the ONNX model, or a local directory
+        # holding it and its tokenizer.json (for offline deployments)
+        "ONNX_MODEL": "Xenova/bge-small-en-v1.5",
+        "ONNX_MODEL_PATH": None,
+        "ONNX_MODEL_FILE": "onnx/model_quantized.onnx",
+        # "cls" or "mean", as the model was trained
+        "ONNX_POOLING": "cls",
+        "ONNX_QUERY_PREFIX": "Represent this sentence for searching relevant passages: ",
+        "ONNX_DOCUMENT_PREFIX": "",
+        "ONNX_MAX_LENGTH": 512,
+        "ONNX_BATCH_SIZE": 32,
+        # Batches embedded in parallel; None uses the CPU count
+        "ONNX_THREADS": None,
+    },
+    "SPECULATION": {
+        # Run rephrase_query and the first crawler round alongside the
+        # grader, discarding them if the context is graded relevant
+        "ENABLED": False,
+        # Also run the crawler's first tool calls (web searches) speculatively
+        "TOOLS": True,
+        # Threads running speculative branches, shared by all requests
+        "MAX_WORKERS": 8,
+    },
+    "FUSED_ANSWER": {
+        # Grade the context and answer in one LLM call, falling back to the
+        # corrective branch when the context is graded irrelevant
+        "ENABLED": False,
+        # Share of conversations (assigned by user and thread) using the
+        # fused node; the others use the two-call graph as a control group
+        "TRAFFIC_SHARE": 1.0,
+    },
+    "TOOLS": {
+        # Import path of a function returning the crawler agent's tools
+        "FACTORY": "RAG.tools.get_default_tools",
+    },
+    "INSTRUMENTATION": {
+        # Import paths of the sinks receiving per-node records, e.g.
+        # "RAG.instrumentation.PrometheusSink" or "RAG.instrumentation.DatabaseSink"
+        "SINKS": ["RAG.instrumentation.LoggingSink"],
+        # Emit records from a background thread instead of the request thread
+        "ASYNC": True,
+        # Bearer token required by /api/metrics/; the endpoint is disabled if None
+        "METRICS_TOKEN": None,
+    },
+}
+
+
+def get_rag_settings(group: str) -> dict:
+    """
+    Returns the settings of a `RAG_<group>` group merged over its defaults.
+
+    :param group: Name of the settings group, e.g. "CHUNKING".
+    :return: Dictionary of resolved settings.
+    """
+    overrides = getattr(settings, f"RAG_{group}", None) or {}
+    return {**DEFAULTS.get(group, {}), **overrides}
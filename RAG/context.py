@@ -0,0 +1,151 @@
+import re
+from typing import List
+from .tokens import count_tokens
+
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from has have how i in is it "
+    "its of on or that the this to was what when where which who why will with "
+    "you your".split()
+)
+
+
+def terms(text: str) -> set:
+    """Lowercased content words of a text, without stopwords."""
+    return {
+        word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS
+    }
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Word n-grams of a text, used to detect near-identical chunks."""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextPacker:
+    """
+    Packs retrieved chunks (or tool output) into a prompt context that fits
+    a token budget: chunks are scored against the question, near-duplicates
+    are dropped, chunks are trimmed to their relevant sentences and added in
+    score order until the budget is spent.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        encoding_name: str = "o200k_base",
+        dedupe_threshold: float = 0.85,
+        trim_to_relevant: bool = True,
+        separator: str = "\n\n",
+    ):
+        self.token_budget = token_budget
+        self.encoding_name = encoding_name
+        self.dedupe_threshold = dedupe_threshold
+        self.trim_to_relevant = trim_to_relevant
+        self.separator = separator
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.encoding_name)
+
+    def __score(self, question_terms: set, text: str, rank: int) -> float:
+        """
+        Fraction of question terms found in the text, with a small bonus
+        for earlier retrieval ranks so ties keep the vector store order.
+        """
+        overlap = len(question_terms & terms(text)) / max(len(question_terms), 1)
+        return overlap + 0.1 / (rank + 1)
+
+    def __trim(self, question_terms: set, text: str) -> str:
+        """
+        Keep sentences sharing terms with the question and their neighbours.
+        Chunks without any lexical overlap are kept whole, since they were
+        retrieved for semantic similarity.
+        """
+        sentences = [s for s in SENTENCE_PATTERN.split(text) if s.strip()]
+        relevant = [i for i, s in enumerate(sentences) if question_terms & terms(s)]
+        if not relevant:
+            return text
+        keep = sorted(
+            {j for i in relevant for j in (i - 1, i, i + 1) if 0 <= j < len(sentences)}
+        )
+        return " ".join(sentences[i].strip() for i in keep)
+
+    def __truncate(self, text: str, budget: int) -> str:
+        """Cut a text at a sentence (or word) boundary to fit the budget."""
+        kept = []
+        used = 0
+        for sentence in SENTENCE_PATTERN.split(text):
+            tokens = self.count(sentence + " ")
+            if used + tokens > budget:
+                break
+            kept.append(sentence)
+            used += tokens
+        if kept:
+            return " ".join(kept)
+        words = text.split()
+        while words and self.count(" ".join(words)) > budget:
+            words = words[: len(words) * 3 // 4]
+        return " ".join(words)
+
+    def pack(self, question: str, texts: List[str]) -> str:
+        """
+        Build a context string from ranked texts within the token budget.
+
+        :param question: The question the context should answer.
+        :param texts: Candidate chunks, ordered by retrieval rank.
+        :return: The packed context.
+        """
+        question_terms = terms(question or "")
+        ranked = sorted(
+            enumerate(texts),
+            key=lambda item: self.__score(question_terms, item[1], item[0]),
+            reverse=True,
+        )
+
+        packed = []
+        seen_shingles = []
+        used = 0
+        separator_tokens = self.count(self.separator)
+        for _, text in ranked:
+            if not text or not text.strip():
+                continue
+            text_shingles = shingles(text)
+            if any(
+                len(text_shingles & other) / len(text_shingles | other)
+                >= self.dedupe_threshold
+                for other in seen_shingles
+            ):
+                continue
+            if self.trim_to_relevant:
+                text = self.__trim(question_terms, text)
+            remaining = self.token_budget - used - (separator_tokens if packed else 0)
+            if remaining <= 0:
+                break
+            tokens = self.count(text)
+            if tokens > remaining:
+                text = self.__truncate(text, remaining)
+                tokens = self.count(text)
+                if not text:
+                    break
+            packed.append(text)
+            seen_shingles.append(text_shingles)
+            used += tokens + (separator_tokens if len(packed) > 1 else 0)
+        return self.separator.join(packed)
+
+    def pack_text(self, question: str, text: str) -> str:
+        """
+        Pack a single long text (e.g. tool output) by treating its
+        paragraphs as candidate chunks.
+
+        :param question: The question the context should answer.
+        :param text: Text to fit into the budget.
+        :return: The packed text.
+        """
+        if self.count(text) <= self.token_budget:
+            return text
+        paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+        return self.pack(question, paragraphs)
@@ -2,29 +2,51 @@ import os
 
 os.environ["USER_AGENT"] = "CRAG/1.0"
 
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 
 from enum import Enum
 from pydantic import BaseModel, Field
 from typing_extensions import TypedDict
 from typing import Literal, Annotated, List
 from langchain_core.documents import Document
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
 from langchain_core.output_parsers import StrOutputParser
-from langchain.chat_models import init_chat_model
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
-from .tools import (
-    get_web_search_tool,
-    get_news_search_tool,
-    wikipedia_tool,
-    wikidata_tool,
-    youtube_search_tool,
+from django.utils.module_loading import import_string
+from .checkpoint import BoundedMemorySaver
+from .conf import get_rag_settings
+from .context import ContextPacker
+from .embeddings import embed_queries
+from .gateway import Lane, get_gateway, user_context
+from .instrumentation import InstrumentationCallbackHandler, emit_records
+from .tokens import count_tokens
+from .retrieval import (
+    RetrievalExpansionMode,
+    build_metadata_filter,
+    reciprocal_rank_fusion,
+    search_by_vectors,
+    search_by_vectors_batched,
 )
+from .reranking import get_reranker
+from .speculation import Speculation
+from .vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
 
 
 class RAGDocumentGrade(Enum):
@@ -45,6 +67,110 @@ class RAGDocumentGraderResponse(BaseModel):
     )
 
 
+class RAGGradedAnswerResponse(BaseModel):
+    """Represents the grade of retrieved context together with the answer it supports."""
+
+    grade: RAGDocumentGrade = Field(
+        ...,
+        description="""Whether the context is relevant and sufficient to answer the question ("relevant") or not ("irrelevant")""",
+    )
+    answer: str | None = Field(
+        None,
+        description="""The answer to the question based on the context, at most three sentences. Empty when the grade is "irrelevant".""",
+    )
+    description: str | None = Field(
+        None,
+        description="""Reason for the grade, typically provided when the grade is "irrelevant". This field is optional.""",
+    )
+
+
+class AnswerMode(Enum):
+    # Grade with document_grader, then answer with responder
+    two_call = "two_call"
+    # Grade and answer in one call with grade_and_answer
+    fused = "fused"
+
+
+class RAGQueryVariantsResponse(BaseModel):
+    """Represents alternative formulations of a question used to widen retrieval."""
+
+    queries: List[str] = Field(
+        ...,
+        description="""Distinct rephrasings of the question, each targeting a different wording or aspect of it.""",
+    )
+
+
+# Prompts put the static instructions first and the question last, so
+# requests over the same context share the longest possible prefix for the
+# provider's prompt caching.
+GRADER_PROMPT = ChatPromptTemplate(
+    [
+        (
+            "system",
+            "You are an expert evaluator responsible for grading retrieved documents in a Retrieval Augmented Generation (RAG) system. Your task is to assess whether the retrieved context is relevant and useful in answering the question or not, also give a proper reason if the context in not relevant.",
+        ),
+        ("human", "context: {context}\nquestion: {question}"),
+    ]
+)
+GRADED_ANSWER_PROMPT = ChatPromptTemplate(
+    [
+        (
+            "system",
+            "You are an assistant for question-answering tasks. First grade whether the retrieved context is relevant and sufficient to answer the question. If it is, answer the question using only the context, in three sentences maximum and concise. If it is not, grade it irrelevant, leave the answer empty and give a short reason.",
+        ),
+        ("human", "Context: {context}\nQuestion: {question}"),
+    ]
+)
+QUERY_VARIANTS_PROMPT = ChatPromptTemplate(
+    [
+        (
+            "system",
+            "You are an expert in information retrieval. Generate {num_queries} different rephrasings of the user question to retrieve relevant passages from a vector database. Vary the wording and focus on different aspects of the question.",
+        ),
+        ("human", "Question: {question}"),
+    ]
+)
+HYDE_PROMPT = ChatPromptTemplate(
+    [
+        (
+            "system",
+            "You are an expert writer. Write a short passage that plausibly answers the question, as it could appear in a document. Do not mention that the passage is hypothetical.",
+        ),
+        ("human", "Question: {question}\nPassage:"),
+    ]
+)
+REPHRASE_PROMPT = ChatPromptTemplate(
+    [
+        (
+            "system",
+            "You are an expert in query optimization and search enhancement. Your task is to rephrase and improve user query to make them clearer, more specific, and better suited for retrieval in a search engine or a Retrieval Augmented Generation (RAG) system.",
+        ),
+        ("human", "Question: {question}\nRephrased Question:"),
+    ]
+)
+RESPONDER_PROMPT = ChatPromptTemplate(
+    [
+        (
+            "system",
+            "You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.",
+        ),
+        ("user", "Context: {context}\nQuestion: {question}\nAnswer:"),
+    ]
+)
+SUMMARY_PROMPT = ChatPromptTemplate(
+    [
+        (
+            "system",
+            "You maintain a concise running summary of a conversation between a user and an assistant. Extend the current summary with the new messages, keeping facts, names and open questions that could matter for follow-up questions.",
+        ),
+        (
+            "human",
+            "Current summary: {summary}\nNew messages:\n{messages}\nUpdated summary:",
+        ),
+    ]
+)
+
+
 class CRAGState(TypedDict):
     messages: Annotated[list, add_messages]
     question: str
@@ -53,39 +179,100 @@ class CRAGState(TypedDict):
     crawler_response: str
     rag_context: List[Document]
     user_id: str
+    document_ids: List[int] | None
+    retrieval_expanded: bool
+    prompt_tokens: dict
+    summary: str
+    speculated: bool
+    answer_mode: str
 
 
 class CorrectiveRAG:
 
     def __init__(self):
-        self.__memory = MemorySaver()
-        self._llm = init_chat_model(model="gpt-4o-mini", model_provider="openai")
-        self.__embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        self.__tools = [
-            get_web_search_tool(),
-            wikipedia_tool,
-            wikidata_tool,
-            youtube_search_tool,
-            get_news_search_tool(),
-        ]
-        self.__llm_with_tools = self._llm.bind_tools(self.__tools)
-        chroma_db_collection_name = "rag_db"
-        chroma_db_path = f"./{chroma_db_collection_name}"
-        self.__vector_store = Chroma(
-            collection_name=chroma_db_collection_name,
-            embedding_function=self.__embeddings,
-            persist_directory=chroma_db_path,
+        self.__history = get_rag_settings("HISTORY")
+        # Only the latest state of each thread is kept, so memory stays flat
+        # over long conversations
+        self.__memory = BoundedMemorySaver(
+            max_threads=self.__history["MAX_THREADS"],
+            thread_ttl=self.__history["THREAD_TTL"],
+        )
+        gateway = get_gateway()
+        self.__tools = import_string(get_rag_settings("TOOLS")["FACTORY"])()
+        self._llm = gateway.chat_model(Lane.interactive)
+        self.__tool_node = ToolNode(tools=self.__tools)
+        self.__vector_store = get_vector_store("rag_db", lane=Lane.interactive)
+        self.__embeddings = self.__vector_store.embeddings
+        self.__retrieval_expansion = get_rag_settings("RETRIEVAL_EXPANSION")
+        self.__reranking = get_rag_settings("RERANKING")
+        self.__reranker = get_reranker(self.__reranking)
+        context_settings = get_rag_settings("CONTEXT")
+        self.__token_encoding = context_settings["TOKEN_ENCODING"]
+        self.__context_packers = {
+            node: ContextPacker(
+                token_budget,
+                encoding_name=self.__token_encoding,
+                dedupe_threshold=context_settings["DEDUPE_THRESHOLD"],
+                trim_to_relevant=context_settings["TRIM_TO_RELEVANT"],
+            )
+            for node, token_budget in context_settings["TOKEN_BUDGETS"].items()
+        }
+        self.__batch_settings = get_rag_settings("BATCH")
+        self.__fused_answer = get_rag_settings("FUSED_ANSWER")
+        self.__speculation = get_rag_settings("SPECULATION")
+        self.__speculation_executor = (
+            ThreadPoolExecutor(
+                max_workers=self.__speculation["MAX_WORKERS"],
+                thread_name_prefix="crag-speculation",
+            )
+            if self.__speculation["ENABLED"]
+            else None
         )
         self.__graph = self.__get_graph()
+        # Batch questions are independent, so their graph keeps no threads
+        self.__batch_graph = self.__get_graph(stateless=True)
         # print(self.graph.get_graph().draw_mermaid())
 
-    def run(self, query: str, user_id: str, thread_id: str = "default"):
+    @property
+    def _llm(self):
+        return self.__chat_model
+
+    @_llm.setter
+    def _llm(self, llm):
+        """
+        Sets the chat model and compiles the model side of every node chain
+        once, instead of on every node invocation.
+        """
+        self.__chat_model = llm
+        self.__llm_with_tools = llm.bind_tools(self.__tools)
+        self.__chains = {
+            "document_grader": llm.with_structured_output(RAGDocumentGraderResponse),
+            "grade_and_answer": llm.with_structured_output(RAGGradedAnswerResponse),
+            "query_variants": llm.with_structured_output(RAGQueryVariantsResponse),
+            "text": llm | StrOutputParser(),
+        }
+
+    def run(
+        self,
+        query: str,
+        user_id: str,
+        thread_id: str = "default",
+        document_ids: List[int] | None = None,
+        answer_mode: AnswerMode | None = None,
+    ):
         """
         Public method to invoke the graph and get a final response for a given query.
+        Retrieval is limited to `document_ids` when a selection is given.
+        `answer_mode` defaults to the conversation's `RAG_FUSED_ANSWER` arm.
         """
+        answer_mode = answer_mode or self.__answer_mode(user_id, thread_id)
+        instrumentation = InstrumentationCallbackHandler(
+            thread_id=f"{user_id}#{thread_id}"
+        )
         config = {
             "configurable": {"thread_id": f"{user_id}#{thread_id}"},
             "recursion_limit": 25,
+            "callbacks": [instrumentation],
         }
 
         initial_state: CRAGState = {
@@ -93,20 +280,170 @@ class CorrectiveRAG:
                 {"role": "user", "content": query},
             ],
             "user_id": user_id,
+            "document_ids": document_ids,
+            "rag_context": [],
+            "retrieval_expanded": False,
+            "prompt_tokens": {},
+            "crawler_response": None,
+            "document_grader_response": None,
+            "speculated": False,
+            "answer_mode": answer_mode.value,
         }
 
-        events = self.__graph.stream(initial_state, config, stream_mode="values")
-
         final_message = None
-        for event in events:
-            event["messages"][-1].pretty_print()
-            final_message = event["messages"][-1]  # Last message is the result
+        final_state = {}
+        started = time.perf_counter()
+        try:
+            with user_context(user_id):
+                events = self.__graph.stream(
+                    initial_state, config, stream_mode="values"
+                )
+                for event in events:
+                    # Empty after manage_history removed every message
+                    if event["messages"]:
+                        final_message = event["messages"][-1]
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(final_message.pretty_repr())
+                    final_state = event
+        finally:
+            emit_records(instrumentation.finish())
+
+        prompt_tokens = final_state.get("prompt_tokens", {})
+        logger.info(
+            "Prompt tokens for thread %s: %d %s",
+            config["configurable"]["thread_id"],
+            sum(prompt_tokens.values()),
+            prompt_tokens,
+            extra={
+                "answer_mode": answer_mode.value,
+                "duration_ms": (time.perf_counter() - started) * 1000,
+                "prompt_tokens": sum(prompt_tokens.values()),
+            },
+        )
 
         return final_message.content if final_message else "No response"
 
-    def __get_graph(self):
+    def __answer_mode(self, user_id: str, thread_id: str) -> AnswerMode:
+        """
+        Assigns a conversation to the fused or the two-call arm, stably by
+        user and thread so all turns of a conversation use the same one.
+        """
+        if not self.__fused_answer["ENABLED"]:
+            return AnswerMode.two_call
+        digest = hashlib.sha256(f"{user_id}#{thread_id}".encode()).digest()
+        bucket = int.from_bytes(digest[:8], "big") / 2**64
+        if bucket < self.__fused_answer["TRAFFIC_SHARE"]:
+            return AnswerMode.fused
+        return AnswerMode.two_call
+
+    def run_batch(
+        self,
+        queries: List[str],
+        user_id: str,
+        document_ids: List[int] | None = None,
+        max_concurrency: int | None = None,
+    ):
+        """
+        Answers independent questions against the same documents. All
+        questions are embedded in one call, retrieved in one vector store
+        query and graded with batched LLM calls, then the graph runs for each
+        question concurrently, starting after the grading step. Embedding,
+        retrieval and grading run before this returns, so their failures
+        (e.g. provider rate limits) are raised here rather than while
+        iterating.
+
+        :param queries: Questions to answer.
+        :param user_id: ID of the user whose documents are searched.
+        :param document_ids: Selected documents to limit retrieval to.
+        :param max_concurrency: Maximum number of concurrent LLM calls and
+            graph runs, defaults to `RAG_BATCH["MAX_CONCURRENCY"]`.
+        :return: Iterator of (index, answer or exception), in completion order.
+        """
+        max_concurrency = max_concurrency or self.__batch_settings["MAX_CONCURRENCY"]
+        with user_context(user_id):
+            inputs, configs, handlers = self.__prepare_batch(
+                queries, user_id, document_ids, max_concurrency
+            )
+        return self.__answer_batch(user_id, inputs, configs, handlers)
+
+    def __prepare_batch(self, queries, user_id, document_ids, max_concurrency):
+        vectors = embed_queries(self.__embeddings, queries)
+        k = self.__batch_settings["K"]
+        contexts = search_by_vectors_batched(
+            self.__vector_store,
+            vectors,
+            k=self.__reranking["CANDIDATES"] if self.__reranker else k,
+            filter=build_metadata_filter(user_id, document_ids),
+        )
+        if self.__reranker:
+            contexts = [
+                self.__reranker.rerank(query, context, k)
+                for query, context in zip(queries, contexts)
+            ]
+        prompts = [
+            self.__grader_prompt(query, context)
+            for query, context in zip(queries, contexts)
+        ]
+        grades = self.__chains["document_grader"].batch(
+            prompts, config={"max_concurrency": max_concurrency}, return_exceptions=True
+        )
+        if grades and all(isinstance(grade, Exception) for grade in grades):
+            # The provider is down or rate limited, retrying per question
+            # in the graph would only fail again
+            raise grades[0]
+
+        inputs, configs, handlers = [], [], []
+        for query, context, prompt, grade in zip(queries, contexts, prompts, grades):
+            graded = not isinstance(grade, Exception)
+            state: CRAGState = {
+                "messages": [{"role": "user", "content": query}],
+                "question": query,
+                "user_id": user_id,
+                "document_ids": document_ids,
+                "rag_context": context,
+                "retrieval_expanded": False,
+                "prompt_tokens": {},
+                "crawler_response": None,
+                # Failed grades are retried by the graph's grader node
+                "document_grader_response": grade if graded else None,
+                "speculated": False,
+                "answer_mode": AnswerMode.two_call.value,
+            }
+            if graded:
+                state["prompt_tokens"] = self.__track_prompt_tokens(
+                    state, "document_grader", prompt
+                )
+            handler = InstrumentationCallbackHandler(thread_id=f"{user_id}#batch")
+            inputs.append(state)
+            configs.append(
+                {
+                    "recursion_limit": 25,
+                    "max_concurrency": max_concurrency,
+                    "callbacks": [handler],
+                }
+            )
+            handlers.append(handler)
+        return inputs, configs, handlers
+
+    def __answer_batch(self, user_id, inputs, configs, handlers):
+        try:
+            with user_context(user_id):
+                for index, output in self.__batch_graph.batch_as_completed(
+                    inputs, configs, return_exceptions=True
+                ):
+                    if isinstance(output, Exception):
+                        yield index, output
+                    else:
+                        yield index, output.get("answer") or "No response"
+        finally:
+            emit_records([r for handler in handlers for r in handler.finish()])
+
+    def __get_graph(self, stateless: bool = False):
         """
         Builds and compiles the LangGraph for RAG-based querying and correction.
+
+        :param stateless: Compile without the checkpointer, so runs keep no
+            conversation thread.
         """
         graph_builder = StateGraph(CRAGState)
 
@@ -114,29 +451,67 @@ class CorrectiveRAG:
         # graph_builder.add_sequence([self.__rag_retriver, self.__document_grader])
         graph_builder.add_node("rag_retriver", self.__rag_retriver)
         graph_builder.add_node("document_grader", self.__document_grader)
+        graph_builder.add_node("grade_and_answer", self.__grade_and_answer)
+        graph_builder.add_node("expand_retrieval", self.__expand_retrieval)
 
         # Conditional branches
         graph_builder.add_node("rephrase_query", self.__rephrase_query)
         graph_builder.add_node("crawler_agent", self.__crawler_agent)
         graph_builder.add_node("responder", self.__responder)
+        graph_builder.add_node("manage_history", self.__manage_history)
 
-        tool_node = ToolNode(tools=self.__tools)
-        graph_builder.add_node("tools", tool_node)
+        graph_builder.add_node("tools", self.__tool_node)
 
-        graph_builder.set_entry_point("rag_retriver")
+        # Batched runs start with their context retrieved and usually graded
+        graph_builder.set_conditional_entry_point(
+            self.__entry_route_condition,
+            path_map={
+                "rag_retriver": "rag_retriver",
+                "document_grader": "document_grader",
+                "expand_retrieval": "expand_retrieval",
+                "rephrase_query": "rephrase_query",
+                "responder": "responder",
+            },
+        )
 
         # Adding edges to the graph
-        graph_builder.add_edge("rag_retriver", "document_grader")
+        graph_builder.add_conditional_edges(
+            "rag_retriver",
+            self.__retrieval_route_condition,
+            path_map={
+                "document_grader": "document_grader",
+                "grade_and_answer": "grade_and_answer",
+            },
+        )
+
+        graph_builder.add_conditional_edges(
+            "grade_and_answer",
+            self.__grade_and_answer_route_condition,
+            path_map={
+                "manage_history": "manage_history",
+                "expand_retrieval": "expand_retrieval",
+                "rephrase_query": "rephrase_query",
+                "crawler_agent": "crawler_agent",
+                "tools": "tools",
+                "responder": "responder",
+            },
+        )
 
         graph_builder.add_conditional_edges(
             "document_grader",
             self.__document_grader_route_condition,
             path_map={
+                "expand_retrieval": "expand_retrieval",
                 "rephrase_query": "rephrase_query",
+                # Speculative runs continue where their corrective branch stopped
+                "crawler_agent": "crawler_agent",
+                "tools": "tools",
                 "responder": "responder",
             },
         )
 
+        graph_builder.add_edge("expand_retrieval", "document_grader")
+
         graph_builder.add_edge("rephrase_query", "crawler_agent")
 
         graph_builder.add_conditional_edges(
@@ -146,11 +521,37 @@ class CorrectiveRAG:
         )
 
         graph_builder.add_edge("tools", "crawler_agent")
-        graph_builder.add_edge("responder", END)
+        graph_builder.add_edge("responder", "manage_history")
+        graph_builder.add_edge("manage_history", END)
 
-        graph = graph_builder.compile(checkpointer=self.__memory)
+        graph = graph_builder.compile(checkpointer=None if stateless else self.__memory)
         return graph
 
+    def __pack_context(self, node: str, question: str, texts: List[str]) -> str:
+        """
+        Packs context chunks into the token budget configured for a node.
+        """
+        packer = self.__context_packers.get(node)
+        if packer is None:
+            return "\n\n".join(texts)
+        return packer.pack(question, texts)
+
+    def __track_prompt_tokens(self, state: CRAGState, node: str, messages) -> dict:
+        """
+        Adds the token count of a prompt sent by a node to the per-request totals.
+        """
+        if hasattr(messages, "to_messages"):
+            messages = messages.to_messages()
+        elif isinstance(messages, str):
+            messages = [HumanMessage(content=messages)]
+        tokens = sum(
+            count_tokens(str(message.content), self.__token_encoding)
+            for message in messages
+        )
+        prompt_tokens = dict(state.get("prompt_tokens") or {})
+        prompt_tokens[node] = prompt_tokens.get(node, 0) + tokens
+        return prompt_tokens
+
     def __rag_retriver(self, state: CRAGState):
         """
         Retrieves relevant documents from the vector store based on last user message.
@@ -166,9 +567,17 @@ class CorrectiveRAG:
                 break
         if last_user_message is None:
             raise Exception("No user message found in the conversation.")
+        k = self.__reranking["K"]
         retrieved_docs = self.__vector_store.similarity_search(
-            query=last_user_message, filter={"user_id": user_id}
+            query=last_user_message,
+            k=self.__reranking["CANDIDATES"] if self.__reranker else k,
+            filter=build_metadata_filter(user_id, state.get("document_ids")),
         )
+        if self.__reranker:
+            # A wide candidate set, narrowed to the best few chunks
+            retrieved_docs = self.__reranker.rerank(
+                last_user_message, retrieved_docs, k
+            )
         context = "\n\n".join(doc.page_content for doc in retrieved_docs)
 
         new_state = CRAGState(**state)
@@ -177,32 +586,200 @@ class CorrectiveRAG:
         new_state["messages"] = [{"content": context, "role": "ai"}]
         return new_state
 
-    def __document_grader(self, state: CRAGState):
+    def __grader_prompt(self, question: str, context: List[Document]):
         """
-        Uses LLM to assess whether retrieved context is relevant to the question or not.
+        Builds the prompt asking the LLM to grade retrieved context.
         """
-        question = state.get("question")
-        context = state.get("rag_context", [])
-        docs_content = "\n\n".join(doc.page_content for doc in context)
-
-        grader_llm = self._llm.with_structured_output(RAGDocumentGraderResponse)
-        grader_prompt_template = ChatPromptTemplate(
-            [
-                (
-                    "system",
-                    "You are an expert evaluator responsible for grading retrieved documents in a Retrieval Augmented Generation (RAG) system. Your task is to assess whether the retrieved context is relevant and useful in answering the question or not, also give a proper reason if the context in not relevant.",
-                ),
-                ("human", "question: {question}\ncontext: {context}"),
-            ]
+        docs_content = self.__pack_context(
+            "document_grader", question, [doc.page_content for doc in context]
         )
-        chain = grader_prompt_template | grader_llm
-        grader_response = chain.invoke({"question": question, "context": docs_content})
+        return GRADER_PROMPT.invoke({"question": question, "context": docs_content})
+
+    def __document_grader(self, state: CRAGState, config: RunnableConfig = None):
+        """
+        Uses LLM to assess whether retrieved context is relevant to the question or not.
+        With speculation enabled, the corrective branch starts alongside the
+        grading and is used if the context is graded irrelevant.
+        """
+        speculation = self.__start_speculation(state, config)
+        try:
+            question = state.get("question")
+            prompt = self.__grader_prompt(question, state.get("rag_context", []))
+            grader_response = self.__chains["document_grader"].invoke(prompt)
+        except BaseException:
+            if speculation is not None:
+                speculation.cancel()
+            raise
 
         new_state = CRAGState(**state)
         new_state["document_grader_response"] = grader_response
+        new_state["prompt_tokens"] = self.__track_prompt_tokens(
+            state, "document_grader", prompt
+        )
         new_state["messages"] = [
             {"content": grader_response.model_dump_json(), "role": "ai"}
         ]
+        return self.__resolve_speculation(speculation, new_state)
+
+    def __grade_and_answer(self, state: CRAGState, config: RunnableConfig = None):
+        """
+        Grades the retrieved context and answers from it in a single LLM call.
+        Irrelevant context continues on the corrective branch like a grade
+        of document_grader.
+        """
+        speculation = self.__start_speculation(state, config)
+        try:
+            question = state.get("question")
+            context = self.__pack_context(
+                "grade_and_answer",
+                question,
+                [doc.page_content for doc in state.get("rag_context", [])],
+            )
+            prompt = GRADED_ANSWER_PROMPT.invoke(
+                {"question": question, "context": context}
+            )
+            response = self.__chains["grade_and_answer"].invoke(prompt)
+        except BaseException:
+            if speculation is not None:
+                speculation.cancel()
+            raise
+
+        new_state = CRAGState(**state)
+        new_state["document_grader_response"] = RAGDocumentGraderResponse(
+            grade=response.grade, description=response.description
+        )
+        new_state["prompt_tokens"] = self.__track_prompt_tokens(
+            state, "grade_and_answer", prompt
+        )
+        if response.grade == RAGDocumentGrade.relevant and response.answer:
+            new_state["answer"] = response.answer
+            new_state["messages"] = [
+                {"content": response.answer, "role": "assistant", "name": "responder"}
+            ]
+        else:
+            new_state["answer"] = None
+            new_state["messages"] = [
+                {
+                    "content": new_state["document_grader_response"].model_dump_json(),
+                    "role": "ai",
+                }
+            ]
+        return self.__resolve_speculation(speculation, new_state)
+
+    def __start_speculation(self, state: CRAGState, config) -> Speculation | None:
+        """
+        Starts the corrective branch ahead of grading, when enabled.
+        """
+        if not self.__should_speculate(state):
+            return None
+        return Speculation(
+            self.__speculation_executor,
+            lambda checkpoint: self.__speculate(state, checkpoint),
+            user_id=state.get("user_id"),
+            parent_config=config,
+        )
+
+    def __resolve_speculation(
+        self, speculation: Speculation | None, new_state: CRAGState
+    ) -> CRAGState:
+        """
+        Merges the speculative branch into the graded state if the grade
+        leads to it, and discards it otherwise.
+        """
+        if speculation is None:
+            return new_state
+        if self.__document_grader_route_condition(new_state) != "rephrase_query":
+            speculation.cancel()
+            return new_state
+
+        branch = speculation.result()
+        new_state["question"] = branch["question"]
+        new_state["crawler_response"] = branch["crawler_response"]
+        new_state["messages"] += branch["messages"]
+        new_state["prompt_tokens"] = {
+            node: new_state["prompt_tokens"].get(node, 0)
+            + branch["prompt_tokens"].get(node, 0)
+            for node in new_state["prompt_tokens"].keys() | branch["prompt_tokens"]
+        }
+        new_state["speculated"] = True
+        return new_state
+
+    def __should_speculate(self, state: CRAGState) -> bool:
+        """
+        Speculates when an irrelevant grade would lead to rephrase_query,
+        i.e. not when retrieval expansion would be tried first.
+        """
+        if self.__speculation_executor is None:
+            return False
+        return not (
+            self.__retrieval_expansion["MODE"] and not state.get("retrieval_expanded")
+        )
+
+    def __speculate(self, state: CRAGState, checkpoint) -> dict:
+        """
+        Runs rephrase_query and the first crawler round (with its tool calls,
+        if enabled) for the case that the context is graded irrelevant.
+
+        :param state: State the grader node received.
+        :param checkpoint: Stops the branch once it is discarded.
+        :return: State updates of the branch.
+        """
+        state = CRAGState(**{**state, "prompt_tokens": {}})
+        checkpoint()
+        rephrased = self.__rephrase_query(state)
+        checkpoint()
+        crawled = self.__crawler_agent(rephrased)
+        messages = rephrased["messages"] + crawled["messages"]
+        response = crawled["messages"][-1]
+        if self.__speculation["TOOLS"] and getattr(response, "tool_calls", None):
+            checkpoint()
+            messages += self.__tool_node.invoke({"messages": [response]})["messages"]
+        checkpoint()
+        return {
+            "question": rephrased["question"],
+            "crawler_response": crawled["crawler_response"],
+            "prompt_tokens": crawled["prompt_tokens"],
+            "messages": messages,
+        }
+
+    def __expand_retrieval(self, state: CRAGState):
+        """
+        Retries internal retrieval with LLM-generated query variants (multi-query)
+        or a hypothetical answer (HyDE), fusing the results before grading again.
+        All queries are embedded in one call and searched concurrently.
+        """
+        question = state.get("question")
+        mode = RetrievalExpansionMode(self.__retrieval_expansion["MODE"])
+        if mode == RetrievalExpansionMode.multi_query:
+            num_queries = self.__retrieval_expansion["NUM_QUERIES"]
+            prompt = QUERY_VARIANTS_PROMPT.invoke(
+                {"question": question, "num_queries": num_queries}
+            )
+            response = self.__chains["query_variants"].invoke(prompt)
+            queries = [question] + response.queries[:num_queries]
+        else:
+            prompt = HYDE_PROMPT.invoke({"question": question})
+            queries = [question, self.__chains["text"].invoke(prompt)]
+
+        vectors = embed_queries(self.__embeddings, queries)
+        results = search_by_vectors(
+            self.__vector_store,
+            vectors,
+            k=self.__retrieval_expansion["K"],
+            filter=build_metadata_filter(
+                state.get("user_id", "anon"), state.get("document_ids")
+            ),
+            max_workers=self.__retrieval_expansion["MAX_WORKERS"],
+        )
+        retrieved_docs = reciprocal_rank_fusion(
+            results, limit=self.__retrieval_expansion["K"]
+        )
+        context = "\n\n".join(doc.page_content for doc in retrieved_docs)
+
+        new_state = CRAGState(**state)
+        new_state["rag_context"] = retrieved_docs
+        new_state["retrieval_expanded"] = True
+        new_state["messages"] = [{"content": context, "role": "ai"}]
         return new_state
 
     def __rephrase_query(self, state: CRAGState):
@@ -210,20 +787,14 @@ class CorrectiveRAG:
         Rephrases the original query to improve search and retrieval accuracy.
         """
         question = state.get("question")
-        prompt_template = ChatPromptTemplate(
-            [
-                (
-                    "system",
-                    "You are an expert in query optimization and search enhancement. Your task is to rephrase and improve user query to make them clearer, more specific, and better suited for retrieval in a search engine or a Retrieval Augmented Generation (RAG) system.",
-                ),
-                ("human", "Question: {question}\nRephrased Question:"),
-            ]
-        )
-        chain = prompt_template | self._llm | StrOutputParser()
-        rephrased_question = chain.invoke({"question": question})
+        prompt = REPHRASE_PROMPT.invoke({"question": question})
+        rephrased_question = self.__chains["text"].invoke(prompt)
 
         new_state = CRAGState(**state)
         new_state["question"] = rephrased_question
+        new_state["prompt_tokens"] = self.__track_prompt_tokens(
+            state, "rephrase_query", prompt
+        )
         new_state["messages"] = [{"content": rephrased_question, "role": "ai"}]
         return new_state
 
@@ -234,12 +805,38 @@ class CorrectiveRAG:
         if state.get("crawler_response", None) is None:
             llm_input = state.get("question")
         else:
-            llm_input = state.get("messages", [])
+            # Tool outputs can be arbitrarily long, so they are packed into
+            # the crawler budget before being sent back to the LLM
+            packer = self.__context_packers.get("crawler_agent")
+            llm_input = [
+                (
+                    message.model_copy(
+                        update={
+                            "content": packer.pack_text(
+                                state.get("question"), str(message.content)
+                            )
+                        }
+                    )
+                    if packer is not None and isinstance(message, ToolMessage)
+                    else message
+                )
+                for message in state.get("messages", [])
+            ]
+            if state.get("summary"):
+                llm_input.insert(
+                    0,
+                    SystemMessage(
+                        content=f"Summary of the earlier conversation: {state['summary']}"
+                    ),
+                )
 
         response = self.__llm_with_tools.invoke(llm_input)
 
         new_state = CRAGState(**state)
         new_state["crawler_response"] = response.content
+        new_state["prompt_tokens"] = self.__track_prompt_tokens(
+            state, "crawler_agent", llm_input
+        )
         new_state["messages"] = [response]
         return new_state
 
@@ -253,46 +850,165 @@ class CorrectiveRAG:
         document_grader_response = state.get("document_grader_response", None)
         if (
             document_grader_response is None
-            or document_grader_response.grade == "relevant"
+            or document_grader_response.grade == RAGDocumentGrade.relevant
         ):
             should_consider_rag_context = True
         if should_consider_rag_context:
             context = state.get("rag_context", [])
-            docs_content = "\n\n".join(doc.page_content for doc in context)
-            final_context = docs_content
+            final_context = self.__pack_context(
+                "responder", question, [doc.page_content for doc in context]
+            )
         else:
-            final_context = state.get("crawler_response", "No Context Found")
+            final_context = self.__pack_context(
+                "responder",
+                question,
+                [state.get("crawler_response") or "No Context Found"],
+            )
 
-        prompt_template = ChatPromptTemplate(
-            [
-                (
-                    "system",
-                    "You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.",
-                ),
-                ("user", "Question: {question}\nContext: {context}\nAnswer:"),
-            ]
+        prompt = RESPONDER_PROMPT.invoke(
+            {"question": question, "context": final_context}
         )
-        chain = prompt_template | self._llm | StrOutputParser()
-        answer = chain.invoke({"question": question, "context": final_context})
+        answer = self.__chains["text"].invoke(prompt)
 
         new_state = CRAGState(**state)
         new_state["answer"] = answer
-        new_state["messages"] = [{"content": answer, "role": "assistant"}]
+        new_state["prompt_tokens"] = self.__track_prompt_tokens(
+            state, "responder", prompt
+        )
+        new_state["messages"] = [
+            {"content": answer, "role": "assistant", "name": "responder"}
+        ]
+        return new_state
+
+    def __is_conversation_turn(self, message) -> bool:
+        """
+        Checks if a message is a user question or a final answer, as opposed
+        to intermediate messages (context, grades, tool calls and outputs).
+        """
+        if isinstance(message, HumanMessage):
+            return True
+        return isinstance(message, AIMessage) and message.name == "responder"
+
+    def __summarize_turns(self, state: CRAGState, messages: list):
+        """
+        Folds old conversation turns into the running summary of the thread.
+        """
+        prompt = SUMMARY_PROMPT.invoke(
+            {
+                "summary": state.get("summary") or "None",
+                "messages": "\n".join(
+                    f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+                    for m in messages
+                ),
+            }
+        )
+        summary = self.__chains["text"].invoke(prompt)
+        return summary, self.__track_prompt_tokens(state, "manage_history", prompt)
+
+    def __manage_history(self, state: CRAGState):
+        """
+        Keeps the stored thread small: drops intermediate messages of the turn,
+        folds turns beyond the configured window into a running summary and
+        clears per-turn scratch state.
+        """
+        messages = state.get("messages", [])
+        removals = [
+            RemoveMessage(id=message.id)
+            for message in messages
+            if not self.__is_conversation_turn(message)
+        ]
+        turns = [
+            message for message in messages if self.__is_conversation_turn(message)
+        ]
+
+        new_state = CRAGState(**state)
+        max_turns = self.__history["MAX_TURNS"]
+        questions = [i for i, m in enumerate(turns) if isinstance(m, HumanMessage)]
+        if max_turns and len(questions) > max_turns:
+            # Folding half a window at once so summarization runs every few turns
+            keep_from = questions[-max(max_turns // 2, 1)]
+            old_turns = turns[:keep_from]
+            if self.__history["SUMMARIZE"]:
+                summary, prompt_tokens = self.__summarize_turns(state, old_turns)
+                new_state["summary"] = summary
+                new_state["prompt_tokens"] = prompt_tokens
+            removals += [RemoveMessage(id=message.id) for message in old_turns]
+
+        new_state["messages"] = removals
+        new_state["rag_context"] = []
+        new_state["crawler_response"] = None
+        new_state["document_grader_response"] = None
+        new_state["speculated"] = False
         return new_state
 
+    def __retrieval_route_condition(
+        self, state: CRAGState
+    ) -> Literal["document_grader", "grade_and_answer"]:
+        """
+        Grades retrieved context with the conversation's answer mode.
+        """
+        if state.get("answer_mode") == AnswerMode.fused.value:
+            return "grade_and_answer"
+        return "document_grader"
+
+    def __grade_and_answer_route_condition(self, state: CRAGState) -> Literal[
+        "manage_history",
+        "expand_retrieval",
+        "rephrase_query",
+        "crawler_agent",
+        "tools",
+        "responder",
+    ]:
+        """
+        Finishes the turn if grade_and_answer answered, otherwise routes like
+        after document_grader.
+        """
+        if state.get("answer") and not state.get("speculated"):
+            return "manage_history"
+        return self.__document_grader_route_condition(state)
+
+    def __entry_route_condition(self, state: CRAGState) -> Literal[
+        "rag_retriver",
+        "document_grader",
+        "expand_retrieval",
+        "rephrase_query",
+        "responder",
+    ]:
+        """
+        Starts at retrieval, unless the input already carries retrieved
+        context (graded or not), as batched runs do.
+        """
+        if not state.get("rag_context"):
+            return "rag_retriver"
+        if state.get("document_grader_response") is None:
+            return "document_grader"
+        return self.__document_grader_route_condition(state)
+
     def __document_grader_route_condition(
         self, state: CRAGState
-    ) -> Literal["rephrase_query", "responder"]:
+    ) -> Literal[
+        "expand_retrieval", "rephrase_query", "crawler_agent", "tools", "responder"
+    ]:
         """
-        Branches to either responder (if context is relevant)
-        or rephrase_query (if context is not relevant).
+        Branches to either responder (if context is relevant),
+        expand_retrieval (if context is not relevant and retrieval expansion
+        is enabled but not yet tried) or rephrase_query (otherwise). After a
+        speculative corrective branch was used, continues after its last step.
         """
         document_grader_response = state.get("document_grader_response", None)
         if (
             document_grader_response is None
-            or document_grader_response.grade == "relevant"
+            or document_grader_response.grade == RAGDocumentGrade.relevant
         ):
             return "responder"
+        if state.get("speculated"):
+            if isinstance(state["messages"][-1], ToolMessage):
+                return "crawler_agent"
+            return self.__custom_tools_condition(state)
+        if self.__retrieval_expansion["MODE"] and not state.get(
+            "retrieval_expanded", False
+        ):
+            return "expand_retrieval"
         return "rephrase_query"
 
     def __custom_tools_condition(
@@ -314,3 +1030,20 @@ class CorrectiveRAG:
         if hasattr(ai_message, "tool_calls") and len(ai_message.tool_calls) > 0:
             return "tools"
         return "responder"
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_corrective_rag() -> CorrectiveRAG:
+    """
+    Returns the process-wide CorrectiveRAG engine, so that conversation
+    threads stored in its checkpointer persist across requests.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = CorrectiveRAG()
+    return _engine
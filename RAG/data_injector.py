@@ -1,11 +1,31 @@
-from typing import List
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+import contextlib
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, List
+from pydantic import PrivateAttr
 from langchain_core.documents import Document
-from langchain.chat_models import init_chat_model
+from langchain_core.documents.base import Blob
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders.parsers import PyPDFParser
+from .chunking import split_documents
+from .gateway import Lane
+from .vector_store import get_vector_store
+
+# Non-seekable streams (e.g. object storage downloads) are spooled before
+# parsing, in memory up to this size and on disk past it
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+
+
+class _StreamBlob(Blob):
+    """Blob parsed straight from an open binary stream."""
+
+    _stream: Any = PrivateAttr(default=None)
+
+    @contextlib.contextmanager
+    def as_bytes_io(self):
+        yield self._stream
 
 
 class DataInjector:
@@ -15,70 +35,173 @@ class DataInjector:
     """
 
     def __init__(self, chroma_db_collection_name="rag_db"):
-        self.__embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        chroma_db_path = f"./{chroma_db_collection_name}"
-        self.__vector_store = Chroma(
-            collection_name=chroma_db_collection_name,
-            embedding_function=self.__embeddings,
-            persist_directory=chroma_db_path,
+        # Ingestion is bulk work, so it yields to interactive requests
+        self.__vector_store = get_vector_store(
+            chroma_db_collection_name, lane=Lane.background
         )
 
-    def __data_extracter(self, file_path):
+    def __data_extracter(self, source):
         """
         Extract pages from a PDF file.
 
-        :param file_path: Path to the PDF file to be loaded.
+        :param source: Path to the PDF file to be loaded, or a binary file
+            object (such as an opened storage file) read as a stream.
         :return: List of documents representing the pages in the PDF.
         """
-        loader = PyPDFLoader(file_path)
-        pages: List[Document] = []
-        for page in loader.lazy_load():
-            pages.append(page)
-        return pages
+        if isinstance(source, (str, os.PathLike)):
+            loader = PyPDFLoader(source)
+            pages: List[Document] = []
+            for page in loader.lazy_load():
+                pages.append(page)
+            return pages
+
+        with contextlib.ExitStack() as stack:
+            stream = source
+            if not source.seekable():
+                stream = stack.enter_context(
+                    tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+                )
+                shutil.copyfileobj(source, stream)
+                stream.seek(0)
+            blob = _StreamBlob(path=getattr(source, "name", None) or "stream.pdf")
+            blob._stream = stream
+            return list(PyPDFParser().lazy_parse(blob))
 
-    def __split_text(self, pages: List, chunk_size=1000, chunk_overlap=200):
+    def __split_text(
+        self, pages: List, strategy=None, chunk_size=None, chunk_overlap=None
+    ):
         """
         Split the given document pages into smaller chunks for easier processing.
 
         :param pages: List of Document objects representing the pages.
-        :param chunk_size: Maximum size of each chunk.
-        :param chunk_overlap: Overlap between consecutive chunks.
+        :param strategy: Chunking strategy, defaults to the configured one.
+        :param chunk_size: Chunk budget in tokens.
+        :param chunk_overlap: Overlap between consecutive chunks in tokens.
         :return: List of Document chunks.
         """
-        recursive_text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        return split_documents(
+            pages,
+            strategy=strategy,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
         )
-        # Splitting the pages into chunks
-        splits = recursive_text_splitter.split_documents(pages)
-        return splits
 
-    def __add_documents_to_db(self, docs: List[Document], user_id: str):
+    def __add_documents_to_db(
+        self, docs: List[Document], user_id: str, document_id: int | None = None
+    ):
         """
         Add documents to the vector store.
 
         :param docs: List of Document objects to be added.
         :param user_id: ID of the user to associate with the documents.
+        :param document_id: ID of the source `api.Document` of the chunks.
         :return: List of document IDs assigned by the vector store.
         """
 
-        # Injecting user_id into metadata
+        # Injecting user_id and document_id into metadata
         for doc in docs:
             if doc.metadata is None:
                 doc.metadata = {}
-            doc.metadata["user_id"] = user_id
+            doc.metadata["user_id"] = str(user_id)
+            if document_id is not None:
+                doc.metadata["document_id"] = document_id
 
         document_ids = self.__vector_store.add_documents(documents=docs)
         return document_ids
 
-    def add_document(self, file_path: str, user_id: str):
+    def add_document(
+        self,
+        source: str | BinaryIO,
+        user_id: str,
+        document_id: int | None = None,
+        chunking_strategy=None,
+    ):
         """
         Add a new document to the vector store by extracting and processing it.
 
-        :param file_path: Path to the PDF file to be added.
+        :param source: Path to the PDF file to be added, or a binary file
+            object, so documents can come from any storage backend.
+        :param user_id: ID of the user to associate with the documents.
+        :param document_id: ID of the `api.Document`, used to scope retrieval.
+        :param chunking_strategy: Chunking strategy to use instead of the configured one.
+        :return: List of chunk IDs assigned by the vector store.
+        """
+        pages = self.__data_extracter(source)
+        return self.add_pages(pages, user_id, document_id, chunking_strategy)
+
+    def add_pages(
+        self,
+        pages: List[Document],
+        user_id: str,
+        document_id: int | None = None,
+        chunking_strategy=None,
+    ):
         """
-        pages = self.__data_extracter(file_path)
-        splits = self.__split_text(pages)
-        self.__add_documents_to_db(splits, user_id)
+        Add already extracted pages to the vector store.
+
+        :param pages: List of Document objects representing the pages.
+        :param user_id: ID of the user to associate with the documents.
+        :param document_id: ID of the `api.Document`, used to scope retrieval.
+        :param chunking_strategy: Chunking strategy to use instead of the configured one.
+        :return: List of chunk IDs assigned by the vector store.
+        """
+        splits = self.__split_text(pages, strategy=chunking_strategy)
+        return self.__add_documents_to_db(splits, user_id, document_id)
+
+    @property
+    def vector_store(self):
+        return self.__vector_store
+
+    def has_document(self, document_id: int) -> bool:
+        """
+        Check whether chunks of a document are already in the vector store.
+
+        :param document_id: ID of the `api.Document`.
+        :return: True if at least one chunk is stored for the document.
+        """
+        result = self.__vector_store.get(where={"document_id": document_id}, limit=1)
+        return len(result["ids"]) > 0
+
+    def adopt_legacy_chunks(self, source: str, user_id: str, document_id: int) -> int:
+        """
+        Tag the chunks a user's file was indexed into before `document_id`
+        metadata existed with the document's ID, so they are scoped like
+        new chunks instead of being embedded (and retrieved) twice.
+
+        :param source: Path the file was loaded from, recorded as `source`.
+        :param user_id: ID of the user the chunks were added for.
+        :param document_id: ID of the `api.Document` stored in the file.
+        :return: Number of chunks tagged.
+        """
+        # Legacy chunks recorded the user ID as a string on upload and as an
+        # integer on selection
+        owners = [{"user_id": str(user_id)}]
+        if str(user_id).isdigit():
+            owners.append({"user_id": int(user_id)})
+        owner = owners[0] if len(owners) == 1 else {"$or": owners}
+        result = self.__vector_store.get(
+            where={"$and": [{"source": source}, owner]}, include=["metadatas"]
+        )
+        # Chroma cannot filter on a missing key, so chunks that already have a
+        # document_id are skipped here
+        legacy = [
+            (chunk_id, metadata)
+            for chunk_id, metadata in zip(result["ids"], result["metadatas"])
+            if "document_id" not in (metadata or {})
+        ]
+        if legacy:
+            self.__vector_store._collection.update(
+                ids=[chunk_id for chunk_id, _ in legacy],
+                metadatas=[
+                    {
+                        **(metadata or {}),
+                        "user_id": str(user_id),
+                        "document_id": document_id,
+                    }
+                    for _, metadata in legacy
+                ],
+            )
+        return len(legacy)
 
     def clear_vectors(self):
         """
@@ -0,0 +1,262 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from django.core.exceptions import ImproperlyConfigured
+from langchain_core.embeddings import Embeddings
+from .conf import get_rag_settings
+from .gateway import Lane, get_gateway
+
+
+class EmbeddingBackend:
+    # OpenAI embeddings through the LLM gateway (RAG_GATEWAY["EMBEDDING_MODEL"])
+    openai = "openai"
+    # Local CPU inference of an ONNX sentence embedding model
+    onnx = "onnx"
+
+
+def load_onnx_session(model_path: str, model_file: str):
+    """
+    Loads an ONNX model for single-threaded CPU inference; callers get
+    their parallelism from running batches concurrently.
+    """
+    try:
+        import onnxruntime
+    except ImportError:
+        raise ImproperlyConfigured(
+            "Local ONNX models require onnxruntime, "
+            "install it with `pip install onnxruntime tokenizers`."
+        )
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = 1
+    return onnxruntime.InferenceSession(
+        os.path.join(model_path, model_file),
+        sess_options=options,
+        providers=["CPUExecutionProvider"],
+    )
+
+
+def load_tokenizer(model_path: str, max_length: int, tokenizer=None):
+    """
+    Loads the `tokenizer.json` of a model (unless given a tokenizer) and
+    sets it up to truncate to `max_length` and pad each batch to its
+    longest text (dynamic padding).
+    """
+    if tokenizer is None:
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImproperlyConfigured(
+                "Local ONNX models require tokenizers, "
+                "install it with `pip install onnxruntime tokenizers`."
+            )
+        tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+    tokenizer.enable_truncation(max_length=max_length)
+    tokenizer.enable_padding(
+        pad_id=tokenizer.padding["pad_id"] if tokenizer.padding else 0,
+        pad_token=tokenizer.padding["pad_token"] if tokenizer.padding else "[PAD]",
+    )
+    return tokenizer
+
+
+def encode_inputs(tokenizer, input_names: set, texts: list) -> dict:
+    """
+    Tokenizes a batch of texts (or text pairs) into the model inputs named
+    in `input_names`.
+    """
+    import numpy as np
+
+    encodings = tokenizer.encode_batch(texts)
+    inputs = {
+        "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+        "attention_mask": np.array(
+            [e.attention_mask for e in encodings], dtype=np.int64
+        ),
+        "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+    }
+    return {name: value for name, value in inputs.items() if name in input_names}
+
+
+def download_model(repo_id: str, model_file: str) -> str:
+    """
+    Fetches a model and its tokenizer from the Hugging Face Hub on first use
+    (or its local cache, e.g. with `HF_HUB_OFFLINE=1`).
+
+    :return: Local directory of the model.
+    """
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(repo_id=repo_id, allow_patterns=[model_file, "*.json"])
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed on the CPU with ONNX Runtime. Texts are
+    sorted by length and embedded in batches padded to their longest text
+    (dynamic padding); batches run in parallel on a thread pool, since
+    ONNX Runtime releases the GIL while running a model.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        model_file: str = "onnx/model_quantized.onnx",
+        pooling: str = "cls",
+        query_prefix: str = "",
+        document_prefix: str = "",
+        max_length: int = 512,
+        batch_size: int = 32,
+        threads: int | None = None,
+        normalize: bool = True,
+        session=None,
+        tokenizer=None,
+    ):
+        """
+        :param model_path: Directory holding the model and its `tokenizer.json`.
+        :param model_file: Path of the ONNX model within `model_path`.
+        :param pooling: "cls" (first token) or "mean" (masked mean of tokens).
+        :param query_prefix: Instruction prepended to queries, as some models
+            (e.g. BGE, E5) expect.
+        :param document_prefix: Instruction prepended to documents.
+        :param max_length: Tokens per text, longer texts are truncated.
+        :param batch_size: Texts per model run.
+        :param threads: Batches run in parallel, defaults to the CPU count.
+        :param normalize: L2-normalize the embeddings.
+        :param session: ONNX Runtime session, loaded from `model_path` if None.
+        :param tokenizer: `tokenizers.Tokenizer`, loaded from `model_path` if None.
+        """
+        self.pooling = pooling
+        self.query_prefix = query_prefix
+        self.document_prefix = document_prefix
+        self.batch_size = batch_size
+        self.normalize = normalize
+        threads = threads or os.cpu_count() or 1
+        self.__session = session or load_onnx_session(model_path, model_file)
+        self.__tokenizer = load_tokenizer(model_path, max_length, tokenizer)
+        self.__input_names = {
+            model_input.name for model_input in self.__session.get_inputs()
+        }
+        self.__executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="onnx-embeddings"
+        )
+
+    def __embed_batch(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        inputs = encode_inputs(self.__tokenizer, self.__input_names, texts)
+        output = self.__session.run(None, inputs)[0]
+        if output.ndim == 3:
+            if self.pooling == "mean":
+                mask = inputs["attention_mask"][:, :, None].astype(output.dtype)
+                output = (output * mask).sum(axis=1) / np.maximum(
+                    mask.sum(axis=1), 1e-9
+                )
+            else:
+                output = output[:, 0]
+        if self.normalize:
+            output = output / np.maximum(
+                np.linalg.norm(output, axis=1, keepdims=True), 1e-12
+            )
+        return output.tolist()
+
+    def __embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Batching texts of similar length keeps padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [
+            [texts[i] for i in order[start : start + self.batch_size]]
+            for start in range(0, len(order), self.batch_size)
+        ]
+        if len(batches) == 1:
+            results = [self.__embed_batch(batches[0])]
+        else:
+            results = self.__executor.map(self.__embed_batch, batches)
+        vectors = [vector for batch in results for vector in batch]
+        embeddings = [None] * len(texts)
+        for index, vector in zip(order, vectors):
+            embeddings[index] = vector
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.__embed([self.document_prefix + text for text in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.__embed_batch([self.query_prefix + text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.__embed([self.query_prefix + text for text in texts])
+
+
+def embed_queries(embeddings: Embeddings, queries: List[str]) -> List[List[float]]:
+    """
+    Embeds several queries in one call. Remote embeddings treat queries and
+    documents alike, but local models may prefix queries with an instruction.
+    """
+    if isinstance(embeddings, OnnxEmbeddings):
+        return embeddings.embed_queries(queries)
+    return embeddings.embed_documents(queries)
+
+
+def get_embedding_backend(collection_name: str) -> str:
+    """
+    :param collection_name: Name of the vector store collection.
+    :return: The embedding backend configured for the collection.
+    """
+    options = get_rag_settings("EMBEDDINGS")
+    return options["COLLECTIONS"].get(collection_name, options["BACKEND"])
+
+
+def embedding_model_name(backend: str) -> str:
+    """
+    Identifies the model of a backend, as recorded in collection metadata.
+    """
+    if backend == EmbeddingBackend.openai:
+        return f"openai:{get_rag_settings('GATEWAY')['EMBEDDING_MODEL']}"
+    if backend == EmbeddingBackend.onnx:
+        options = get_rag_settings("EMBEDDINGS")
+        model = options["ONNX_MODEL_PATH"] or options["ONNX_MODEL"]
+        return f"onnx:{model}:{options['ONNX_MODEL_FILE']}"
+    raise ImproperlyConfigured(f"Unknown embedding backend '{backend}'.")
+
+
+_onnx_embeddings = {}
+_onnx_lock = threading.Lock()
+
+
+def get_onnx_embeddings() -> OnnxEmbeddings:
+    """
+    Returns the configured ONNX embeddings, loaded once per process from
+    `ONNX_MODEL_PATH` or else the Hugging Face Hub.
+    """
+    options = get_rag_settings("EMBEDDINGS")
+    key = embedding_model_name(EmbeddingBackend.onnx)
+    with _onnx_lock:
+        if key not in _onnx_embeddings:
+            model_path = options["ONNX_MODEL_PATH"] or download_model(
+                options["ONNX_MODEL"], options["ONNX_MODEL_FILE"]
+            )
+            _onnx_embeddings[key] = OnnxEmbeddings(
+                model_path,
+                model_file=options["ONNX_MODEL_FILE"],
+                pooling=options["ONNX_POOLING"],
+                query_prefix=options["ONNX_QUERY_PREFIX"],
+                document_prefix=options["ONNX_DOCUMENT_PREFIX"],
+                max_length=options["ONNX_MAX_LENGTH"],
+                batch_size=options["ONNX_BATCH_SIZE"],
+                threads=options["ONNX_THREADS"],
+            )
+        return _onnx_embeddings[key]
+
+
+def get_embeddings(backend: str, lane: Lane = Lane.interactive) -> Embeddings:
+    """
+    :param backend: An `EmbeddingBackend`.
+    :param lane: Gateway lane of remote embedding calls.
+    :return: The embeddings of the backend.
+    """
+    if backend == EmbeddingBackend.openai:
+        return get_gateway().embeddings(lane)
+    if backend == EmbeddingBackend.onnx:
+        return get_onnx_embeddings()
+    raise ImproperlyConfigured(f"Unknown embedding backend '{backend}'.")
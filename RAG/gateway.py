@@ -0,0 +1,463 @@
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from enum import Enum
+import httpx
+from django.core.cache import cache
+from langchain.chat_models import init_chat_model
+from langchain_openai import OpenAIEmbeddings
+from .conf import get_rag_settings
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limited, or a transient server error
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+# Marks responses produced by the gateway itself, which are never retried
+GATEWAY_HEADER = "x-llm-gateway"
+
+_current_user = contextvars.ContextVar("llm_gateway_user", default=None)
+
+
+class Lane(Enum):
+    # Requests a user is waiting for, e.g. /api/ask/
+    interactive = "interactive"
+    # Bulk work such as document ingestion
+    background = "background"
+
+
+@contextlib.contextmanager
+def user_context(user_id):
+    """
+    Attribute the LLM calls made inside the block (including those of
+    threads started from it with a copied context) to a user, for quotas.
+    """
+    token = _current_user.set(str(user_id) if user_id is not None else None)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+class PriorityLimiter:
+    """
+    Caps concurrent requests. Background requests use at most
+    `background_limit` slots and only while no interactive request is
+    waiting, so interactive requests always find a slot quickly.
+    """
+
+    def __init__(self, limit: int, background_limit: int):
+        self.limit = limit
+        self.background_limit = min(background_limit, limit)
+        self.__condition = threading.Condition()
+        self.__in_use = Counter()
+        self.__interactive_waiting = 0
+
+    def acquire(self, lane: Lane, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.__condition:
+            if lane == Lane.interactive:
+                self.__interactive_waiting += 1
+            try:
+                while not self.__can_acquire(lane):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.__condition.wait(remaining)
+                self.__in_use[lane] += 1
+                return True
+            finally:
+                if lane == Lane.interactive:
+                    self.__interactive_waiting -= 1
+
+    def __can_acquire(self, lane: Lane) -> bool:
+        if sum(self.__in_use.values()) >= self.limit:
+            return False
+        if lane == Lane.background:
+            return (
+                self.__in_use[Lane.background] < self.background_limit
+                and not self.__interactive_waiting
+            )
+        return True
+
+    def release(self, lane: Lane):
+        with self.__condition:
+            self.__in_use[lane] -= 1
+            self.__condition.notify_all()
+
+    def in_use(self, lane: Lane) -> int:
+        return self.__in_use[lane]
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate` requests per second on average, with bursts
+    of up to `capacity` requests. Like the PriorityLimiter, background
+    requests only take a token while no interactive request is waiting for
+    one.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = capacity
+        self.__updated = time.monotonic()
+        self.__condition = threading.Condition()
+        self.__interactive_waiting = 0
+
+    def acquire(self, lane: Lane, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.__condition:
+            if lane == Lane.interactive:
+                self.__interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.__refill(now)
+                    remaining = deadline - now
+                    if self.__tokens < 1:
+                        wait = (1 - self.__tokens) / self.rate
+                        if wait > remaining:
+                            return False
+                        self.__condition.wait(wait)
+                    elif lane == Lane.interactive or not self.__interactive_waiting:
+                        self.__tokens -= 1
+                        return True
+                    elif remaining <= 0:
+                        return False
+                    else:
+                        # Woken when an interactive request stops waiting
+                        self.__condition.wait(remaining)
+            finally:
+                if lane == Lane.interactive:
+                    self.__interactive_waiting -= 1
+                    self.__condition.notify_all()
+
+    def release(self):
+        """
+        Gives back a token taken by a request that was not sent.
+        """
+        with self.__condition:
+            self.__refill(time.monotonic())
+            self.__tokens = min(self.capacity, self.__tokens + 1)
+            self.__condition.notify_all()
+
+    def __refill(self, now: float):
+        self.__tokens = min(
+            self.capacity, self.__tokens + (now - self.__updated) * self.rate
+        )
+        self.__updated = now
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive failures. After `cooldown`
+    seconds one trial request is let through: its success closes the
+    circuit, its failure opens it again.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.__failures = 0
+        self.__opened_at = None
+        self.__trial_running = False
+        # Thread sending the trial request
+        self.__trial_owner = None
+        self.__lock = threading.Lock()
+
+    def allow(self) -> float | None:
+        """
+        :return: None if the request may be sent, otherwise the seconds
+            until the circuit half-opens.
+        """
+        with self.__lock:
+            if self.__opened_at is None:
+                return None
+            remaining = self.__opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self.__trial_running:
+                return max(remaining, 1.0)
+            self.__trial_running = True
+            self.__trial_owner = threading.get_ident()
+            return None
+
+    def release_trial(self):
+        """
+        Lets another request through as the trial if the calling thread was
+        allowed one but didn't send it, e.g. because it was rejected by the
+        gateway's own limits.
+        """
+        with self.__lock:
+            if self.__trial_running and self.__trial_owner == threading.get_ident():
+                self.__trial_running = False
+                self.__trial_owner = None
+
+    def record(self, success: bool):
+        with self.__lock:
+            self.__trial_running = False
+            self.__trial_owner = None
+            if success:
+                self.__failures = 0
+                self.__opened_at = None
+                return
+            self.__failures += 1
+            if self.__failures >= self.threshold:
+                if self.__opened_at is None:
+                    logger.warning(
+                        "LLM circuit opened after %d failures", self.__failures
+                    )
+                self.__opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.__opened_at is not None
+
+
+class UserQuota:
+    """
+    Per-user limit of LLM requests per minute, counted in Django's cache so
+    the count is shared by all processes using a shared cache backend.
+    """
+
+    def __init__(self, per_minute: int | None):
+        self.per_minute = per_minute
+
+    def consume(self, user_id: str | None) -> float | None:
+        """
+        :return: None if the user is within the quota, otherwise the seconds
+            until the current window ends.
+        """
+        if not self.per_minute or user_id is None:
+            return None
+        window = int(time.time() // 60)
+        key = f"rag:llm_quota:{user_id}:{window}"
+        cache.add(key, 0, 120)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(key, 1, 120)
+            count = 1
+        if count > self.per_minute:
+            return 60 - time.time() % 60
+        return None
+
+
+def _gateway_response(request, status: int, message: str, retry_after: float = None):
+    headers = {GATEWAY_HEADER: "1", "content-type": "application/json"}
+    if retry_after is not None:
+        headers["retry-after"] = str(max(1, round(retry_after)))
+    body = {"error": {"message": message, "type": "llm_gateway", "code": status}}
+    return httpx.Response(
+        status, headers=headers, content=json.dumps(body).encode(), request=request
+    )
+
+
+class GatewayTransport(httpx.BaseTransport):
+    """
+    httpx transport of one lane: every request to the provider goes through
+    the gateway's quota, circuit breaker, concurrency and rate limits, and
+    is retried with jittered exponential backoff. Rejections are returned
+    as 429/503 responses, which the OpenAI client raises as API errors.
+    """
+
+    def __init__(self, gateway: "LLMGateway", lane: Lane):
+        self.gateway = gateway
+        self.lane = lane
+
+    def handle_request(self, request):
+        return self.gateway.send(request, self.lane)
+
+
+class LLMGateway:
+    """
+    Single entry point for chat and embedding calls of a process. Models
+    created here share one keep-alive connection pool and the limits of
+    the `RAG_GATEWAY` settings.
+    """
+
+    def __init__(self, options: dict | None = None):
+        self.options = options or get_rag_settings("GATEWAY")
+        self.limiter = PriorityLimiter(
+            self.options["MAX_CONCURRENCY"], self.options["BACKGROUND_MAX_CONCURRENCY"]
+        )
+        rate = self.options["RATE_LIMIT_RPS"]
+        self.bucket = (
+            TokenBucket(rate, self.options["RATE_LIMIT_BURST"] or rate)
+            if rate
+            else None
+        )
+        self.breaker = CircuitBreaker(
+            self.options["BREAKER_THRESHOLD"], self.options["BREAKER_COOLDOWN"]
+        )
+        self.quota = UserQuota(self.options["USER_QUOTA_PER_MINUTE"])
+        self.pool = httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=self.options["POOL_MAX_CONNECTIONS"],
+                max_keepalive_connections=self.options["POOL_MAX_KEEPALIVE"],
+                keepalive_expiry=self.options["POOL_KEEPALIVE_EXPIRY"],
+            )
+        )
+        self.stats = Counter()
+        self.__stats_lock = threading.Lock()
+        self.__clients = {}
+        self.__models = {}
+        self.__lock = threading.Lock()
+
+    def __count(self, name: str):
+        with self.__stats_lock:
+            self.stats[name] += 1
+
+    def http_client(self, lane: Lane) -> httpx.Client:
+        with self.__lock:
+            if lane not in self.__clients:
+                self.__clients[lane] = httpx.Client(
+                    transport=GatewayTransport(self, lane),
+                    timeout=self.options["TIMEOUT"],
+                )
+            return self.__clients[lane]
+
+    def chat_model(self, lane: Lane = Lane.interactive):
+        """
+        :param lane: Priority lane the model's requests are sent in.
+        :return: The chat model of the lane, shared within the process.
+        """
+        key = ("chat", lane)
+        with self.__lock:
+            model = self.__models.get(key)
+        if model is None:
+            model = init_chat_model(
+                model=self.options["CHAT_MODEL"],
+                model_provider="openai",
+                http_client=self.http_client(lane),
+                # Retries are done by the gateway
+                max_retries=0,
+            )
+            with self.__lock:
+                model = self.__models.setdefault(key, model)
+        return model
+
+    def embeddings(self, lane: Lane = Lane.interactive):
+        """
+        :param lane: Priority lane the model's requests are sent in.
+        :return: The embedding model of the lane, shared within the process.
+        """
+        key = ("embeddings", lane)
+        with self.__lock:
+            model = self.__models.get(key)
+        if model is None:
+            model = OpenAIEmbeddings(
+                model=self.options["EMBEDDING_MODEL"],
+                http_client=self.http_client(lane),
+                max_retries=0,
+                check_embedding_ctx_length=self.options["EMBEDDING_CHECK_CTX_LENGTH"],
+            )
+            with self.__lock:
+                model = self.__models.setdefault(key, model)
+        return model
+
+    def backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        """
+        Delay before a retry: the provider's Retry-After if given, otherwise
+        exponential backoff with full jitter.
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), self.options["BACKOFF_MAX"])
+            except ValueError:
+                pass
+        ceiling = min(
+            self.options["BACKOFF_MAX"], self.options["BACKOFF_BASE"] * 2**attempt
+        )
+        return random.uniform(0, ceiling)
+
+    def send(self, request, lane: Lane):
+        """
+        Sends a provider request through the gateway's limits and retries.
+
+        :param request: The httpx request.
+        :param lane: Priority lane of the request.
+        :return: The provider's response, or a 429/503 gateway response.
+        """
+        user_id = _current_user.get()
+        retry_after = self.quota.consume(user_id)
+        if retry_after is not None:
+            self.__count("rejected_quota")
+            return _gateway_response(
+                request, 429, "LLM request quota exceeded.", retry_after
+            )
+
+        max_retries = self.options["MAX_RETRIES"]
+        queue_timeout = self.options["QUEUE_TIMEOUT"]
+        for attempt in range(max_retries + 1):
+            retry_after = self.breaker.allow()
+            if retry_after is not None:
+                self.__count("rejected_circuit_open")
+                return _gateway_response(
+                    request, 503, "LLM provider unavailable.", retry_after
+                )
+            # The token is taken before the slot, so requests waiting for
+            # the rate limit don't hold slots other requests could use
+            deadline = time.monotonic() + queue_timeout
+            if self.bucket is not None and not self.bucket.acquire(lane, queue_timeout):
+                self.breaker.release_trial()
+                self.__count("rejected_rate_limit")
+                return _gateway_response(
+                    request, 429, "LLM gateway rate limit exceeded.", 1
+                )
+            if not self.limiter.acquire(lane, max(deadline - time.monotonic(), 0)):
+                if self.bucket is not None:
+                    self.bucket.release()
+                self.breaker.release_trial()
+                self.__count("rejected_queue_timeout")
+                return _gateway_response(request, 503, "LLM gateway overloaded.", 1)
+            try:
+                self.__count(f"requests_{lane.value}")
+                try:
+                    response = self.pool.handle_request(request)
+                except httpx.TransportError:
+                    self.breaker.record(False)
+                    if attempt == max_retries:
+                        raise
+                    response = None
+            finally:
+                self.limiter.release(lane)
+
+            if response is not None:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record(True)
+                    return response
+                # Rate limits show the provider is up, only its errors count
+                # towards opening the circuit
+                self.breaker.record(response.status_code < 500)
+                if attempt == max_retries:
+                    return response
+                delay = self.backoff(attempt, response.headers.get("retry-after"))
+                response.close()
+            else:
+                delay = self.backoff(attempt)
+            self.__count("retries")
+            logger.info(
+                "Retrying LLM request (attempt %d) in %.2fs", attempt + 1, delay
+            )
+            time.sleep(delay)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """
+    Returns the process-wide LLM gateway.
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
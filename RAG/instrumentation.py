@@ -0,0 +1,360 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import List
+from django.utils.module_loading import import_string
+from langchain_core.callbacks import BaseCallbackHandler
+from .conf import get_rag_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class NodeRecord:
+    """Timing and usage of one execution of a graph node."""
+
+    request_id: str
+    thread_id: str
+    node: str
+    step: int
+    duration_ms: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    llm_calls: int = 0
+    tool_latency_ms: dict = field(default_factory=dict)
+    route: str = ""
+    error: bool = False
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """Share of the input tokens read from the provider's prompt cache."""
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+
+class InstrumentationCallbackHandler(BaseCallbackHandler):
+    """
+    Collects a NodeRecord per executed node of a LangGraph run, using the
+    `langgraph_node` metadata LangGraph attaches to every nested callback:
+    node wall time, LLM token usage, tool latency and the route taken.
+    """
+
+    def __init__(self, thread_id: str, request_id: str | None = None):
+        self.thread_id = thread_id
+        self.request_id = request_id or uuid.uuid4().hex
+        self.records: List[NodeRecord] = []
+        self.__lock = threading.Lock()
+        self.__node_runs = {}
+        self.__llm_runs = {}
+        self.__tool_runs = {}
+
+    def __record_for(self, metadata: dict | None) -> NodeRecord | None:
+        """
+        Finds the record of the node (and step) a nested run belongs to.
+        """
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        step = metadata.get("langgraph_step")
+        for record in reversed(self.records):
+            if record.node == node and record.step == step:
+                return record
+        return None
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs
+    ):
+        node = (metadata or {}).get("langgraph_node")
+        if node is None or kwargs.get("name") != node:
+            return
+        with self.__lock:
+            record = NodeRecord(
+                request_id=self.request_id,
+                thread_id=self.thread_id,
+                node=node,
+                step=metadata.get("langgraph_step", 0),
+            )
+            self.records.append(record)
+            self.__node_runs[run_id] = (record, time.perf_counter())
+
+    def __finish_node(self, run_id, error: bool):
+        with self.__lock:
+            run = self.__node_runs.pop(run_id, None)
+        if run is not None:
+            record, started = run
+            record.duration_ms = (time.perf_counter() - started) * 1000
+            record.error = error
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.__finish_node(run_id, error=False)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.__finish_node(run_id, error=True)
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id, metadata=None, **kwargs
+    ):
+        with self.__lock:
+            self.__llm_runs[run_id] = metadata
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        with self.__lock:
+            self.__llm_runs[run_id] = metadata
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self.__lock:
+            self.__llm_runs.pop(run_id, None)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage_metadata = getattr(message, "usage_metadata", None) or {}
+                usage["input_tokens"] += usage_metadata.get("input_tokens", 0)
+                usage["output_tokens"] += usage_metadata.get("output_tokens", 0)
+                details = usage_metadata.get("input_token_details") or {}
+                usage["cached_tokens"] += details.get("cache_read", 0) or 0
+        with self.__lock:
+            record = self.__record_for(self.__llm_runs.pop(run_id, None))
+            if record is None:
+                return
+            record.llm_calls += 1
+            record.input_tokens += usage["input_tokens"]
+            record.output_tokens += usage["output_tokens"]
+            record.cached_tokens += usage["cached_tokens"]
+
+    def on_tool_start(self, serialized, input_str, *, run_id, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        with self.__lock:
+            self.__tool_runs[run_id] = (name, metadata, time.perf_counter())
+
+    def __finish_tool(self, run_id):
+        with self.__lock:
+            run = self.__tool_runs.pop(run_id, None)
+            if run is None:
+                return
+            name, metadata, started = run
+            record = self.__record_for(metadata)
+            if record is not None:
+                elapsed = (time.perf_counter() - started) * 1000
+                record.tool_latency_ms[name] = (
+                    record.tool_latency_ms.get(name, 0) + elapsed
+                )
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.__finish_tool(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.__finish_tool(run_id)
+
+    def finish(self) -> List[NodeRecord]:
+        """
+        Fills in the route taken after each node and returns the records.
+        """
+        with self.__lock:
+            records = sorted(self.records, key=lambda record: record.step)
+            for record, next_record in zip(records, records[1:] + [None]):
+                record.route = next_record.node if next_record else "__end__"
+            return records
+
+
+class LoggingSink:
+    """Writes node records to the `RAG.instrumentation` logger."""
+
+    def emit(self, records: List[NodeRecord]):
+        for record in records:
+            logger.info(
+                "node=%s duration_ms=%.1f tokens_in=%d tokens_out=%d cached=%d cache_hit=%.2f route=%s",
+                record.node,
+                record.duration_ms,
+                record.input_tokens,
+                record.output_tokens,
+                record.cached_tokens,
+                record.cache_hit_rate,
+                record.route,
+                extra={"node_record": asdict(record)},
+            )
+
+
+class PrometheusSink:
+    """
+    Aggregates node records in process and renders them in the Prometheus
+    text exposition format (served by `api.views.MetricsView`).
+    """
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__durations = {}
+        self.__counters = {}
+
+    def __increment(self, name: str, labels: tuple, value: float = 1):
+        key = (name, labels)
+        self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def emit(self, records: List[NodeRecord]):
+        with self.__lock:
+            for record in records:
+                seconds = record.duration_ms / 1000
+                histogram = self.__durations.setdefault(
+                    record.node,
+                    {"buckets": [0] * len(self.BUCKETS), "sum": 0, "count": 0},
+                )
+                for i, bound in enumerate(self.BUCKETS):
+                    if seconds <= bound:
+                        histogram["buckets"][i] += 1
+                histogram["sum"] += seconds
+                histogram["count"] += 1
+                node = (("node", record.node),)
+                self.__increment("rag_node_llm_calls_total", node, record.llm_calls)
+                for token_type in ("input", "output", "cached"):
+                    self.__increment(
+                        "rag_node_tokens_total",
+                        node + (("type", token_type),),
+                        getattr(record, f"{token_type}_tokens"),
+                    )
+                for tool, latency_ms in record.tool_latency_ms.items():
+                    self.__increment(
+                        "rag_tool_duration_seconds_total",
+                        (("tool", tool),),
+                        latency_ms / 1000,
+                    )
+                self.__increment("rag_route_total", node + (("route", record.route),))
+                if record.error:
+                    self.__increment("rag_node_errors_total", node)
+
+    def render(self) -> str:
+        def format_labels(labels):
+            return ",".join(f'{key}="{value}"' for key, value in labels)
+
+        lines = ["# TYPE rag_node_duration_seconds histogram"]
+        with self.__lock:
+            for node, histogram in sorted(self.__durations.items()):
+                for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                    lines.append(
+                        f'rag_node_duration_seconds_bucket{{node="{node}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'rag_node_duration_seconds_bucket{{node="{node}",le="+Inf"}} {histogram["count"]}'
+                )
+                lines.append(
+                    f'rag_node_duration_seconds_sum{{node="{node}"}} {histogram["sum"]}'
+                )
+                lines.append(
+                    f'rag_node_duration_seconds_count{{node="{node}"}} {histogram["count"]}'
+                )
+            names = sorted({name for name, _ in self.__counters})
+            for name in names:
+                lines.append(f"# TYPE {name} counter")
+                for (counter, labels), value in sorted(self.__counters.items()):
+                    if counter == name:
+                        lines.append(f"{name}{{{format_labels(labels)}}} {value}")
+            lines.append("# TYPE rag_node_prompt_cache_hit_ratio gauge")
+            for node in sorted(self.__durations):
+                tokens = {
+                    token_type: self.__counters.get(
+                        (
+                            "rag_node_tokens_total",
+                            (("node", node), ("type", token_type)),
+                        ),
+                        0,
+                    )
+                    for token_type in ("input", "cached")
+                }
+                if tokens["input"]:
+                    lines.append(
+                        f'rag_node_prompt_cache_hit_ratio{{node="{node}"}} '
+                        f'{tokens["cached"] / tokens["input"]}'
+                    )
+        return "\n".join(lines) + "\n"
+
+
+class DatabaseSink:
+    """Stores node records in the `RAG.NodeMetric` table."""
+
+    def emit(self, records: List[NodeRecord]):
+        from .models import NodeMetric
+
+        NodeMetric.objects.bulk_create(
+            [NodeMetric(**asdict(record)) for record in records]
+        )
+
+
+class MemorySink:
+    """Keeps node records in memory, e.g. for benchmarks."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.records: List[NodeRecord] = []
+
+    def emit(self, records: List[NodeRecord]):
+        with self.__lock:
+            self.records.extend(records)
+
+    def pop(self) -> List[NodeRecord]:
+        """Returns the records emitted so far and forgets them."""
+        with self.__lock:
+            records, self.records = self.records, []
+        return records
+
+
+@lru_cache(maxsize=None)
+def get_sinks() -> tuple:
+    """
+    Returns the configured sinks, instantiated once per process.
+    """
+    return tuple(
+        import_string(path)() for path in get_rag_settings("INSTRUMENTATION")["SINKS"]
+    )
+
+
+def get_sink(sink_class) -> object | None:
+    """
+    Returns the configured sink instance of a given class, if any.
+    """
+    for sink in get_sinks():
+        if isinstance(sink, sink_class):
+            return sink
+    return None
+
+
+_queue = queue.SimpleQueue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _drain():
+    while True:
+        records = _queue.get()
+        for sink in get_sinks():
+            try:
+                sink.emit(records)
+            except Exception:
+                logger.exception("Instrumentation sink %r failed", sink)
+
+
+def emit_records(records: List[NodeRecord]):
+    """
+    Hands records to the configured sinks. With `RAG_INSTRUMENTATION["ASYNC"]`
+    the sinks run on a background thread, off the request path.
+    """
+    global _worker
+    if not records:
+        return
+    if not get_rag_settings("INSTRUMENTATION")["ASYNC"]:
+        for sink in get_sinks():
+            sink.emit(records)
+        return
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = threading.Thread(
+                    target=_drain, name="rag-instrumentation", daemon=True
+                )
+                _worker.start()
+    _queue.put(records)
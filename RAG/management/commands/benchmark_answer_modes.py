@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import warnings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from langchain_core.documents import Document
+from RAG import instrumentation
+from RAG.benchmarks import fake_tools
+from RAG.benchmarks.corpus import generate_document
+from RAG.benchmarks.fake_openai import FakeOpenAIServer
+from RAG.benchmarks.stats import summarize_latencies
+from RAG.corrective_rag import AnswerMode, CorrectiveRAG
+from RAG.data_injector import DataInjector
+from RAG.instrumentation import MemorySink
+
+# Nodes that only run when the context was graded irrelevant
+CORRECTIVE_NODES = {"expand_retrieval", "rephrase_query", "crawler_agent"}
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+class Command(BaseCommand):
+    help = (
+        "A/B test the fused grade-and-answer node against the two-call graph "
+        "(document_grader, then responder) on the same questions, reporting "
+        "latency, LLM calls, prompt tokens, answer accuracy and how often "
+        "both arms grade the context alike."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=40)
+        parser.add_argument(
+            "--pages", type=int, default=5, help="Pages of the synthetic document."
+        )
+        parser.add_argument(
+            "--qa-file",
+            help=(
+                "JSONL labeled set with `question` and `answer` (a passage a "
+                "correct answer contains). Defaults to synthetic questions."
+            ),
+        )
+        parser.add_argument(
+            "--files", nargs="*", default=[], help="PDFs the labeled set refers to."
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            help=(
+                "Use the local fake OpenAI server and search tools. Latency and "
+                "token counts stay meaningful, accuracy does not."
+            ),
+        )
+        parser.add_argument("--chat-latency-ms", type=float, default=300)
+        parser.add_argument(
+            "--irrelevant-rate",
+            type=float,
+            default=0.2,
+            help="Probability that the fake grader marks a context irrelevant.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if options["qa_file"] and not options["files"]:
+            raise CommandError("--qa-file requires the --files it refers to.")
+        rag_settings = {
+            "RAG_INSTRUMENTATION": {
+                "SINKS": ["RAG.instrumentation.MemorySink"],
+                "ASYNC": False,
+            },
+            "RAG_VECTOR_STORE": {"MODE": "embedded"},
+        }
+        server = None
+        if options["offline"]:
+            server = FakeOpenAIServer(
+                chat_latency_ms=options["chat_latency_ms"],
+                irrelevant_rate=options["irrelevant_rate"],
+                seed=options["seed"],
+            ).start()
+            os.environ["OPENAI_BASE_URL"] = server.url
+            os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+            fake_tools.TOOL_LATENCY_MS = options["chat_latency_ms"]
+            rag_settings["RAG_TOOLS"] = {
+                "FACTORY": "RAG.benchmarks.fake_tools.get_fake_tools"
+            }
+            rag_settings["RAG_GATEWAY"] = server.gateway_settings()
+        if options["verbosity"] < 2:
+            logging.getLogger("RAG").setLevel(logging.WARNING)
+            warnings.filterwarnings("ignore", message="Pydantic serializer warnings")
+
+        # The vector store lives in ./rag_db (embedded, even if the project
+        # uses a Chroma server), so run from a scratch directory
+        old_cwd = os.getcwd()
+        files = [os.path.abspath(path) for path in options["files"]]
+        os.chdir(tempfile.mkdtemp(prefix="rag-answer-modes-"))
+        try:
+            with override_settings(**rag_settings):
+                instrumentation.get_sinks.cache_clear()
+                report = self.__run(files, options)
+        finally:
+            instrumentation.get_sinks.cache_clear()
+            os.chdir(old_cwd)
+            if server is not None:
+                server.stop()
+
+        self.__print_report(report)
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def __load_questions(self, files: list, options: dict) -> list:
+        """
+        Ingests the documents for user "0" and returns (question, answer) pairs.
+        """
+        injector = DataInjector()
+        if files:
+            for document_id, path in enumerate(files, start=1):
+                injector.add_document(path, "0", document_id)
+            with open(options["qa_file"]) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            return [(row["question"], row["answer"]) for row in rows]
+
+        document = generate_document(options["pages"], seed=options["seed"])
+        pages = [
+            Document(
+                page_content="\n".join(lines),
+                metadata={"page": page, "source": "synthetic"},
+            )
+            for page, lines in enumerate(document.pages)
+        ]
+        injector.add_pages(pages, "0", 1)
+        rng = random.Random(options["seed"])
+        facts = rng.sample(
+            document.facts, min(options["questions"], len(document.facts))
+        )
+        return [(fact.question, fact.value) for fact in facts]
+
+    def __run(self, files: list, options: dict) -> dict:
+        questions = self.__load_questions(files, options)[: options["questions"]]
+        if not questions:
+            raise CommandError("The labeled set is empty.")
+        sink = instrumentation.get_sink(MemorySink)
+        rag = CorrectiveRAG()
+        arms = {mode: [] for mode in AnswerMode}
+        for index, (question, expected) in enumerate(questions):
+            # Alternating the order, so neither arm profits from warm caches
+            modes = list(AnswerMode) if index % 2 else list(reversed(AnswerMode))
+            for mode in modes:
+                sink.pop()
+                started = time.perf_counter()
+                answer = rag.run(
+                    question,
+                    user_id="0",
+                    thread_id=f"{mode.value}-{index}",
+                    answer_mode=mode,
+                )
+                latency_ms = (time.perf_counter() - started) * 1000
+                records = sink.pop()
+                arms[mode].append(
+                    {
+                        "latency_ms": latency_ms,
+                        "llm_calls": sum(r.llm_calls for r in records),
+                        "input_tokens": sum(r.input_tokens for r in records),
+                        "cached_tokens": sum(r.cached_tokens for r in records),
+                        "grounded": not CORRECTIVE_NODES & {r.node for r in records},
+                        "correct": normalize(expected) in normalize(answer),
+                    }
+                )
+
+        report = {
+            "config": {
+                key: options[key]
+                for key in ("questions", "offline", "chat_latency_ms", "seed")
+            },
+            "arms": {mode.value: self.__summarize(runs) for mode, runs in arms.items()},
+        }
+        report["grade_agreement"] = sum(
+            fused["grounded"] == two_call["grounded"]
+            for fused, two_call in zip(
+                arms[AnswerMode.fused], arms[AnswerMode.two_call]
+            )
+        ) / len(questions)
+        return report
+
+    def __summarize(self, runs: list) -> dict:
+        count = len(runs)
+        grounded = [run for run in runs if run["grounded"]]
+        summary = summarize_latencies([run["latency_ms"] for run in runs], 0)
+        del summary["throughput_rps"]
+        return {
+            **summary,
+            "llm_calls": sum(run["llm_calls"] for run in runs) / count,
+            "input_tokens": sum(run["input_tokens"] for run in runs) / count,
+            "cached_tokens": sum(run["cached_tokens"] for run in runs) / count,
+            "accuracy": sum(run["correct"] for run in runs) / count,
+            "grounded": len(grounded) / count,
+            # Grounded answers are what the fused node is meant to speed up
+            "grounded_p50_ms": summarize_latencies(
+                [run["latency_ms"] for run in grounded], 0
+            )["p50_ms"],
+            "grounded_input_tokens": (
+                sum(run["input_tokens"] for run in grounded) / len(grounded)
+                if grounded
+                else 0.0
+            ),
+        }
+
+    def __print_report(self, report: dict):
+        header = f"{'arm':<10}{'p50 ms':>9}{'p95 ms':>9}{'calls':>7}{'tokens':>8}{'cached':>8}{'accuracy':>10}{'grounded':>10}{'g p50 ms':>10}{'g tokens':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, arm in report["arms"].items():
+            self.stdout.write(
+                f"{name:<10}{arm['p50_ms']:>9.1f}{arm['p95_ms']:>9.1f}"
+                f"{arm['llm_calls']:>7.2f}{arm['input_tokens']:>8.0f}"
+                f"{arm['cached_tokens']:>8.0f}"
+                f"{arm['accuracy']:>10.2f}{arm['grounded']:>10.2f}"
+                f"{arm['grounded_p50_ms']:>10.1f}{arm['grounded_input_tokens']:>10.0f}"
+            )
+        self.stdout.write(f"Grade agreement: {report['grade_agreement']:.2f}")
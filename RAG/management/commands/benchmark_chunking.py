@@ -0,0 +1,114 @@
+import random
+import re
+import time
+from django.core.management.base import BaseCommand
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_openai import OpenAIEmbeddings
+from RAG.chunking import ChunkingStrategy, split_documents
+from RAG.conf import get_rag_settings
+from RAG.tokens import count_tokens
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare chunking strategies on a set of PDFs by chunk count, "
+        "embedding tokens and retrieval hit rate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="PDF files to benchmark.")
+        parser.add_argument(
+            "--strategies",
+            nargs="+",
+            default=[strategy.value for strategy in ChunkingStrategy],
+            choices=[strategy.value for strategy in ChunkingStrategy],
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="Chunk budget in tokens, except for the characters strategy.",
+        )
+        parser.add_argument("--chunk-overlap", type=int, help="Overlap in tokens.")
+        parser.add_argument(
+            "--queries",
+            type=int,
+            default=50,
+            help="Number of sentences sampled from the corpus as queries.",
+        )
+        parser.add_argument("-k", type=int, default=4, help="Retrieved chunks.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--skip-retrieval",
+            action="store_true",
+            help="Only report chunk statistics, without calling the embedding model.",
+        )
+
+    def handle(self, *args, **options):
+        pages = []
+        for file_path in options["files"]:
+            pages.extend(PyPDFLoader(file_path).lazy_load())
+        self.stdout.write(
+            f"Loaded {len(pages)} pages from {len(options['files'])} files"
+        )
+
+        queries = []
+        embeddings = None
+        query_vectors = []
+        if not options["skip_retrieval"]:
+            # Sampling full sentences so a hit means the chunk kept the sentence intact
+            sentences = [
+                sentence.strip()
+                for page in pages
+                for sentence in SENTENCE_PATTERN.split(page.page_content)
+                if 8 <= len(sentence.split()) <= 40
+            ]
+            rng = random.Random(options["seed"])
+            queries = rng.sample(sentences, min(options["queries"], len(sentences)))
+            embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+            query_vectors = embeddings.embed_documents(queries) if queries else []
+
+        # Counted with the tokenizer the token strategies are budgeted with
+        encoding_name = get_rag_settings("CHUNKING")["TOKEN_ENCODING"]
+        header = f"{'strategy':<12}{'chunks':>8}{'avg tokens':>12}{'embed tokens':>14}{'split ms':>10}{'hit rate':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for strategy in options["strategies"]:
+            started = time.perf_counter()
+            chunks = split_documents(
+                pages,
+                strategy=strategy,
+                chunk_size=options["chunk_size"],
+                chunk_overlap=options["chunk_overlap"],
+            )
+            split_ms = (time.perf_counter() - started) * 1000
+            tokens = sum(
+                count_tokens(chunk.page_content, encoding_name) for chunk in chunks
+            )
+            avg_tokens = tokens / len(chunks) if chunks else 0
+
+            hit_rate = "-"
+            if queries and chunks:
+                vector_store = InMemoryVectorStore(embedding=embeddings)
+                vector_store.add_documents(chunks)
+                hits = 0
+                for query, vector in zip(queries, query_vectors):
+                    retrieved = vector_store.similarity_search_by_vector(
+                        vector, k=options["k"]
+                    )
+                    if any(
+                        normalize(query) in normalize(doc.page_content)
+                        for doc in retrieved
+                    ):
+                        hits += 1
+                hit_rate = f"{hits / len(queries):.2%}"
+
+            self.stdout.write(
+                f"{strategy:<12}{len(chunks):>8}{avg_tokens:>12.1f}{tokens:>14}{split_ms:>10.1f}{hit_rate:>10}"
+            )
@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from rest_framework.test import APIClient
+from RAG import instrumentation
+from RAG.benchmarks import fake_tools
+from RAG.benchmarks.corpus import CORPUS_SIZES, generate_document, write_pdf
+from RAG.benchmarks.fake_openai import FakeOpenAIServer
+from RAG.benchmarks.stats import peak_rss_mb, summarize_latencies
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the ingestion, selection and ask endpoints end to end at a given "
+        "concurrency against local stand-ins for OpenAI and the search tools, "
+        "and report throughput, latency percentiles, peak RSS and model calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2)
+        parser.add_argument(
+            "--documents", type=int, default=2, help="Documents uploaded per user."
+        )
+        parser.add_argument(
+            "--size",
+            choices=list(CORPUS_SIZES),
+            default="small",
+            help="Pages per document.",
+        )
+        parser.add_argument(
+            "--questions", type=int, default=20, help="Questions asked per user."
+        )
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--chat-latency-ms", type=float, default=50)
+        parser.add_argument("--embedding-latency-ms", type=float, default=20)
+        parser.add_argument("--tool-latency-ms", type=float, default=300)
+        parser.add_argument(
+            "--irrelevant-rate",
+            type=float,
+            default=0.2,
+            help="Probability that the fake grader marks a document irrelevant.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        work_dir = tempfile.mkdtemp(prefix="rag-benchmark-")
+        server = FakeOpenAIServer(
+            chat_latency_ms=options["chat_latency_ms"],
+            embedding_latency_ms=options["embedding_latency_ms"],
+            irrelevant_rate=options["irrelevant_rate"],
+            seed=options["seed"],
+        ).start()
+        os.environ["OPENAI_BASE_URL"] = server.url
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        fake_tools.TOOL_LATENCY_MS = options["tool_latency_ms"]
+        if options["verbosity"] < 2:
+            logging.getLogger("RAG").setLevel(logging.WARNING)
+            # Emitted by langchain-openai for every structured output response
+            warnings.filterwarnings("ignore", message="Pydantic serializer warnings")
+
+        # The vector store lives in ./rag_db (embedded, even if the project
+        # uses a Chroma server), so run from the scratch directory
+        old_cwd = os.getcwd()
+        os.chdir(work_dir)
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(
+            work_dir, "benchmark.sqlite3"
+        )
+        setup_test_environment()
+        old_db_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            with override_settings(
+                MEDIA_ROOT=os.path.join(work_dir, "uploads"),
+                RAG_TOOLS={"FACTORY": "RAG.benchmarks.fake_tools.get_fake_tools"},
+                RAG_INSTRUMENTATION={"SINKS": []},
+                RAG_VECTOR_STORE={"MODE": "embedded"},
+                RAG_GATEWAY=server.gateway_settings(),
+            ):
+                instrumentation.get_sinks.cache_clear()
+                report = self.__run(server, work_dir, options)
+        finally:
+            instrumentation.get_sinks.cache_clear()
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+            teardown_test_environment()
+            os.chdir(old_cwd)
+            server.stop()
+
+        self.__print_report(report)
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+        failed = [
+            name
+            for name, phase in report["phases"].items()
+            if phase["requests"] and phase["errors"] == phase["requests"]
+        ]
+        if failed:
+            raise CommandError(f"Every request failed in: {', '.join(failed)}.")
+
+    def __run(self, server: FakeOpenAIServer, work_dir: str, options: dict) -> dict:
+        rng = random.Random(options["seed"])
+        num_pages = CORPUS_SIZES[options["size"]]
+        users = []
+        uploads = []
+        for user_index in range(options["users"]):
+            user = get_user_model().objects.create_user(
+                username=f"benchmark-{user_index}",
+                email=f"benchmark-{user_index}@example.com",
+                password="benchmark",
+            )
+            facts = []
+            for doc_index in range(options["documents"]):
+                document = generate_document(num_pages, seed=rng.randrange(2**32))
+                path = os.path.join(work_dir, f"user{user_index}-doc{doc_index}.pdf")
+                write_pdf(path, document.pages)
+                uploads.append((user, path))
+                facts.extend(document.facts)
+            users.append((user, facts))
+
+        def upload(user, path):
+            with open(path, "rb") as f:
+                return self.__client(user).post(
+                    reverse("document-upload"),
+                    {"title": os.path.basename(path), "file": f},
+                    format="multipart",
+                )
+
+        def select(user):
+            client = self.__client(user)
+            response = client.get(
+                reverse("documents-list"), {"fields": "id", "page_size": 200}
+            )
+            ids = [document["id"] for document in response.data["results"]]
+            return client.post(
+                reverse("document-selection"), {"document_ids": ids}, format="json"
+            )
+
+        def ask(user, question, thread_id):
+            return self.__client(user).post(
+                reverse("qna"),
+                {"question": question, "thread_id": thread_id},
+                format="json",
+            )
+
+        asks = [
+            (ask, user, fact.question, f"benchmark-{user.id}-{i % 4}")
+            for user, facts in users
+            for i, fact in enumerate(
+                rng.sample(facts, min(options["questions"], len(facts)))
+            )
+        ]
+        phases = {
+            "ingestion": [(upload, user, path) for user, path in uploads],
+            "selection": [(select, user) for user, _ in users],
+            "ask": asks,
+        }
+        report = {
+            "config": {
+                key: options[key]
+                for key in (
+                    "users",
+                    "documents",
+                    "size",
+                    "questions",
+                    "concurrency",
+                    "chat_latency_ms",
+                    "embedding_latency_ms",
+                    "tool_latency_ms",
+                    "irrelevant_rate",
+                )
+            },
+            "phases": {},
+        }
+        for name, calls in phases.items():
+            server.reset_counters()
+            report["phases"][name] = {
+                **self.__run_phase(calls, options["concurrency"]),
+                **server.counters,
+            }
+        report["peak_rss_mb"] = peak_rss_mb()
+        return report
+
+    def __client(self, user) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def __run_phase(self, calls: list, concurrency: int) -> dict:
+        """
+        Issue requests from a thread pool and time each of them.
+        """
+
+        def timed(call):
+            func, *args = call
+            started = time.perf_counter()
+            try:
+                response = func(*args)
+                ok = response.status_code < 400
+                if not ok:
+                    self.stderr.write(
+                        f"{func.__name__} returned {response.status_code}: "
+                        f"{getattr(response, 'data', '')}"
+                    )
+            except Exception as e:
+                self.stderr.write(f"{func.__name__} failed: {e!r}")
+                ok = False
+            finally:
+                connections.close_all()
+            return (time.perf_counter() - started) * 1000, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, calls))
+        elapsed = time.perf_counter() - started
+        summary = summarize_latencies([latency for latency, _ in results], elapsed)
+        summary["errors"] = sum(1 for _, ok in results if not ok)
+        return summary
+
+    def __print_report(self, report: dict):
+        header = f"{'phase':<10}{'reqs':>6}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'chat':>7}{'embed':>7}{'embed in':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, phase in report["phases"].items():
+            self.stdout.write(
+                f"{name:<10}{phase['requests']:>6}{phase['errors']:>8}"
+                f"{phase['throughput_rps']:>9.2f}{phase['p50_ms']:>10.1f}"
+                f"{phase['p95_ms']:>10.1f}{phase['p99_ms']:>10.1f}"
+                f"{phase['chat_calls']:>7}{phase['embedding_calls']:>7}"
+                f"{phase['embedding_inputs']:>10}"
+            )
+        self.stdout.write(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
@@ -0,0 +1,329 @@
+import json
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from langchain_core.documents import Document
+from RAG.benchmarks.corpus import generate_document
+from RAG.benchmarks.fake_openai import FakeOpenAIServer
+from RAG.benchmarks.stats import directory_size_mb, peak_rss_mb, summarize_latencies
+from RAG.conf import get_rag_settings
+from RAG.data_injector import DataInjector
+from RAG.embeddings import embed_queries
+from RAG.reranking import RerankingMode, get_reranker
+from RAG.retrieval import build_metadata_filter
+
+SCOPES = ("none", "user", "documents")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+@dataclass
+class LabeledQuery:
+    """A question and a passage that a relevant chunk must contain."""
+
+    question: str
+    answer: str
+    user_id: str
+    document_id: int
+
+
+class Command(BaseCommand):
+    help = (
+        "Populate a scratch vector store through DataInjector up to growing "
+        "corpus sizes and sweep similarity search settings (k, metadata "
+        "filters), reporting query latency, recall@k and index size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--corpus-sizes",
+            nargs="+",
+            type=int,
+            default=[1000, 10000],
+            help="Chunk counts to measure at, e.g. 1000 10000 100000 1000000.",
+        )
+        parser.add_argument("-k", nargs="+", type=int, default=[1, 4, 10])
+        parser.add_argument(
+            "--scopes",
+            nargs="+",
+            choices=SCOPES,
+            default=list(SCOPES),
+            help="Metadata filters: none, the query's user, or its document.",
+        )
+        parser.add_argument(
+            "--qa-file",
+            help=(
+                "JSONL labeled set with `question` and `answer` (a passage a "
+                "relevant chunk contains). Defaults to synthetic questions."
+            ),
+        )
+        parser.add_argument(
+            "--files", nargs="*", default=[], help="PDFs the labeled set refers to."
+        )
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=4,
+            help="Users the synthetic documents are spread over.",
+        )
+        parser.add_argument("--pages-per-document", type=int, default=10)
+        parser.add_argument("--chunk-size", type=int, help="Chunk budget in tokens.")
+        parser.add_argument("--chunking-strategy")
+        parser.add_argument(
+            "--rerank",
+            choices=[mode.value for mode in RerankingMode],
+            help="Also measure each setting with this reranker (RAG_RERANKING).",
+        )
+        parser.add_argument(
+            "--candidates",
+            type=int,
+            help="Candidates reranked per query, defaults to RAG_RERANKING.",
+        )
+        parser.add_argument(
+            "--vector-store",
+            choices=["embedded", "http"],
+            default="embedded",
+            help=(
+                "Keep the scratch collection in this process, or on the Chroma "
+                "server of RAG_VECTOR_STORE (where it is emptied first)."
+            ),
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            help=(
+                "Use the local fake OpenAI server for embeddings. Latency and "
+                "index size stay meaningful, recall reflects bag-of-words vectors."
+            ),
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if options["qa_file"] and not options["files"]:
+            raise CommandError("--qa-file requires the --files it refers to.")
+        chunking = dict(get_rag_settings("CHUNKING"))
+        if options["chunk_size"]:
+            chunking["CHUNK_SIZE"] = options["chunk_size"]
+
+        server = None
+        gateway = get_rag_settings("GATEWAY")
+        if options["offline"]:
+            server = FakeOpenAIServer(seed=options["seed"]).start()
+            os.environ["OPENAI_BASE_URL"] = server.url
+            os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+            gateway = server.gateway_settings()
+
+        vector_store = {
+            **get_rag_settings("VECTOR_STORE"),
+            "MODE": options["vector_store"],
+            "PATH": None,
+        }
+
+        # DataInjector persists to ./<collection>, so run from a scratch directory
+        old_cwd = os.getcwd()
+        files = [os.path.abspath(path) for path in options["files"]]
+        os.chdir(tempfile.mkdtemp(prefix="rag-retrieval-"))
+        try:
+            with override_settings(
+                RAG_CHUNKING=chunking,
+                RAG_VECTOR_STORE=vector_store,
+                RAG_GATEWAY=gateway,
+            ):
+                report = self.__run(files, options)
+        finally:
+            os.chdir(old_cwd)
+            if server is not None:
+                server.stop()
+
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def __load_labeled_set(self, path: str) -> list:
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        # User-supplied files are ingested for user "0" with IDs 1..n
+        return [
+            LabeledQuery(
+                question=row["question"],
+                answer=row["answer"],
+                user_id="0",
+                document_id=row.get("document_id", 1),
+            )
+            for row in rows
+        ]
+
+    def __run(self, files: list, options: dict) -> dict:
+        rng = random.Random(options["seed"])
+        collection = "retrieval_benchmark"
+        injector = DataInjector(chroma_db_collection_name=collection)
+        if options["vector_store"] == "http":
+            injector.clear_vectors()
+        # Queries are embedded like the collection's chunks
+        embeddings = injector.vector_store.embeddings
+        labeled = (
+            self.__load_labeled_set(options["qa_file"]) if options["qa_file"] else []
+        )
+
+        chunk_count = 0
+        document_id = 0
+        for path in files:
+            document_id += 1
+            chunk_count += len(injector.add_document(path, "0", document_id))
+
+        reranking = dict(get_rag_settings("RERANKING"))
+        reranking["MODE"] = options["rerank"]
+        if options["candidates"]:
+            reranking["CANDIDATES"] = options["candidates"]
+        rerankers = {None: None}
+        if options["rerank"]:
+            rerankers[options["rerank"]] = get_reranker(reranking)
+
+        report = {
+            "config": {
+                "k": options["k"],
+                "scopes": options["scopes"],
+                "rerank": options["rerank"],
+                "candidates": reranking["CANDIDATES"],
+            }
+        }
+        report["sizes"] = []
+        query_vectors = None
+        header = f"{'chunks':>9}{'scope':>11}{'k':>4}{'rerank':>14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'recall':>8}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for size in sorted(options["corpus_sizes"]):
+            started = time.perf_counter()
+            while chunk_count < size:
+                document_id += 1
+                user_id = str(document_id % options["users"])
+                document = generate_document(
+                    options["pages_per_document"], seed=rng.randrange(2**32)
+                )
+                pages = [
+                    Document(
+                        page_content="\n".join(lines),
+                        metadata={"page": page, "source": "synthetic"},
+                    )
+                    for page, lines in enumerate(document.pages)
+                ]
+                chunk_count += len(
+                    injector.add_pages(
+                        pages,
+                        user_id,
+                        document_id,
+                        chunking_strategy=options["chunking_strategy"],
+                    )
+                )
+                # Queries come from the first documents, so the same labeled
+                # set is measured against an ever larger corpus
+                if len(labeled) < options["queries"]:
+                    labeled.extend(
+                        LabeledQuery(fact.question, fact.sentence, user_id, document_id)
+                        for fact in document.facts
+                    )
+            ingest_s = time.perf_counter() - started
+
+            if query_vectors is None:
+                labeled = labeled[: options["queries"]]
+                if not labeled:
+                    raise CommandError("The labeled set is empty.")
+                query_vectors = embed_queries(
+                    embeddings, [query.question for query in labeled]
+                )
+
+            results = []
+            for scope in options["scopes"]:
+                for k in options["k"]:
+                    for rerank, reranker in rerankers.items():
+                        result = self.__measure(
+                            injector.vector_store,
+                            labeled,
+                            query_vectors,
+                            scope,
+                            k,
+                            reranker=reranker,
+                            candidates=reranking["CANDIDATES"],
+                        )
+                        result["rerank"] = rerank
+                        results.append(result)
+                        self.stdout.write(
+                            f"{chunk_count:>9}{scope:>11}{k:>4}"
+                            f"{result['rerank'] or '-':>14}{result['p50_ms']:>9.2f}"
+                            f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                            f"{result['recall']:>8.2f}"
+                        )
+            # A server's index is not visible from here
+            index_mb = (
+                directory_size_mb(collection)
+                if options["vector_store"] == "embedded"
+                else 0.0
+            )
+            self.stdout.write(
+                f"{chunk_count} chunks: ingested in {ingest_s:.1f}s, "
+                f"index {index_mb:.1f} MB, peak RSS {peak_rss_mb():.1f} MB"
+            )
+            report["sizes"].append(
+                {
+                    "chunks": chunk_count,
+                    "ingest_s": ingest_s,
+                    "index_mb": index_mb,
+                    "peak_rss_mb": peak_rss_mb(),
+                    "results": results,
+                }
+            )
+        return report
+
+    def __measure(
+        self,
+        vector_store,
+        labeled,
+        query_vectors,
+        scope,
+        k,
+        reranker=None,
+        candidates=0,
+    ) -> dict:
+        """
+        Time one similarity search per labeled query and compute recall@k,
+        the share of queries with a retrieved chunk containing the answer.
+        With a reranker, `candidates` chunks are retrieved and reranked to k,
+        and the latency includes reranking.
+        """
+        latencies = []
+        hits = 0
+        started = time.perf_counter()
+        for query, vector in zip(labeled, query_vectors):
+            if scope == "none":
+                search_filter = None
+            elif scope == "user":
+                search_filter = build_metadata_filter(query.user_id)
+            else:
+                search_filter = build_metadata_filter(
+                    query.user_id, [query.document_id]
+                )
+            query_started = time.perf_counter()
+            docs = vector_store.similarity_search_by_vector(
+                vector, k=max(k, candidates) if reranker else k, filter=search_filter
+            )
+            if reranker:
+                docs = reranker.rerank(query.question, docs, k)
+            latencies.append((time.perf_counter() - query_started) * 1000)
+            answer = normalize(query.answer)
+            if any(answer in normalize(doc.page_content) for doc in docs):
+                hits += 1
+        summary = summarize_latencies(latencies, time.perf_counter() - started)
+        return {
+            "scope": scope,
+            "k": k,
+            "recall": hits / len(labeled),
+            **summary,
+        }
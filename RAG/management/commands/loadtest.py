@@ -0,0 +1,139 @@
+import json
+import uuid
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from RAG.benchmarks.loadtest import (
+    TokenPool,
+    load_postman_collection,
+    load_recording,
+    run_load,
+    summarize_load,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a recorded request stream, or one synthesized from a Postman "
+        "collection, against a running API with a given concurrency, and "
+        "report a latency histogram and error breakdown per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument(
+            "--recording",
+            help='JSONL stream, one {"method", "path", "json"|"data"|"files", "offset_ms"} per line.',
+        )
+        source.add_argument("--postman", help="Postman collection (v2.1) file.")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument(
+            "--ramp-up",
+            type=float,
+            default=0,
+            help="Seconds over which the workers are started.",
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=1, help="Times the stream is replayed."
+        )
+        parser.add_argument(
+            "--preserve-timing",
+            action="store_true",
+            help="Send requests at their recorded offset_ms instead of back to back.",
+        )
+        parser.add_argument(
+            "--user",
+            action="append",
+            default=[],
+            metavar="USERNAME:PASSWORD",
+            help="Account added to the token pool, can be repeated.",
+        )
+        parser.add_argument(
+            "--signup",
+            type=int,
+            default=0,
+            help="Number of throwaway accounts to create for the token pool.",
+        )
+        parser.add_argument(
+            "--sample-file", help="PDF sent for file fields of Postman requests."
+        )
+        parser.add_argument(
+            "--var",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="Postman variable value, can be repeated.",
+        )
+        parser.add_argument("--timeout", type=float, default=120)
+        parser.add_argument("--json", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if options["recording"]:
+            requests = load_recording(options["recording"])
+        else:
+            variables = dict(item.split("=", 1) for item in options["var"])
+            requests = load_postman_collection(
+                options["postman"], variables, options["sample_file"]
+            )
+        if not requests:
+            raise CommandError("No requests to replay.")
+
+        limits = httpx.Limits(max_connections=options["concurrency"] * 2)
+        with httpx.Client(
+            base_url=options["base_url"], timeout=options["timeout"], limits=limits
+        ) as client:
+            token_pool = TokenPool(client)
+            try:
+                for credentials in options["user"]:
+                    username, _, password = credentials.partition(":")
+                    token_pool.login(username, password)
+                for _ in range(options["signup"]):
+                    token_pool.signup(
+                        f"loadtest-{uuid.uuid4().hex[:12]}", uuid.uuid4().hex
+                    )
+            except httpx.HTTPError as e:
+                raise CommandError(f"Could not fill the token pool: {e}")
+            if not len(token_pool) and any(request.auth for request in requests):
+                self.stderr.write(
+                    "No accounts given (--user/--signup): authenticated endpoints will fail."
+                )
+
+            self.stdout.write(
+                f"Replaying {len(requests)} requests x {options['iterations']} "
+                f"with {options['concurrency']} workers and {len(token_pool)} accounts"
+            )
+            result = run_load(
+                client,
+                requests,
+                concurrency=options["concurrency"],
+                ramp_up_s=options["ramp_up"],
+                iterations=options["iterations"],
+                token_pool=token_pool,
+                preserve_timing=options["preserve_timing"],
+            )
+
+        summary = summarize_load(result)
+        header = f"{'endpoint':<36}{'reqs':>6}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for endpoint, stats in summary.items():
+            self.stdout.write(
+                f"{endpoint:<36}{stats['requests']:>6}{sum(stats['errors'].values()):>8}"
+                f"{stats['throughput_rps']:>9.2f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+            )
+        for endpoint, stats in sorted(result["endpoints"].items()):
+            self.stdout.write(f"\n{endpoint}")
+            for line in stats.histogram.render():
+                self.stdout.write(line)
+            for error, count in stats.errors.most_common():
+                self.stdout.write(f"{'error ' + error:>12} x{count}")
+        self.stdout.write(f"\nTotal wall time: {result['elapsed_s']:.1f}s")
+
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(
+                    {"elapsed_s": result["elapsed_s"], "endpoints": summary},
+                    f,
+                    indent=2,
+                )
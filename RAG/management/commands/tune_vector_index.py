@@ -0,0 +1,444 @@
+import json
+import random
+import shutil
+import tempfile
+import time
+import chromadb
+import numpy as np
+from chromadb.errors import NotFoundError
+from django.core.management.base import BaseCommand, CommandError
+from RAG.benchmarks.stats import directory_size_mb, summarize_latencies
+from RAG.embeddings import embed_queries
+from RAG.gateway import Lane
+from RAG.vector_store import (
+    EMBEDDING_MODEL_KEY,
+    HNSW_PARAMETERS,
+    get_client,
+    get_hnsw_configuration,
+    get_hnsw_parameters,
+    get_vector_store,
+    reset_clients,
+)
+
+SEARCH_EFS = [10, 20, 40, 64, 100, 160, 256, 400]
+
+
+def exact_neighbors(
+    vectors: np.ndarray, queries: np.ndarray, k: int, space: str = "l2"
+) -> np.ndarray:
+    """
+    Finds the `k` nearest vectors of each query by brute force.
+
+    :param vectors: Indexed vectors, one per row.
+    :param queries: Query vectors, one per row.
+    :param k: Number of neighbors.
+    :param space: Distance of the index: "l2", "cosine" or "ip".
+    :return: Row indices into `vectors` of each query's neighbors, unordered.
+    """
+    if space == "cosine":
+        vectors = vectors / np.maximum(
+            np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+        )
+        queries = queries / np.maximum(
+            np.linalg.norm(queries, axis=1, keepdims=True), 1e-12
+        )
+    squared_norms = (vectors**2).sum(axis=1) if space == "l2" else None
+    k = min(k, len(vectors))
+    neighbors = []
+    # Batches bound the (queries x vectors) distance matrix
+    for start in range(0, len(queries), 256):
+        distances = -(queries[start : start + 256] @ vectors.T)
+        if squared_norms is not None:
+            # The query's own norm doesn't change the ranking
+            distances = 2 * distances + squared_norms
+        neighbors.append(np.argpartition(distances, k - 1, axis=1)[:, :k])
+    return np.concatenate(neighbors)
+
+
+def choose_parameters(results: list, target_recall: float) -> dict:
+    """
+    Picks the fastest measured parameters reaching the target recall. Since
+    latency grows with SEARCH_EF, the smallest SEARCH_EF reaching it is taken
+    for each M, so measurement noise doesn't favour a larger one.
+
+    :param results: Measurements with `M`, `SEARCH_EF`, `recall` and `p50_ms`.
+    :param target_recall: Required recall@k.
+    :return: The chosen measurement, or the one with the best recall if none
+        reaches the target.
+    """
+    candidates = []
+    for m in sorted({result["M"] for result in results}):
+        reaching = [
+            result
+            for result in results
+            if result["M"] == m and result["recall"] >= target_recall
+        ]
+        if reaching:
+            candidates.append(min(reaching, key=lambda result: result["SEARCH_EF"]))
+    if candidates:
+        return min(candidates, key=lambda result: result["p50_ms"])
+    return max(results, key=lambda result: (result["recall"], -result["p50_ms"]))
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the HNSW parameters of vector store collections and tune them: "
+        "measure recall@k against brute force search and query latency for a "
+        "sweep of SEARCH_EF (and M) values on scratch copies of a collection, "
+        "and suggest or apply the fastest parameters reaching a target recall. "
+        "The collection's vectors are loaded into memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collections", nargs="+", default=["rag_db"])
+        parser.add_argument(
+            "--report",
+            action="store_true",
+            help="Only print the current and configured parameters.",
+        )
+        parser.add_argument(
+            "--queries-file",
+            help=(
+                "JSONL file of real questions (a `question` per line, like "
+                "benchmark_retrieval's --qa-file), embedded with the "
+                "collection's model. Defaults to a sample of stored vectors."
+            ),
+        )
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--target-recall", type=float, default=0.95)
+        parser.add_argument("--search-ef", nargs="+", type=int, default=SEARCH_EFS)
+        parser.add_argument(
+            "--m",
+            nargs="+",
+            type=int,
+            help="M values to sweep, defaults to the collection's.",
+        )
+        parser.add_argument(
+            "--apply",
+            action="store_true",
+            help=(
+                "Set the chosen SEARCH_EF on the collection, rebuilding it if "
+                "the chosen M differs from its own."
+            ),
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuild the collections with the parameters of RAG_HNSW.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        report = {"collections": []}
+        for name in options["collections"]:
+            report["collections"].append(self.__handle_collection(name, options))
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def __handle_collection(self, name: str, options: dict) -> dict:
+        client = get_client(name)
+        try:
+            collection = client.get_collection(name)
+        except NotFoundError:
+            collection = self.__restore(client, name)
+        parameters = get_hnsw_parameters(collection)
+        hnsw = get_hnsw_configuration(name)
+        configured = {
+            key: hnsw[field] for key, field in HNSW_PARAMETERS.items() if field in hnsw
+        }
+        entry = {
+            "collection": name,
+            "count": collection.count(),
+            "embedding_model": (collection.metadata or {}).get(EMBEDDING_MODEL_KEY),
+            "parameters": parameters,
+            "configured": configured,
+        }
+        self.stdout.write(
+            f"{name}: {entry['count']} vectors ({entry['embedding_model']}), "
+            + ", ".join(f"{key}={value}" for key, value in parameters.items())
+            + (
+                "; RAG_HNSW: "
+                + ", ".join(f"{key}={value}" for key, value in configured.items())
+                if configured
+                else ""
+            )
+        )
+        if options["report"]:
+            return entry
+        if options["rebuild"]:
+            self.__rebuild(client, name, {**parameters, **configured})
+            return entry
+        if not entry["count"]:
+            raise CommandError(f"Collection '{name}' is empty.")
+
+        ids, vectors = self.__load_vectors(collection)
+        queries = self.__load_queries(name, vectors, options)
+        space = parameters["SPACE"] or "l2"
+        k = min(options["k"], len(ids))
+        exact = [
+            {ids[i] for i in row} for row in exact_neighbors(vectors, queries, k, space)
+        ]
+
+        header = f"{'M':>5}{'search_ef':>11}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'build s':>9}{'index MB':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        results = []
+        for m in options["m"] or [parameters["M"]]:
+            results.extend(
+                self.__sweep(
+                    ids,
+                    vectors,
+                    queries,
+                    exact,
+                    k,
+                    {**parameters, "M": m},
+                    # The current SEARCH_EF is measured too, for comparison
+                    sorted({*options["search_ef"], parameters["SEARCH_EF"]}),
+                )
+            )
+        chosen = choose_parameters(results, options["target_recall"])
+        entry["results"] = results
+        entry["chosen"] = chosen
+        self.stdout.write(
+            f"Suggested: M={chosen['M']}, SEARCH_EF={chosen['SEARCH_EF']} "
+            f"(recall@{k} {chosen['recall']:.3f}, p50 {chosen['p50_ms']:.2f} ms)"
+            + (
+                ""
+                if chosen["recall"] >= options["target_recall"]
+                else f"; no setting reached recall {options['target_recall']}"
+            )
+        )
+        self.stdout.write(
+            f'RAG_HNSW = {{"COLLECTIONS": {{"{name}": '
+            f'{{"M": {chosen["M"]}, "SEARCH_EF": {chosen["SEARCH_EF"]}}}}}}}'
+        )
+        if options["apply"]:
+            self.__apply(name, parameters, configured, chosen)
+        return entry
+
+    def __load_vectors(self, collection) -> tuple:
+        ids, batches = [], []
+        batch_size = 5000
+        for offset in range(0, collection.count(), batch_size):
+            rows = collection.get(
+                include=["embeddings"], offset=offset, limit=batch_size
+            )
+            ids.extend(rows["ids"])
+            batches.append(np.asarray(rows["embeddings"], dtype=np.float32))
+        return ids, np.concatenate(batches)
+
+    def __load_queries(self, name: str, vectors: np.ndarray, options: dict):
+        if options["queries_file"]:
+            with open(options["queries_file"]) as f:
+                questions = [
+                    json.loads(line)["question"] for line in f if line.strip()
+                ][: options["queries"]]
+            if not questions:
+                raise CommandError("The queries file is empty.")
+            # Embedded like the collection's chunks, checking its model
+            embeddings = get_vector_store(name, lane=Lane.background).embeddings
+            return np.asarray(embed_queries(embeddings, questions), dtype=np.float32)
+        rng = random.Random(options["seed"])
+        sample = rng.sample(range(len(vectors)), min(options["queries"], len(vectors)))
+        return vectors[sample]
+
+    def __sweep(self, ids, vectors, queries, exact, k, parameters, search_efs):
+        """
+        Builds a scratch index with the parameters and measures each SEARCH_EF.
+        Chroma keeps using the SEARCH_EF an index was loaded with, so the index
+        is reloaded after each change.
+        """
+        path = tempfile.mkdtemp(prefix="rag-hnsw-")
+        configuration = {
+            "hnsw": {
+                HNSW_PARAMETERS[key]: value
+                for key, value in parameters.items()
+                if value is not None
+            }
+        }
+        try:
+            client = chromadb.PersistentClient(path=path)
+            collection = client.create_collection(
+                "scratch", configuration=configuration, embedding_function=None
+            )
+            started = time.perf_counter()
+            batch_size = client.get_max_batch_size()
+            for start in range(0, len(ids), batch_size):
+                collection.add(
+                    ids=ids[start : start + batch_size],
+                    embeddings=vectors[start : start + batch_size],
+                )
+            build_s = time.perf_counter() - started
+            index_mb = directory_size_mb(path)
+
+            results = []
+            for search_ef in search_efs:
+                collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+                reset_clients()
+                collection = chromadb.PersistentClient(path=path).get_collection(
+                    "scratch"
+                )
+                result = {
+                    "M": parameters["M"],
+                    "SEARCH_EF": search_ef,
+                    **self.__measure(collection, queries, exact, k),
+                    "build_s": build_s,
+                    "index_mb": index_mb,
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"{result['M']:>5}{search_ef:>11}{result['recall']:>8.3f}"
+                    f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                    f"{build_s:>9.1f}{index_mb:>10.1f}"
+                )
+            return results
+        finally:
+            reset_clients()
+            shutil.rmtree(path, ignore_errors=True)
+
+    def __measure(self, collection, queries, exact, k) -> dict:
+        """
+        Time one query per vector and compute recall@k, the share of the
+        exact `k` nearest neighbors the index returns.
+        """
+        # Loads the index
+        collection.query(query_embeddings=queries[:1], n_results=k, include=[])
+        latencies = []
+        found = 0
+        started = time.perf_counter()
+        for vector, expected in zip(queries, exact):
+            query_started = time.perf_counter()
+            rows = collection.query(
+                query_embeddings=vector[None, :], n_results=k, include=[]
+            )
+            latencies.append((time.perf_counter() - query_started) * 1000)
+            found += len(expected.intersection(rows["ids"][0]))
+        summary = summarize_latencies(latencies, time.perf_counter() - started)
+        return {"recall": found / (len(queries) * k), **summary}
+
+    def __apply(self, name: str, parameters: dict, configured: dict, chosen: dict):
+        client = get_client(name)
+        if chosen["M"] != parameters["M"]:
+            self.__rebuild(
+                client,
+                name,
+                {**parameters, "M": chosen["M"], "SEARCH_EF": chosen["SEARCH_EF"]},
+            )
+        else:
+            client.get_collection(name).modify(
+                configuration={"hnsw": {"ef_search": chosen["SEARCH_EF"]}}
+            )
+            self.stdout.write(
+                f"Set SEARCH_EF={chosen['SEARCH_EF']} on '{name}'. Running "
+                f"workers, or the Chroma server, use it once they reload the "
+                f"collection (e.g. after a restart)."
+            )
+        for key in ("M", "SEARCH_EF"):
+            if key in configured and configured[key] != chosen[key]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"RAG_HNSW sets {key}={configured[key]} for '{name}', "
+                        f"which is applied when it is opened; update it to "
+                        f"{chosen[key]}."
+                    )
+                )
+
+    def __restore(self, client, name: str):
+        """
+        Renames back a collection an interrupted rebuild moved aside before
+        the rebuilt one took its place.
+        """
+        try:
+            collection = client.get_collection(f"{name}-old")
+        except NotFoundError:
+            raise CommandError(f"Collection '{name}' doesn't exist.")
+        collection.modify(name=name)
+        self.stdout.write(
+            self.style.WARNING(
+                f"Restored '{name}' from '{name}-old', left by an interrupted rebuild."
+            )
+        )
+        return collection
+
+    def __drop_leftover(self, client, name: str, leftover_name: str, count: int):
+        """
+        Deletes a collection left over by an interrupted rebuild, unless it
+        may hold the only copy of the vectors.
+        """
+        try:
+            leftover = client.get_collection(leftover_name)
+        except NotFoundError:
+            return
+        if not count and leftover.count():
+            raise CommandError(
+                f"'{name}' is empty but '{leftover_name}', left by an interrupted "
+                f"rebuild, holds {leftover.count()} vectors. Check which one to "
+                f"keep and delete the other before rebuilding."
+            )
+        client.delete_collection(leftover_name)
+
+    def __rebuild(self, client, name: str, parameters: dict):
+        """
+        Copies a collection into one built with the parameters, then swaps
+        them: the old collection is renamed aside, the rebuilt one renamed
+        into place, and only then the old one is dropped. The rebuild stops
+        if vectors were added or deleted during the copy.
+        """
+        collection = client.get_collection(name)
+        count = collection.count()
+        configuration = {
+            HNSW_PARAMETERS[key]: value
+            for key, value in parameters.items()
+            if value is not None
+        }
+        # Legacy `hnsw:*` metadata would override the new configuration
+        metadata = {
+            key: value
+            for key, value in (collection.metadata or {}).items()
+            if not key.startswith("hnsw:")
+        }
+        rebuild_name, old_name = f"{name}-rebuild", f"{name}-old"
+        for leftover_name in (rebuild_name, old_name):
+            self.__drop_leftover(client, name, leftover_name, count)
+        rebuilt = client.create_collection(
+            rebuild_name,
+            configuration={"hnsw": configuration},
+            metadata=metadata or None,
+            embedding_function=None,
+        )
+        started = time.perf_counter()
+        batch_size = client.get_max_batch_size()
+        for offset in range(0, count, batch_size):
+            rows = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                offset=offset,
+                limit=batch_size,
+            )
+            rebuilt.add(
+                ids=rows["ids"],
+                embeddings=rows["embeddings"],
+                documents=rows["documents"],
+                metadatas=rows["metadatas"],
+            )
+        if rebuilt.count() != count:
+            client.delete_collection(rebuild_name)
+            raise CommandError(
+                f"'{name}' changed while it was copied; rebuild it again while "
+                f"nothing is being ingested."
+            )
+        collection.modify(name=old_name)
+        try:
+            rebuilt.modify(name=name)
+        except Exception:
+            collection.modify(name=name)
+            raise
+        client.delete_collection(old_name)
+        self.stdout.write(
+            f"Rebuilt '{name}' with "
+            + ", ".join(f"{key}={value}" for key, value in parameters.items())
+            + f" in {time.perf_counter() - started:.1f}s. Restart running "
+            f"workers so they open the new collection."
+        )
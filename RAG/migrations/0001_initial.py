@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="NodeMetric",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("request_id", models.CharField(db_index=True, max_length=32)),
+                ("thread_id", models.CharField(max_length=255)),
+                ("node", models.CharField(max_length=50)),
+                ("step", models.PositiveIntegerField()),
+                ("duration_ms", models.FloatField()),
+                ("input_tokens", models.PositiveIntegerField(default=0)),
+                ("output_tokens", models.PositiveIntegerField(default=0)),
+                ("cached_tokens", models.PositiveIntegerField(default=0)),
+                ("llm_calls", models.PositiveSmallIntegerField(default=0)),
+                ("tool_latency_ms", models.JSONField(default=dict)),
+                ("route", models.CharField(blank=True, max_length=50)),
+                ("error", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "verbose_name": "Node Metric",
+                "verbose_name_plural": "Node Metrics",
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import models
+
+
+# Create your models here.
+class NodeMetric(models.Model):
+    """Timing and usage of one CorrectiveRAG graph node execution."""
+
+    request_id = models.CharField(max_length=32, db_index=True)
+    thread_id = models.CharField(max_length=255)
+    node = models.CharField(max_length=50)
+    step = models.PositiveIntegerField()
+    duration_ms = models.FloatField()
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    llm_calls = models.PositiveSmallIntegerField(default=0)
+    tool_latency_ms = models.JSONField(default=dict)
+    route = models.CharField(max_length=50, blank=True)
+    error = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.node} ({self.duration_ms:.0f} ms) - {self.request_id}"
+
+    class Meta:
+        verbose_name = "Node Metric"
+        verbose_name_plural = "Node Metrics"
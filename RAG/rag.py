@@ -1,11 +1,10 @@
 from typing import List
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
-from langchain.chat_models import init_chat_model
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from .chunking import split_documents
+from .gateway import Lane, get_gateway
+from .vector_store import get_vector_store
 
 
 class RAG:
@@ -15,23 +14,22 @@ class RAG:
     """
 
     def __init__(self):
-        self.__llm = init_chat_model("gpt-4o-mini", model_provider="openai")
-        self.__embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+        gateway = get_gateway()
+        self.__llm = gateway.chat_model(Lane.interactive)
         self.chroma_db_collection_name = "rag_db"
         self.chroma_db_path = f"./{self.chroma_db_collection_name}"
-        self.__vector_store = Chroma(
-            collection_name=self.chroma_db_collection_name,
-            embedding_function=self.__embeddings,
-            persist_directory=self.chroma_db_path,
+        self.__vector_store = get_vector_store(
+            self.chroma_db_collection_name, lane=Lane.interactive
         )
-        # Defining the prompt template for querying the LLM
+        # Defining the prompt template for querying the LLM, with the
+        # question last so calls over the same context share a cacheable prefix
         self.__prompt_template = ChatPromptTemplate(
             [
                 (
                     "system",
                     "You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.",
                 ),
-                ("user", "Question: {question}\nContext: {context}\nAnswer:"),
+                ("user", "Context: {context}\nQuestion: {question}\nAnswer:"),
             ]
         )
 
@@ -48,21 +46,24 @@ class RAG:
             pages.append(page)
         return pages
 
-    def __split_text(self, pages: List, chunk_size=1000, chunk_overlap=200):
+    def __split_text(
+        self, pages: List, strategy=None, chunk_size=None, chunk_overlap=None
+    ):
         """
         Split the given document pages into smaller chunks for easier processing.
 
         :param pages: List of Document objects representing the pages.
-        :param chunk_size: Maximum size of each chunk.
-        :param chunk_overlap: Overlap between consecutive chunks.
+        :param strategy: Chunking strategy, defaults to the configured one.
+        :param chunk_size: Chunk budget in tokens.
+        :param chunk_overlap: Overlap between consecutive chunks in tokens.
         :return: List of Document chunks.
         """
-        recursive_text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        return split_documents(
+            pages,
+            strategy=strategy,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
         )
-        # Splitting the pages into chunks
-        splits = recursive_text_splitter.split_documents(pages)
-        return splits
 
     def __add_documents_to_db(self, docs: List[Document]):
         """
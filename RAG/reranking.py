@@ -0,0 +1,269 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from enum import Enum
+from typing import List
+from langchain_core.documents import Document
+from .context import STOPWORDS, WORD_PATTERN
+from .embeddings import download_model, encode_inputs, load_onnx_session, load_tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+class RerankingMode(Enum):
+    # Vector rank combined with a BM25 score of the candidates
+    hybrid = "hybrid"
+    # Local ONNX cross-encoder scoring each (question, chunk) pair
+    cross_encoder = "cross_encoder"
+
+
+def _words(text: str) -> List[str]:
+    return [
+        word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS
+    ]
+
+
+class HybridReranker:
+    """
+    Reranks vector search candidates by combining their vector rank with a
+    BM25 score computed over the candidates themselves. Catches exact terms
+    (names, codes, numbers) that embeddings blur, at a cost of about a
+    millisecond for 50 candidates.
+    """
+
+    def __init__(self, lexical_weight: float = 0.5):
+        """
+        :param lexical_weight: Weight of the BM25 score, between 0 and 1.
+        """
+        self.lexical_weight = lexical_weight
+
+    def __bm25(self, question: str, documents: List[Document]) -> List[float]:
+        k1, b = 1.5, 0.75
+        texts = [Counter(_words(doc.page_content)) for doc in documents]
+        lengths = [sum(words.values()) for words in texts]
+        average_length = sum(lengths) / len(lengths) or 1
+        scores = [0.0] * len(documents)
+        for term in set(_words(question)):
+            frequency = sum(1 for words in texts if term in words)
+            if not frequency:
+                continue
+            idf = math.log(1 + (len(texts) - frequency + 0.5) / (frequency + 0.5))
+            for i, (words, length) in enumerate(zip(texts, lengths)):
+                count = words[term]
+                if count:
+                    scores[i] += (
+                        idf
+                        * count
+                        * (k1 + 1)
+                        / (count + k1 * (1 - b + b * length / average_length))
+                    )
+        return scores
+
+    def rerank(
+        self, question: str, documents: List[Document], k: int
+    ) -> List[Document]:
+        """
+        :param question: The question the documents were retrieved for.
+        :param documents: Candidates, in vector similarity order.
+        :param k: Number of documents to keep.
+        :return: The best `k` documents, best first.
+        """
+        if not documents:
+            return []
+        count = len(documents)
+        lexical = self.__bm25(question, documents)
+        best = max(lexical) or 1
+        # Documents arrive in vector order, so their index is their vector rank
+        scores = [
+            (1 - self.lexical_weight) * (1 - rank / count)
+            + self.lexical_weight * lexical[rank] / best
+            for rank in range(count)
+        ]
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        return [documents[i] for i in order[:k]]
+
+
+class CrossEncoderReranker:
+    """
+    Reranks vector search candidates with a cross-encoder run on the CPU
+    with ONNX Runtime, which reads the question and each chunk together.
+    Candidates are scored in batches, in vector rank order and in parallel;
+    batches not scored within the time budget are skipped, so their
+    candidates keep their vector rank after the scored ones. Once its
+    budget runs out, a call's queued batches are dropped and its running
+    ones terminated, so they don't hold up the batches of later calls.
+    `stats` counts the calls that ran out of time.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        model_file: str = "onnx/model_quantized.onnx",
+        max_length: int = 256,
+        batch_size: int = 16,
+        threads: int | None = None,
+        timeout_ms: float | None = None,
+        session=None,
+        tokenizer=None,
+    ):
+        """
+        :param model_path: Directory holding the model and its `tokenizer.json`.
+        :param model_file: Path of the ONNX model within `model_path`.
+        :param max_length: Tokens per (question, chunk) pair, longer pairs are truncated.
+        :param batch_size: Pairs per model run.
+        :param threads: Batches run in parallel, defaults to the CPU count.
+        :param timeout_ms: Time budget of a `rerank` call; None waits for all batches.
+        :param session: ONNX Runtime session, loaded from `model_path` if None.
+        :param tokenizer: `tokenizers.Tokenizer`, loaded from `model_path` if None.
+        """
+        self.batch_size = batch_size
+        self.timeout_ms = timeout_ms
+        self.__session = session or load_onnx_session(model_path, model_file)
+        self.__tokenizer = load_tokenizer(model_path, max_length, tokenizer)
+        self.__input_names = {
+            model_input.name for model_input in self.__session.get_inputs()
+        }
+        self.__executor = ThreadPoolExecutor(
+            max_workers=threads or os.cpu_count() or 1,
+            thread_name_prefix="cross-encoder",
+        )
+        self.stats = Counter()
+        self.__stats_lock = threading.Lock()
+
+    def __count(self, name: str, value: int = 1):
+        with self.__stats_lock:
+            self.stats[name] += value
+
+    def __run_options(self):
+        """
+        Options shared by the model runs of a call, whose `terminate` flag
+        stops them; None if onnxruntime is not installed (custom sessions).
+        """
+        try:
+            import onnxruntime
+        except ImportError:
+            return None
+        return onnxruntime.RunOptions()
+
+    def __score(
+        self,
+        question: str,
+        documents: List[Document],
+        deadline: float | None,
+        run_options,
+    ) -> List[float] | None:
+        if deadline is not None and time.perf_counter() >= deadline:
+            # The call already returned without this batch
+            return None
+        inputs = encode_inputs(
+            self.__tokenizer,
+            self.__input_names,
+            [(question, doc.page_content) for doc in documents],
+        )
+        logits = self.__session.run(None, inputs, run_options)[0]
+        # Relevance is the single logit, or the last (positive) class
+        return logits.reshape(len(documents), -1)[:, -1].tolist()
+
+    def rerank(
+        self, question: str, documents: List[Document], k: int
+    ) -> List[Document]:
+        """
+        :param question: The question the documents were retrieved for.
+        :param documents: Candidates, in vector similarity order.
+        :param k: Number of documents to keep.
+        :return: The best `k` documents, best first.
+        """
+        if not documents:
+            return []
+        started = time.perf_counter()
+        timeout = self.timeout_ms / 1000 if self.timeout_ms is not None else None
+        deadline = started + timeout if timeout is not None else None
+        run_options = self.__run_options() if timeout is not None else None
+        batches = [
+            documents[start : start + self.batch_size]
+            for start in range(0, len(documents), self.batch_size)
+        ]
+        futures = [
+            self.__executor.submit(self.__score, question, batch, deadline, run_options)
+            for batch in batches
+        ]
+        done, pending = wait(futures, timeout=timeout)
+        if pending and run_options is not None:
+            # Stops the model runs of this call that are still going
+            run_options.terminate = True
+
+        scored, unscored = [], []
+        skipped = 0
+        for batch, future in zip(batches, futures):
+            if future not in done:
+                # Queued batches are cancelled, or skipped once they start
+                future.cancel()
+                skipped += 1
+                unscored.extend(batch)
+            elif future.exception() is not None:
+                logger.warning("Reranking batch failed: %r", future.exception())
+                self.__count("failed_batches")
+                unscored.extend(batch)
+            elif future.result() is None:
+                skipped += 1
+                unscored.extend(batch)
+            else:
+                scored.extend(zip(future.result(), batch))
+        self.__count("reranks")
+        if skipped:
+            self.__count("timeouts")
+            self.__count("skipped_batches", skipped)
+        if unscored:
+            logger.info(
+                "Reranking scored %d of %d candidates within %s ms",
+                len(scored),
+                len(documents),
+                self.timeout_ms,
+                extra={"duration_ms": (time.perf_counter() - started) * 1000},
+            )
+        scored.sort(key=lambda pair: -pair[0])
+        return ([doc for _, doc in scored] + unscored)[:k]
+
+
+_cross_encoders = {}
+_cross_encoders_lock = threading.Lock()
+
+
+def get_reranker(options: dict):
+    """
+    Returns the reranker configured by `RAG_RERANKING`; cross-encoders are
+    loaded once per process.
+
+    :param options: Resolved `RAG_RERANKING` settings.
+    :return: A reranker with a `rerank(question, documents, k)` method, or
+        None if reranking is disabled.
+    """
+    if not options["MODE"]:
+        return None
+    mode = RerankingMode(options["MODE"])
+    if mode == RerankingMode.hybrid:
+        return HybridReranker(lexical_weight=options["HYBRID_LEXICAL_WEIGHT"])
+    model_path = options["CROSS_ENCODER_MODEL_PATH"]
+    key = (
+        model_path or options["CROSS_ENCODER_MODEL"],
+        options["CROSS_ENCODER_MODEL_FILE"],
+        options["TIMEOUT_MS"],
+    )
+    with _cross_encoders_lock:
+        if key not in _cross_encoders:
+            _cross_encoders[key] = CrossEncoderReranker(
+                model_path
+                or download_model(
+                    options["CROSS_ENCODER_MODEL"], options["CROSS_ENCODER_MODEL_FILE"]
+                ),
+                model_file=options["CROSS_ENCODER_MODEL_FILE"],
+                max_length=options["CROSS_ENCODER_MAX_LENGTH"],
+                batch_size=options["CROSS_ENCODER_BATCH_SIZE"],
+                threads=options["CROSS_ENCODER_THREADS"],
+                timeout_ms=options["TIMEOUT_MS"],
+            )
+        return _cross_encoders[key]
@@ -0,0 +1,119 @@
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain_core.documents import Document
+
+
+class RetrievalExpansionMode(Enum):
+    # Several LLM-generated rewrites of the question
+    multi_query = "multi_query"
+    # A hypothetical answer to the question (HyDE)
+    hyde = "hyde"
+
+
+def build_metadata_filter(user_id: str, document_ids: List[int] | None = None):
+    """
+    Build the vector store metadata filter scoping retrieval to a user
+    and, when given, to a subset of that user's documents.
+
+    :param user_id: ID of the user whose chunks may be retrieved.
+    :param document_ids: IDs of the selected `api.Document` objects.
+    :return: A Chroma `where` filter.
+    """
+    if not document_ids:
+        return {"user_id": str(user_id)}
+    return {
+        "$and": [
+            {"user_id": str(user_id)},
+            {"document_id": {"$in": list(document_ids)}},
+        ]
+    }
+
+
+def search_by_vectors(
+    vector_store,
+    vectors: List[List[float]],
+    k: int = 4,
+    filter: dict | None = None,
+    max_workers: int = 4,
+) -> List[List[Document]]:
+    """
+    Run one similarity search per query vector concurrently.
+
+    :param vector_store: Vector store supporting `similarity_search_by_vector`.
+    :param vectors: Query embeddings, e.g. from a single `embed_documents` call.
+    :param k: Number of documents to retrieve per query.
+    :param filter: Metadata filter applied to every search.
+    :param max_workers: Maximum number of concurrent searches.
+    :return: One list of retrieved documents per query vector, in order.
+    """
+    if not vectors:
+        return []
+
+    def search(vector):
+        return vector_store.similarity_search_by_vector(vector, k=k, filter=filter)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(vectors))) as executor:
+        return list(executor.map(search, vectors))
+
+
+def search_by_vectors_batched(
+    vector_store,
+    vectors: List[List[float]],
+    k: int = 4,
+    filter: dict | None = None,
+) -> List[List[Document]]:
+    """
+    Run the similarity searches of several query vectors in a single call.
+    Chroma answers a list of query embeddings with one collection query;
+    other vector stores fall back to `search_by_vectors`.
+
+    :param vector_store: Vector store, ideally a langchain Chroma store.
+    :param vectors: Query embeddings, e.g. from a single `embed_documents` call.
+    :param k: Number of documents to retrieve per query.
+    :param filter: Metadata filter applied to every search.
+    :return: One list of retrieved documents per query vector, in order.
+    """
+    collection = getattr(vector_store, "_collection", None)
+    if collection is None or not hasattr(collection, "query"):
+        return search_by_vectors(vector_store, vectors, k=k, filter=filter)
+    if not vectors:
+        return []
+    results = collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        where=filter,
+        include=["documents", "metadatas"],
+    )
+    return [
+        [
+            Document(id=id, page_content=text, metadata=metadata or {})
+            for id, text, metadata in zip(ids, texts, metadatas)
+        ]
+        for ids, texts, metadatas in zip(
+            results["ids"], results["documents"], results["metadatas"]
+        )
+    ]
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Document]], limit: int | None = None, rank_constant=60
+) -> List[Document]:
+    """
+    Merge several ranked result lists into one, removing duplicates.
+    Each document scores `sum(1 / (rank_constant + rank))` over the lists it is in.
+
+    :param result_lists: Ranked lists of retrieved documents.
+    :param limit: Maximum number of documents to return.
+    :param rank_constant: Damping constant of the fusion formula.
+    :return: Deduplicated documents ordered by fused score.
+    """
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc.id or doc.page_content
+            documents.setdefault(key, doc)
+            scores[key] = scores.get(key, 0) + 1 / (rank_constant + rank + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:limit]]
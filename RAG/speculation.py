@@ -0,0 +1,138 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Executor, Future
+from langchain_core.runnables import RunnableLambda
+from .gateway import user_context
+from .instrumentation import InstrumentationCallbackHandler, emit_records
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_NODE = "speculation"
+
+# Process-wide totals, including the work of discarded speculations
+stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(**amounts):
+    with _stats_lock:
+        stats.update(amounts)
+
+
+class SpeculationCancelled(Exception):
+    """Raised inside a speculative branch once it is no longer needed."""
+
+
+class Speculation:
+    """
+    A branch of work started before it is known to be needed. The branch
+    function receives a `checkpoint` callable to call between its steps,
+    which stops the branch once it is cancelled; a step already running
+    (e.g. an LLM call) completes, but its result is discarded.
+
+    The branch's LLM and tool usage is recorded as a `speculation` node
+    record whose route is "used" or "discarded", and discarded work is
+    added to the `wasted_*` totals of `stats`.
+    """
+
+    def __init__(self, executor: Executor, fn, user_id=None, parent_config=None):
+        """
+        :param executor: Executor the branch runs on.
+        :param fn: Function of `checkpoint` running the branch.
+        :param user_id: User the branch's LLM calls are attributed to.
+        :param parent_config: Config of the graph node starting the branch,
+            to record the branch with the run's instrumentation.
+        """
+        self.__cancelled = threading.Event()
+        self.__lock = threading.Lock()
+        self.__outcome = None
+        self.__records = None
+        self.__handler = None
+        self.__step = 0
+        if parent_config is not None:
+            parent = _find_instrumentation(parent_config)
+            if parent is not None:
+                self.__handler = InstrumentationCallbackHandler(
+                    thread_id=parent.thread_id, request_id=parent.request_id
+                )
+                self.__step = parent_config.get("metadata", {}).get("langgraph_step", 0)
+        _count(started=1)
+        self.__future: Future = executor.submit(self.__run, fn, user_id)
+        self.__future.add_done_callback(self.__finished)
+
+    def __checkpoint(self):
+        if self.__cancelled.is_set():
+            raise SpeculationCancelled()
+
+    def __run(self, fn, user_id):
+        config = {"run_name": SPECULATION_NODE}
+        if self.__handler is not None:
+            config["callbacks"] = [self.__handler]
+            config["metadata"] = {
+                "langgraph_node": SPECULATION_NODE,
+                "langgraph_step": self.__step,
+            }
+        runnable = RunnableLambda(lambda _: fn(self.__checkpoint))
+        with user_context(user_id):
+            return runnable.invoke(None, config)
+
+    def result(self, timeout: float | None = None):
+        """
+        Uses the branch: waits for it and returns its result.
+        """
+        self.__decide("used")
+        return self.__future.result(timeout)
+
+    def cancel(self):
+        """
+        Discards the branch: it stops at its next checkpoint.
+        """
+        self.__cancelled.set()
+        self.__future.cancel()
+        self.__decide("discarded")
+
+    def __decide(self, outcome: str):
+        with self.__lock:
+            if self.__outcome is not None:
+                return
+            self.__outcome = outcome
+        _count(**{outcome: 1})
+        self.__report()
+
+    def __finished(self, future: Future):
+        records = self.__handler.finish() if self.__handler is not None else []
+        with self.__lock:
+            self.__records = records
+        self.__report()
+
+    def __report(self):
+        """
+        Emits the branch's records once it finished and its outcome is known.
+        """
+        with self.__lock:
+            if self.__outcome is None or self.__records is None:
+                return
+            records, self.__records = self.__records, []
+        for record in records:
+            record.route = self.__outcome
+        if self.__outcome == "discarded":
+            wasted = {
+                "wasted_llm_calls": sum(r.llm_calls for r in records),
+                "wasted_input_tokens": sum(r.input_tokens for r in records),
+                "wasted_output_tokens": sum(r.output_tokens for r in records),
+                "wasted_ms": round(sum(r.duration_ms for r in records)),
+            }
+            _count(**wasted)
+            if wasted["wasted_llm_calls"]:
+                logger.info("Discarded speculative work: %s", wasted)
+        emit_records(records)
+
+
+def _find_instrumentation(config) -> InstrumentationCallbackHandler | None:
+    callbacks = config.get("callbacks")
+    handlers = getattr(callbacks, "handlers", callbacks) or []
+    for handler in handlers:
+        if isinstance(handler, InstrumentationCallbackHandler):
+            return handler
+    return None
@@ -0,0 +1,113 @@
+import os
+import tempfile
+from unittest import TestCase
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from RAG.benchmarks.corpus import generate_document, write_pdf
+from RAG.benchmarks.fake_openai import FakeOpenAIServer
+from RAG.benchmarks.stats import (
+    directory_size_mb,
+    percentile,
+    summarize_latencies,
+)
+from RAG.corrective_rag import RAGDocumentGrade, RAGDocumentGraderResponse
+
+
+class TestStats(TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertAlmostEqual(percentile(values, 50), 50.5)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summarize_latencies(self):
+        summary = summarize_latencies([10, 20, 30, 40], elapsed_s=2)
+        self.assertEqual(summary["requests"], 4)
+        self.assertEqual(summary["throughput_rps"], 2)
+        self.assertEqual(summary["max_ms"], 40)
+
+    def test_directory_size_mb(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "index"))
+            with open(os.path.join(directory, "index", "data.bin"), "wb") as f:
+                f.write(b"0" * 1024 * 1024)
+            self.assertAlmostEqual(directory_size_mb(directory), 1.0)
+
+
+class TestCorpus(TestCase):
+    def test_pdf_contains_planted_facts(self):
+        """Test that the generated PDF is readable and keeps the planted facts"""
+        document = generate_document(2, seed=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.pdf")
+            write_pdf(path, document.pages)
+            pages = PyPDFLoader(path).load()
+        self.assertEqual(len(pages), 2)
+        text = " ".join(" ".join(page.page_content.split()) for page in pages)
+        for fact in document.facts:
+            self.assertIn(fact.sentence, text)
+
+    def test_generation_is_reproducible(self):
+        self.assertEqual(
+            generate_document(1, seed=3).facts, generate_document(1, seed=3).facts
+        )
+
+
+class TestFakeOpenAIServer(TestCase):
+    def setUp(self):
+        self.server = FakeOpenAIServer().start()
+        self.addCleanup(self.server.stop)
+
+    def test_embeddings(self):
+        """Test that similar texts get closer embeddings, and calls are counted"""
+        embeddings = OpenAIEmbeddings(
+            base_url=self.server.url,
+            api_key="test",
+            check_embedding_ctx_length=False,
+        )
+        query, close, far = embeddings.embed_documents(
+            ["reactor cost", "the reactor cost is high", "weather in paris"]
+        )
+        similarity = lambda a, b: sum(x * y for x, y in zip(a, b))
+        self.assertGreater(similarity(query, close), similarity(query, far))
+        self.assertEqual(self.server.counters["embedding_calls"], 1)
+        self.assertEqual(self.server.counters["embedding_inputs"], 3)
+
+    def test_structured_output(self):
+        llm = ChatOpenAI(model="gpt-4o-mini", base_url=self.server.url, api_key="test")
+        response = llm.with_structured_output(RAGDocumentGraderResponse).invoke(
+            "Is this relevant?"
+        )
+        self.assertEqual(response.grade, RAGDocumentGrade.relevant)
+
+        self.server.irrelevant_rate = 1.0
+        response = llm.with_structured_output(RAGDocumentGraderResponse).invoke(
+            "Is this relevant?"
+        )
+        self.assertEqual(response.grade, RAGDocumentGrade.irrelevant)
+
+    def test_tool_calls(self):
+        """Test that the first tool is called until a tool result is present"""
+
+        def web_search(query: str) -> str:
+            """Search the web."""
+            return query
+
+        llm = ChatOpenAI(model="gpt-4o-mini", base_url=self.server.url, api_key="test")
+        response = llm.bind_tools([web_search]).invoke("What is new?")
+        self.assertEqual(response.tool_calls[0]["name"], "web_search")
+        self.assertEqual(self.server.counters["chat_calls"], 1)
+
+    def test_prompt_caching(self):
+        """Test that a repeated long prompt prefix is reported as cached"""
+        llm = ChatOpenAI(model="gpt-4o-mini", base_url=self.server.url, api_key="test")
+        context = "The reactor cost is high. " * 400
+        first = llm.invoke(f"{context}\nQuestion: What is the cost?")
+        second = llm.invoke(f"{context}\nQuestion: Who leads it?")
+
+        self.assertEqual(first.usage_metadata["input_token_details"]["cache_read"], 0)
+        cached = second.usage_metadata["input_token_details"]["cache_read"]
+        self.assertGreaterEqual(cached, 2560)
+        self.assertLess(cached, second.usage_metadata["input_tokens"])
+        self.assertEqual(self.server.counters["cached_tokens"], cached)
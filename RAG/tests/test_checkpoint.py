@@ -0,0 +1,59 @@
+from typing import Annotated, TypedDict
+from unittest import TestCase
+from unittest.mock import patch
+from langgraph.graph import END, START, StateGraph
+from RAG.checkpoint import BoundedMemorySaver
+
+
+class State(TypedDict):
+    turns: Annotated[list, lambda old, new: old + new]
+
+
+def build_graph(saver):
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("first", lambda state: {"turns": ["first"]})
+    graph_builder.add_node("second", lambda state: {"turns": ["second"]})
+    graph_builder.add_edge(START, "first")
+    graph_builder.add_edge("first", "second")
+    graph_builder.add_edge("second", END)
+    return graph_builder.compile(checkpointer=saver)
+
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+class TestBoundedMemorySaver(TestCase):
+    def test_keeps_latest_checkpoint(self):
+        saver = BoundedMemorySaver()
+        graph = build_graph(saver)
+        for _ in range(5):
+            graph.invoke({"turns": []}, config("t"))
+        self.assertEqual(
+            graph.get_state(config("t")).values["turns"], ["first", "second"] * 5
+        )
+        checkpoints = saver.storage["t"][""]
+        self.assertEqual(len(checkpoints), 1)
+        # One value per channel, and writes, of the latest checkpoint only
+        self.assertLessEqual(len(saver.blobs), 5)
+        self.assertTrue(all(key[2] in checkpoints for key in saver.writes))
+
+    def test_evicts_least_recently_used_threads(self):
+        saver = BoundedMemorySaver(max_threads=2)
+        graph = build_graph(saver)
+        for thread_id in ("a", "b"):
+            graph.invoke({"turns": []}, config(thread_id))
+        graph.get_state(config("a"))
+        graph.invoke({"turns": []}, config("c"))
+        self.assertEqual(set(saver.storage), {"a", "c"})
+        self.assertFalse(any(key[0] == "b" for key in saver.blobs))
+
+    def test_evicts_idle_threads(self):
+        saver = BoundedMemorySaver(thread_ttl=60)
+        graph = build_graph(saver)
+        with patch("RAG.checkpoint.time.monotonic", return_value=0):
+            graph.invoke({"turns": []}, config("idle"))
+        with patch("RAG.checkpoint.time.monotonic", return_value=61):
+            graph.invoke({"turns": []}, config("active"))
+        self.assertEqual(set(saver.storage), {"active"})
+        self.assertEqual(graph.get_state(config("idle")).values, {})
@@ -0,0 +1,69 @@
+from unittest import TestCase
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from RAG.chunking import ChunkingStrategy, is_heading, split_documents
+from RAG.tokens import count_tokens
+
+
+class TestChunking(TestCase):
+    def setUp(self):
+        self.long_page = Document(
+            page_content=" ".join(f"Sentence number {i} is here." for i in range(200)),
+            metadata={"page": 0},
+        )
+        self.short_page = Document(page_content="A short page.", metadata={"page": 1})
+
+    def test_token_strategy_respects_budget(self):
+        """Test that token chunks never exceed the token budget"""
+        chunks = split_documents(
+            [self.long_page], strategy="tokens", chunk_size=50, chunk_overlap=0
+        )
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk.page_content), 50)
+
+    def test_characters_strategy_matches_former_splitter(self):
+        """Test that the characters strategy splits like the 1000/200 splitter"""
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        expected = splitter.split_documents([self.long_page, self.short_page])
+        chunks = split_documents(
+            [self.long_page, self.short_page],
+            strategy="characters",
+            chunk_size=50,
+            chunk_overlap=0,
+        )
+        self.assertEqual(chunks, expected)
+
+    def test_pages_strategy_keeps_small_pages_whole(self):
+        """Test that pages within the budget are kept as single chunks"""
+        chunks = split_documents(
+            [self.short_page, self.long_page],
+            strategy=ChunkingStrategy.pages,
+            chunk_size=50,
+            chunk_overlap=0,
+        )
+        self.assertEqual(chunks[0].page_content, "A short page.")
+        self.assertEqual(chunks[0].metadata["page"], 1)
+        self.assertGreater(len(chunks), 2)
+
+    def test_headings_strategy_tracks_sections(self):
+        """Test that heading-aware chunks carry the heading of their section"""
+        page = Document(
+            page_content="1. Introduction\nIntro text.\n2. Results\nResult text.",
+            metadata={"page": 0},
+        )
+        chunks = split_documents(
+            [page], strategy="headings", chunk_size=5, chunk_overlap=0
+        )
+        self.assertEqual(chunks[0].metadata["heading"], "1. Introduction")
+        self.assertEqual(chunks[-1].metadata["heading"], "2. Results")
+
+    def test_is_heading(self):
+        self.assertTrue(is_heading("## Setup"))
+        self.assertTrue(is_heading("2.1 Results"))
+        self.assertTrue(is_heading("TERMS AND CONDITIONS"))
+        self.assertFalse(is_heading("This is an ordinary sentence."))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            split_documents([self.short_page], strategy="unknown")
@@ -0,0 +1,47 @@
+from unittest import TestCase
+from RAG.context import ContextPacker
+
+
+class TestContextPacker(TestCase):
+    def setUp(self):
+        self.question = "What is the capital of France?"
+
+    def test_pack_respects_token_budget(self):
+        packer = ContextPacker(token_budget=40)
+        texts = [
+            f"France has a capital city called Paris, fact {i}." for i in range(50)
+        ]
+        context = packer.pack(self.question, texts)
+        self.assertTrue(context)
+        self.assertLessEqual(packer.count(context), 40)
+
+    def test_pack_drops_near_duplicates(self):
+        packer = ContextPacker(token_budget=1000)
+        text = "Paris is the capital and most populous city of France."
+        context = packer.pack(self.question, [text, text + " ", "Lyon is in France."])
+        self.assertEqual(context.count("Paris is the capital"), 1)
+        self.assertIn("Lyon", context)
+
+    def test_pack_trims_to_relevant_sentences(self):
+        packer = ContextPacker(token_budget=1000)
+        text = (
+            "Bananas are yellow. Apples are red. Grapes are purple. "
+            "Paris is the capital of France. Cherries are red. "
+            "Plums are purple. Oranges are orange."
+        )
+        context = packer.pack(self.question, [text])
+        self.assertIn("Paris is the capital of France.", context)
+        self.assertNotIn("Bananas", context)
+        self.assertNotIn("Oranges", context)
+
+    def test_pack_ranks_by_question_overlap(self):
+        packer = ContextPacker(token_budget=1000, trim_to_relevant=False)
+        context = packer.pack(
+            self.question, ["Unrelated text.", "The capital of France is Paris."]
+        )
+        self.assertTrue(context.startswith("The capital of France is Paris."))
+
+    def test_pack_text_keeps_short_text(self):
+        packer = ContextPacker(token_budget=1000)
+        text = "Short tool output."
+        self.assertEqual(packer.pack_text(self.question, text), text)
@@ -1,13 +1,63 @@
+import time
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
+import httpx
+import openai
+from django.test import override_settings
+from RAG import speculation
 from RAG.corrective_rag import (
+    GRADED_ANSWER_PROMPT,
+    GRADER_PROMPT,
+    RESPONDER_PROMPT,
+    AnswerMode,
     CorrectiveRAG,
     CRAGState,
     RAGDocumentGraderResponse,
     RAGDocumentGrade,
+    RAGGradedAnswerResponse,
+    RAGQueryVariantsResponse,
 )
+from RAG.reranking import HybridReranker
 from langchain_core.documents import Document
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+from langgraph.prebuilt import ToolNode
+
+
+class FakeLLM(RunnableLambda):
+    """Chat model stand-in answering every prompt and grading everything relevant."""
+
+    def __init__(self, answer="Paris.", grade=RAGDocumentGrade.relevant):
+        super().__init__(lambda _: self.calls.append("text") or answer)
+        self.answer = answer
+        self.grade = grade
+        self.calls = []
+        self.compiled = []
+
+    def with_structured_output(self, schema):
+        self.compiled.append(schema.__name__)
+
+        def respond(_):
+            self.calls.append(schema.__name__)
+            if schema is RAGGradedAnswerResponse:
+                relevant = self.grade == RAGDocumentGrade.relevant
+                return schema(
+                    grade=self.grade, answer=self.answer if relevant else None
+                )
+            return schema(grade=self.grade)
+
+        return RunnableLambda(respond)
+
+    def bind_tools(self, tools):
+        self.tools = tools
+        return RunnableLambda(lambda _: AIMessage(content=self.answer))
+
+
+@tool
+def web_search(query: str) -> str:
+    """Searches the web."""
+    return "Paris is the capital of France."
 
 
 class TestCorrectiveRAG(TestCase):
@@ -17,7 +67,7 @@ class TestCorrectiveRAG(TestCase):
         self.user_id = "test_user"
         self.query = "What is the capital of France?"
 
-    @patch("RAG.corrective_rag.Chroma.similarity_search")
+    @patch("langchain_chroma.Chroma.similarity_search")
     def test_rag_retriever(self, mock_search):
         mock_search.return_value = [
             Document(page_content="Paris is the capital of France.")
@@ -32,6 +82,44 @@ class TestCorrectiveRAG(TestCase):
         self.assertEqual(len(result["rag_context"]), 1)
         self.assertIn("Paris", result["rag_context"][0].page_content)
 
+    @patch("langchain_chroma.Chroma.similarity_search")
+    def test_rag_retriever_scoped_to_selection(self, mock_search):
+        mock_search.return_value = []
+        state = {
+            "messages": [HumanMessage(content=self.query)],
+            "user_id": self.user_id,
+            "document_ids": [3, 5],
+        }
+
+        self.rag._CorrectiveRAG__rag_retriver(state)
+        self.assertEqual(
+            mock_search.call_args.kwargs["filter"],
+            {
+                "$and": [
+                    {"user_id": self.user_id},
+                    {"document_id": {"$in": [3, 5]}},
+                ]
+            },
+        )
+
+    @patch("langchain_chroma.Chroma.similarity_search")
+    def test_rag_retriever_reranks_candidates(self, mock_search):
+        self.rag._CorrectiveRAG__reranking = {"CANDIDATES": 20, "K": 1}
+        self.rag._CorrectiveRAG__reranker = HybridReranker()
+        mock_search.return_value = [
+            Document(page_content="France is a country in Europe."),
+            Document(page_content="Paris is the capital of France."),
+        ]
+        state = {
+            "messages": [HumanMessage(content=self.query)],
+            "user_id": self.user_id,
+        }
+
+        result = self.rag._CorrectiveRAG__rag_retriver(state)
+        self.assertEqual(mock_search.call_args.kwargs["k"], 20)
+        self.assertEqual(len(result["rag_context"]), 1)
+        self.assertIn("capital", result["rag_context"][0].page_content)
+
     def test_document_grader_relevant(self):
         # Manually override the private __llm attribute using name mangling
         mock_chain = MagicMock()
@@ -55,6 +143,152 @@ class TestCorrectiveRAG(TestCase):
             result["document_grader_response"].grade, RAGDocumentGrade.relevant
         )
 
+    def test_responder_tracks_prompt_tokens(self):
+        self.rag._llm = FakeLLM()
+        state = {
+            "question": self.query,
+            "rag_context": [
+                Document(page_content="Paris is the capital of France."),
+                Document(page_content="Paris is the capital of France."),
+            ],
+            "prompt_tokens": {"document_grader": 10},
+        }
+
+        result = self.rag._CorrectiveRAG__responder(state)
+        self.assertEqual(result["answer"], "Paris.")
+        self.assertEqual(result["prompt_tokens"]["document_grader"], 10)
+        self.assertGreater(result["prompt_tokens"]["responder"], 0)
+
+    def test_manage_history_drops_intermediate_messages(self):
+        state = {
+            "messages": [
+                HumanMessage(content=self.query, id="1"),
+                AIMessage(content="raw context", id="2"),
+                AIMessage(content="Paris.", name="responder", id="3"),
+            ],
+            "rag_context": [Document(page_content="Paris is the capital.")],
+            "crawler_response": "tool output",
+        }
+
+        result = self.rag._CorrectiveRAG__manage_history(state)
+        self.assertEqual([m.id for m in result["messages"]], ["2"])
+        self.assertEqual(result["rag_context"], [])
+        self.assertIsNone(result["crawler_response"])
+
+    def test_manage_history_summarizes_old_turns(self):
+        self.rag._CorrectiveRAG__history = {"MAX_TURNS": 2, "SUMMARIZE": True}
+        self.rag._llm = FakeLLM("The user asked about capitals.")
+        messages = []
+        for i in range(3):
+            messages.append(HumanMessage(content=f"Question {i}", id=f"q{i}"))
+            messages.append(
+                AIMessage(content=f"Answer {i}", name="responder", id=f"a{i}")
+            )
+
+        result = self.rag._CorrectiveRAG__manage_history({"messages": messages})
+        self.assertEqual([m.id for m in result["messages"]], ["q0", "a0", "q1", "a1"])
+        self.assertEqual(result["summary"], "The user asked about capitals.")
+        self.assertIn("manage_history", result["prompt_tokens"])
+
+    @patch("langchain_chroma.Chroma.similarity_search")
+    def test_run_stores_only_conversation_turns(self, mock_search):
+        mock_search.return_value = [
+            Document(page_content="Paris is the capital of France.")
+        ]
+        self.rag._llm = FakeLLM()
+        # Rebuilding the graph so nodes use the fake model
+        self.rag._CorrectiveRAG__graph = self.rag._CorrectiveRAG__get_graph()
+
+        for _ in range(2):
+            answer = self.rag.run(self.query, user_id=self.user_id, thread_id="t")
+            self.assertEqual(answer, "Paris.")
+
+        graph = self.rag._CorrectiveRAG__graph
+        values = graph.get_state(
+            {"configurable": {"thread_id": f"{self.user_id}#t"}}
+        ).values
+        self.assertEqual(
+            [type(m) for m in values["messages"]],
+            [HumanMessage, AIMessage, HumanMessage, AIMessage],
+        )
+        self.assertEqual(values["rag_context"], [])
+
+    @patch("langchain_chroma.Chroma.similarity_search")
+    def test_stored_threads_stay_bounded(self, mock_search):
+        mock_search.return_value = [
+            Document(page_content="Paris is the capital of France.")
+        ]
+        self.rag._llm = FakeLLM()
+        self.rag._CorrectiveRAG__graph = self.rag._CorrectiveRAG__get_graph()
+        saver = self.rag._CorrectiveRAG__memory
+        thread_id = f"{self.user_id}#long"
+
+        def stored():
+            checkpoints = saver.storage[thread_id][""]
+            size = sum(
+                len(data)
+                for checkpoint, metadata, _ in checkpoints.values()
+                for _, data in (checkpoint, metadata)
+            )
+            size += sum(
+                len(data)
+                for key, (_, data) in saver.blobs.items()
+                if key[0] == thread_id
+            )
+            size += sum(
+                len(data)
+                for key, writes in saver.writes.items()
+                if key[0] == thread_id
+                for _, _, (_, data), _ in writes.values()
+            )
+            return len(checkpoints), size
+
+        sizes = []
+        for turn in range(1, 31):
+            self.rag.run(self.query, user_id=self.user_id, thread_id="long")
+            if turn % 10 == 0:
+                sizes.append(stored())
+        # One checkpoint per thread, whose size doesn't grow with the turns
+        self.assertEqual([count for count, _ in sizes], [1, 1, 1])
+        self.assertLess(max(size for _, size in sizes), sizes[0][1] * 1.2)
+
+    def test_run_debug_logging_with_empty_messages(self):
+        graph = MagicMock()
+        # manage_history may remove every message of an event
+        graph.stream.return_value = [
+            {"messages": []},
+            {"messages": [AIMessage(content="Paris.")]},
+        ]
+        self.rag._CorrectiveRAG__graph = graph
+        with self.assertLogs("RAG.corrective_rag", "DEBUG"):
+            answer = self.rag.run(self.query, user_id=self.user_id)
+        self.assertEqual(answer, "Paris.")
+
+    @patch("langchain_chroma.Chroma.similarity_search")
+    def test_chains_compiled_once(self, mock_search):
+        mock_search.return_value = [
+            Document(page_content="Paris is the capital of France.")
+        ]
+        llm = FakeLLM()
+        self.rag._llm = llm
+        self.rag._CorrectiveRAG__graph = self.rag._CorrectiveRAG__get_graph()
+        compiled = list(llm.compiled)
+
+        for thread_id in ("a", "b"):
+            self.rag.run(self.query, user_id=self.user_id, thread_id=thread_id)
+
+        self.assertEqual(llm.calls.count("RAGDocumentGraderResponse"), 2)
+        self.assertEqual(llm.compiled, compiled)
+
+    def test_prompts_end_with_question(self):
+        """Test that the context comes before the question, for prompt caching"""
+        for template in (GRADER_PROMPT, GRADED_ANSWER_PROMPT, RESPONDER_PROMPT):
+            messages = template.invoke(
+                {"question": "QUESTION", "context": "CONTEXT"}
+            ).to_messages()
+            content = messages[-1].content
+            self.assertLess(content.index("CONTEXT"), content.index("QUESTION"))
+
     def test_document_grader_route_condition(self):
         state = {
             "document_grader_response": RAGDocumentGraderResponse(
@@ -64,6 +298,124 @@ class TestCorrectiveRAG(TestCase):
         route = self.rag._CorrectiveRAG__document_grader_route_condition(state)
         self.assertEqual(route, "rephrase_query")
 
+    def test_document_grader_route_condition_relevant(self):
+        state = {
+            "document_grader_response": RAGDocumentGraderResponse(
+                grade=RAGDocumentGrade.relevant
+            )
+        }
+        route = self.rag._CorrectiveRAG__document_grader_route_condition(state)
+        self.assertEqual(route, "responder")
+
+    def test_document_grader_route_condition_expansion(self):
+        self.rag._CorrectiveRAG__retrieval_expansion = {"MODE": "multi_query"}
+        state = {
+            "document_grader_response": RAGDocumentGraderResponse(
+                grade=RAGDocumentGrade.irrelevant
+            ),
+            "retrieval_expanded": False,
+        }
+        route = self.rag._CorrectiveRAG__document_grader_route_condition(state)
+        self.assertEqual(route, "expand_retrieval")
+
+        # Expansion is only tried once before falling back to the web
+        state["retrieval_expanded"] = True
+        route = self.rag._CorrectiveRAG__document_grader_route_condition(state)
+        self.assertEqual(route, "rephrase_query")
+
+    @patch("langchain_chroma.Chroma.similarity_search_by_vector")
+    def test_expand_retrieval_multi_query(self, mock_search):
+        self.rag._CorrectiveRAG__retrieval_expansion = {
+            "MODE": "multi_query",
+            "NUM_QUERIES": 2,
+            "K": 2,
+            "MAX_WORKERS": 2,
+        }
+        variants = RAGQueryVariantsResponse(
+            queries=["France capital city", "Which city is France's capital?"]
+        )
+        mock_llm = MagicMock()
+        mock_llm.with_structured_output.return_value = RunnableLambda(
+            lambda _: variants
+        )
+        self.rag._llm = mock_llm
+        mock_embeddings = MagicMock()
+        mock_embeddings.embed_documents.return_value = [[0.1], [0.2], [0.3]]
+        self.rag._CorrectiveRAG__embeddings = mock_embeddings
+        paris = Document(id="1", page_content="Paris is the capital of France.")
+        lyon = Document(id="2", page_content="Lyon is a city in France.")
+        mock_search.side_effect = [[lyon], [paris, lyon], [paris]]
+
+        state = {"question": self.query, "user_id": self.user_id}
+        result = self.rag._CorrectiveRAG__expand_retrieval(state)
+
+        # One batched embedding call for the question and its variants
+        mock_embeddings.embed_documents.assert_called_once()
+        self.assertEqual(len(mock_embeddings.embed_documents.call_args.args[0]), 3)
+        self.assertEqual(mock_search.call_count, 3)
+        self.assertEqual([doc.id for doc in result["rag_context"]], ["1", "2"])
+        self.assertTrue(result["retrieval_expanded"])
+
+    def test_run_batch(self):
+        self.rag._llm = FakeLLM()
+        self.rag._CorrectiveRAG__batch_graph = self.rag._CorrectiveRAG__get_graph(
+            stateless=True
+        )
+        mock_embeddings = MagicMock()
+        mock_embeddings.embed_documents.return_value = [[0.1], [0.2], [0.3]]
+        self.rag._CorrectiveRAG__embeddings = mock_embeddings
+        mock_store = MagicMock()
+        mock_store._collection.query.return_value = {
+            "ids": [["1"], ["2"], ["3"]],
+            "documents": [["Paris is the capital of France."]] * 3,
+            "metadatas": [[{}]] * 3,
+        }
+        self.rag._CorrectiveRAG__vector_store = mock_store
+
+        questions = [f"Question {i}?" for i in range(3)]
+        results = dict(
+            self.rag.run_batch(questions, user_id=self.user_id, max_concurrency=2)
+        )
+
+        self.assertEqual(results, {0: "Paris.", 1: "Paris.", 2: "Paris."})
+        # One embedding call and one vector store query for the whole batch
+        mock_embeddings.embed_documents.assert_called_once_with(questions)
+        mock_store._collection.query.assert_called_once()
+        mock_store.similarity_search.assert_not_called()
+
+    def test_run_batch_raises_llm_errors_before_answering(self):
+        llm = FakeLLM()
+        rate_limited = openai.RateLimitError(
+            "Rate limited",
+            response=httpx.Response(
+                429, request=httpx.Request("POST", "https://api.openai.com/v1")
+            ),
+            body=None,
+        )
+
+        def failing_grader(schema):
+            def respond(_):
+                raise rate_limited
+
+            return RunnableLambda(respond)
+
+        llm.with_structured_output = failing_grader
+        self.rag._llm = llm
+        mock_embeddings = MagicMock()
+        mock_embeddings.embed_documents.return_value = [[0.1], [0.2]]
+        self.rag._CorrectiveRAG__embeddings = mock_embeddings
+        mock_store = MagicMock()
+        mock_store._collection.query.return_value = {
+            "ids": [["1"], ["2"]],
+            "documents": [["Paris is the capital of France."]] * 2,
+            "metadatas": [[{}]] * 2,
+        }
+        self.rag._CorrectiveRAG__vector_store = mock_store
+
+        # Raised by the call itself, before any answer is iterated
+        with self.assertRaises(openai.RateLimitError):
+            self.rag.run_batch(["Question A?", "Question B?"], user_id=self.user_id)
+
     def test_custom_tools_condition_tool_call(self):
         mock_tool_message = MagicMock()
         mock_tool_message.tool_calls = [MagicMock()]
@@ -79,3 +431,132 @@ class TestCorrectiveRAG(TestCase):
 
         result = self.rag._CorrectiveRAG__custom_tools_condition(state)
         self.assertEqual(result, "responder")
+
+
+class TestSpeculation(TestCase):
+
+    def setUp(self):
+        with override_settings(RAG_SPECULATION={"ENABLED": True}):
+            self.rag = CorrectiveRAG()
+        self.user_id = "test_user"
+        self.query = "What is the capital of France?"
+        self.crawler_inputs = []
+        responses = iter(
+            [
+                AIMessage(
+                    content="",
+                    tool_calls=[
+                        {"name": "web_search", "args": {"query": "x"}, "id": "1"}
+                    ],
+                ),
+                AIMessage(content="Paris is the capital of France."),
+            ]
+        )
+        self.crawler = RunnableLambda(
+            lambda messages: self.crawler_inputs.append(messages) or next(responses)
+        )
+        self.rag._CorrectiveRAG__tool_node = ToolNode([web_search])
+
+    def run_graph(self, grade):
+        self.rag._llm = FakeLLM(grade=grade)
+        # Replaces the model the setter bound the tools to
+        self.rag._CorrectiveRAG__llm_with_tools = self.crawler
+        self.rag._CorrectiveRAG__graph = self.rag._CorrectiveRAG__get_graph()
+        with patch("langchain_chroma.Chroma.similarity_search") as mock_search:
+            mock_search.return_value = [Document(page_content="Lyon is in France.")]
+            return self.rag.run(self.query, user_id=self.user_id, thread_id="t")
+
+    def test_irrelevant_uses_speculative_branch(self):
+        before = speculation.stats.copy()
+        with patch("RAG.speculation.emit_records") as emit:
+            answer = self.run_graph(RAGDocumentGrade.irrelevant)
+            # Records are emitted by the speculation thread once it finished
+            for _ in range(100):
+                if emit.called:
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(answer, "Paris.")
+        self.assertEqual(speculation.stats["used"] - before["used"], 1)
+        [record] = emit.call_args.args[0]
+        self.assertEqual((record.node, record.route), ("speculation", "used"))
+        self.assertIn("web_search", record.tool_latency_ms)
+        # The graph continued after the speculative tool round
+        self.assertEqual(len(self.crawler_inputs), 2)
+        self.assertIsInstance(self.crawler_inputs[1][-1], ToolMessage)
+
+    def test_relevant_discards_speculative_branch(self):
+        before = speculation.stats.copy()
+        answer = self.run_graph(RAGDocumentGrade.relevant)
+
+        self.assertEqual(answer, "Paris.")
+        self.assertEqual(speculation.stats["discarded"] - before["discarded"], 1)
+        self.assertEqual(speculation.stats["used"], before["used"])
+
+    def test_no_speculation_before_retrieval_expansion(self):
+        self.rag._CorrectiveRAG__retrieval_expansion = {"MODE": "hyde"}
+        should_speculate = self.rag._CorrectiveRAG__should_speculate
+        self.assertFalse(should_speculate({"retrieval_expanded": False}))
+        self.assertTrue(should_speculate({"retrieval_expanded": True}))
+
+
+class TestFusedAnswer(TestCase):
+
+    def setUp(self):
+        self.rag = CorrectiveRAG()
+        self.user_id = "test_user"
+        self.query = "What is the capital of France?"
+
+    def run_graph(self, llm, thread_id="t"):
+        self.rag._llm = llm
+        self.rag._CorrectiveRAG__graph = self.rag._CorrectiveRAG__get_graph()
+        with patch("langchain_chroma.Chroma.similarity_search") as mock_search:
+            mock_search.return_value = [
+                Document(page_content="Paris is the capital of France.")
+            ]
+            return self.rag.run(
+                self.query,
+                user_id=self.user_id,
+                thread_id=thread_id,
+                answer_mode=AnswerMode.fused,
+            )
+
+    def test_setting_llm_binds_tools(self):
+        llm = FakeLLM()
+        self.rag._llm = llm
+        self.assertEqual(llm.tools, self.rag._CorrectiveRAG__tools)
+        crawler = self.rag._CorrectiveRAG__llm_with_tools
+        self.assertEqual(crawler.invoke([]).content, "Paris.")
+
+    def test_relevant_context_takes_one_call(self):
+        llm = FakeLLM()
+        self.assertEqual(self.run_graph(llm), "Paris.")
+        self.assertEqual(llm.calls, ["RAGGradedAnswerResponse"])
+
+        values = self.rag._CorrectiveRAG__graph.get_state(
+            {"configurable": {"thread_id": f"{self.user_id}#t"}}
+        ).values
+        self.assertEqual(
+            [type(m) for m in values["messages"]], [HumanMessage, AIMessage]
+        )
+        self.assertIn("grade_and_answer", values["prompt_tokens"])
+        self.assertNotIn("responder", values["prompt_tokens"])
+
+    def test_irrelevant_context_falls_back_to_corrective_branch(self):
+        llm = FakeLLM(grade=RAGDocumentGrade.irrelevant)
+        self.assertEqual(self.run_graph(llm), "Paris.")
+        # Rephrasing and the responder run as in the two-call graph
+        self.assertEqual(llm.calls, ["RAGGradedAnswerResponse", "text", "text"])
+
+    def test_answer_mode_assignment(self):
+        answer_mode = self.rag._CorrectiveRAG__answer_mode
+        self.assertEqual(answer_mode("1", "t"), AnswerMode.two_call)
+
+        self.rag._CorrectiveRAG__fused_answer = {
+            "ENABLED": True,
+            "TRAFFIC_SHARE": 0.5,
+        }
+        modes = [answer_mode("1", f"thread-{i}") for i in range(400)]
+        self.assertLess(abs(modes.count(AnswerMode.fused) - 200), 40)
+        # Conversations stay in their arm
+        self.assertEqual(modes, [answer_mode("1", f"thread-{i}") for i in range(400)])
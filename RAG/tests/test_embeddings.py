@@ -0,0 +1,86 @@
+import importlib.util
+import unittest
+from types import SimpleNamespace
+from unittest import TestCase
+import numpy as np
+from django.test.utils import override_settings
+from RAG.embeddings import (
+    EmbeddingBackend,
+    OnnxEmbeddings,
+    embed_queries,
+    get_embedding_backend,
+)
+
+VOCAB = {"[PAD]": 0, "[UNK]": 1, "a": 2, "b": 3, "c": 4, "query": 5}
+
+
+class FakeSession:
+    """
+    ONNX session whose hidden state of each token is (token id, mask, 1).
+    """
+
+    def __init__(self):
+        self.shapes = []
+
+    def get_inputs(self):
+        return [
+            SimpleNamespace(name="input_ids"),
+            SimpleNamespace(name="attention_mask"),
+        ]
+
+    def run(self, output_names, inputs):
+        ids, mask = inputs["input_ids"], inputs["attention_mask"]
+        self.shapes.append(ids.shape)
+        return [np.stack([ids, mask, np.ones_like(ids)], axis=-1).astype(np.float32)]
+
+
+def make_embeddings(**kwargs):
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+
+    tokenizer = Tokenizer(WordLevel(VOCAB, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    session = FakeSession()
+    embeddings = OnnxEmbeddings(
+        "unused", session=session, tokenizer=tokenizer, normalize=False, **kwargs
+    )
+    return embeddings, session
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("tokenizers"),
+    "The onnx embedding backend requires `pip install onnxruntime tokenizers`",
+)
+class TestOnnxEmbeddings(TestCase):
+    def test_batches_are_padded_to_their_longest_text(self):
+        embeddings, session = make_embeddings(batch_size=2)
+        vectors = embeddings.embed_documents(["a a a a", "b", "c c", "a"])
+        # Sorted by length: ["b", "a"] and ["c c", "a a a a"]
+        self.assertEqual(sorted(session.shapes), [(2, 1), (2, 4)])
+        # Vectors come back in input order, pooled from the first token
+        self.assertEqual([v[0] for v in vectors], [2, 3, 4, 2])
+
+    def test_mean_pooling_ignores_padding(self):
+        embeddings, _ = make_embeddings(pooling="mean")
+        vectors = embeddings.embed_documents(["a a a a", "c"])
+        self.assertEqual(vectors[0], [2, 1, 1])
+        self.assertEqual(vectors[1], [4, 1, 1])
+
+    def test_query_prefix(self):
+        embeddings, _ = make_embeddings(query_prefix="query ")
+        self.assertEqual(embeddings.embed_query("a")[0], 5)
+        self.assertEqual([v[0] for v in embed_queries(embeddings, ["a", "b"])], [5, 5])
+        self.assertEqual(embeddings.embed_documents(["a"])[0][0], 2)
+
+    def test_truncation_and_normalization(self):
+        embeddings, session = make_embeddings(max_length=2)
+        embeddings.normalize = True
+        vector = embeddings.embed_documents(["a b c"])[0]
+        self.assertEqual(session.shapes, [(1, 2)])
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+
+    @override_settings(RAG_EMBEDDINGS={"COLLECTIONS": {"local": "onnx"}})
+    def test_backend_per_collection(self):
+        self.assertEqual(get_embedding_backend("local"), EmbeddingBackend.onnx)
+        self.assertEqual(get_embedding_backend("rag_db"), EmbeddingBackend.openai)
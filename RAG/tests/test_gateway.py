@@ -0,0 +1,190 @@
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+import httpx
+import openai
+from django.core.cache import cache
+from RAG.conf import DEFAULTS
+from RAG.gateway import (
+    GATEWAY_HEADER,
+    Lane,
+    LLMGateway,
+    PriorityLimiter,
+    TokenBucket,
+    user_context,
+)
+
+
+def make_gateway(responses, **options):
+    """
+    Gateway whose provider answers with the given status codes in turn.
+    """
+    gateway = LLMGateway(
+        {**DEFAULTS["GATEWAY"], "BACKOFF_BASE": 0.001, "BACKOFF_MAX": 0.01, **options}
+    )
+    statuses = iter(responses)
+    gateway.pool = httpx.MockTransport(
+        lambda request: httpx.Response(next(statuses), json={})
+    )
+    return gateway
+
+
+def send(gateway, lane=Lane.interactive):
+    client = gateway.http_client(lane)
+    return client.post("https://api.openai.com/v1/chat/completions", json={})
+
+
+class TestGateway(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_retries_transient_errors(self):
+        gateway = make_gateway([429, 503, 200])
+        self.assertEqual(send(gateway).status_code, 200)
+        self.assertEqual(gateway.stats["retries"], 2)
+        self.assertEqual(gateway.stats["requests_interactive"], 3)
+
+    def test_gives_up_after_max_retries(self):
+        gateway = make_gateway([500] * 3, MAX_RETRIES=2)
+        self.assertEqual(send(gateway).status_code, 500)
+
+    def test_circuit_opens_after_failures(self):
+        gateway = make_gateway([500] * 4, MAX_RETRIES=1, BREAKER_THRESHOLD=4)
+        send(gateway)
+        send(gateway)
+        self.assertTrue(gateway.breaker.is_open)
+        response = send(gateway)
+        # Rejected without reaching the provider
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(GATEWAY_HEADER, response.headers)
+        self.assertIn("retry-after", response.headers)
+        self.assertEqual(gateway.stats["requests_interactive"], 4)
+
+    def test_circuit_closes_after_successful_trial(self):
+        gateway = make_gateway(
+            [500, 200], MAX_RETRIES=0, BREAKER_THRESHOLD=1, BREAKER_COOLDOWN=0
+        )
+        send(gateway)
+        self.assertTrue(gateway.breaker.is_open)
+        self.assertEqual(send(gateway).status_code, 200)
+        self.assertFalse(gateway.breaker.is_open)
+
+    def test_trial_rejected_by_gateway_limits_is_released(self):
+        gateway = make_gateway(
+            [500, 200],
+            MAX_RETRIES=0,
+            BREAKER_THRESHOLD=1,
+            BREAKER_COOLDOWN=0,
+            RATE_LIMIT_RPS=20,
+            RATE_LIMIT_BURST=1,
+            QUEUE_TIMEOUT=0,
+        )
+        send(gateway)
+        self.assertTrue(gateway.breaker.is_open)
+        # The trial finds the bucket empty, then the queue full
+        self.assertEqual(send(gateway).status_code, 429)
+        time.sleep(0.06)
+        with patch.object(gateway.limiter, "acquire", return_value=False):
+            self.assertEqual(send(gateway).status_code, 503)
+        self.assertEqual(gateway.stats["rejected_queue_timeout"], 1)
+        # A later request can still be the trial and close the circuit
+        self.assertEqual(send(gateway).status_code, 200)
+        self.assertFalse(gateway.breaker.is_open)
+
+    def test_embeddings_without_context_length_check(self):
+        # Offline hosts can't download the tiktoken encoding the check needs
+        gateway = make_gateway([], EMBEDDING_CHECK_CTX_LENGTH=False)
+        self.assertFalse(gateway.embeddings().check_embedding_ctx_length)
+        self.assertTrue(make_gateway([]).embeddings().check_embedding_ctx_length)
+
+    def test_user_quota(self):
+        gateway = make_gateway([200] * 3, USER_QUOTA_PER_MINUTE=2)
+        with user_context(7):
+            statuses = [send(gateway).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        # Requests without a user (e.g. ingestion) are not limited
+        self.assertEqual(send(gateway).status_code, 200)
+
+    def test_quota_surfaces_as_rate_limit_error(self):
+        gateway = make_gateway([], USER_QUOTA_PER_MINUTE=0.5)
+        client = openai.OpenAI(
+            api_key="test",
+            http_client=gateway.http_client(Lane.interactive),
+            max_retries=0,
+        )
+        with user_context(7), self.assertRaises(openai.RateLimitError):
+            client.embeddings.create(model="m", input="x")
+
+
+class TestLimits(TestCase):
+    def test_background_yields_to_interactive(self):
+        limiter = PriorityLimiter(limit=1, background_limit=1)
+        self.assertTrue(limiter.acquire(Lane.interactive, timeout=1))
+        acquired = []
+
+        def acquire(lane):
+            limiter.acquire(lane, timeout=2)
+            acquired.append(lane)
+
+        background = threading.Thread(target=acquire, args=(Lane.background,))
+        background.start()
+        time.sleep(0.05)
+        interactive = threading.Thread(target=acquire, args=(Lane.interactive,))
+        interactive.start()
+        time.sleep(0.05)
+
+        limiter.release(Lane.interactive)
+        interactive.join(2)
+        self.assertEqual(acquired, [Lane.interactive])
+        limiter.release(Lane.interactive)
+        background.join(2)
+        self.assertEqual(acquired, [Lane.interactive, Lane.background])
+
+    def test_background_limit(self):
+        limiter = PriorityLimiter(limit=4, background_limit=1)
+        self.assertTrue(limiter.acquire(Lane.background, timeout=1))
+        self.assertFalse(limiter.acquire(Lane.background, timeout=0.01))
+        self.assertTrue(limiter.acquire(Lane.interactive, timeout=0.01))
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=100, capacity=2)
+        self.assertTrue(bucket.acquire(Lane.interactive, timeout=0))
+        self.assertTrue(bucket.acquire(Lane.background, timeout=0))
+        self.assertFalse(bucket.acquire(Lane.interactive, timeout=0))
+        self.assertTrue(bucket.acquire(Lane.interactive, timeout=0.1))
+        bucket.release()
+        self.assertTrue(bucket.acquire(Lane.interactive, timeout=0))
+
+    def test_token_bucket_background_yields_to_interactive(self):
+        bucket = TokenBucket(rate=10, capacity=1)
+        self.assertTrue(bucket.acquire(Lane.interactive, timeout=0))
+        acquired = []
+
+        def acquire(lane):
+            bucket.acquire(lane, timeout=2)
+            acquired.append(lane)
+
+        background = threading.Thread(target=acquire, args=(Lane.background,))
+        background.start()
+        time.sleep(0.02)
+        interactive = threading.Thread(target=acquire, args=(Lane.interactive,))
+        interactive.start()
+        interactive.join(2)
+        background.join(2)
+        self.assertEqual(acquired, [Lane.interactive, Lane.background])
+
+    def test_rate_limited_requests_hold_no_slot(self):
+        gateway = make_gateway(
+            [200] * 3, MAX_CONCURRENCY=1, RATE_LIMIT_RPS=5, RATE_LIMIT_BURST=1
+        )
+        send(gateway)
+        in_use = []
+        sender = threading.Thread(target=send, args=(gateway,))
+        sender.start()
+        time.sleep(0.05)
+        # The second request waits for a token without taking the only slot
+        in_use.append(gateway.limiter.in_use(Lane.interactive))
+        sender.join(2)
+        self.assertEqual(in_use, [0])
+        self.assertEqual(gateway.stats["requests_interactive"], 2)
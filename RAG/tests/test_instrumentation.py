@@ -0,0 +1,105 @@
+from django.test import TestCase
+from typing_extensions import TypedDict
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph, END
+from RAG.instrumentation import (
+    DatabaseSink,
+    InstrumentationCallbackHandler,
+    NodeRecord,
+    PrometheusSink,
+)
+from RAG.models import NodeMetric
+
+
+class State(TypedDict):
+    answer: str
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.llm = GenericFakeChatModel(
+            messages=iter(
+                [
+                    AIMessage(
+                        content="Paris",
+                        usage_metadata={
+                            "input_tokens": 12,
+                            "output_tokens": 3,
+                            "total_tokens": 15,
+                        },
+                    )
+                ]
+            )
+        )
+        builder = StateGraph(State)
+        builder.add_node("retrieve", lambda state: {"answer": ""})
+        builder.add_node(
+            "respond", lambda state: {"answer": self.llm.invoke("question").content}
+        )
+        builder.set_entry_point("retrieve")
+        builder.add_edge("retrieve", "respond")
+        builder.add_edge("respond", END)
+        self.graph = builder.compile()
+
+    def test_records_nodes_tokens_and_routes(self):
+        handler = InstrumentationCallbackHandler(thread_id="1#default")
+        self.graph.invoke({"answer": ""}, {"callbacks": [handler]})
+        records = handler.finish()
+
+        self.assertEqual([record.node for record in records], ["retrieve", "respond"])
+        self.assertEqual(records[0].route, "respond")
+        self.assertEqual(records[1].route, "__end__")
+        self.assertEqual(records[1].llm_calls, 1)
+        self.assertEqual(records[1].input_tokens, 12)
+        self.assertEqual(records[1].output_tokens, 3)
+        self.assertEqual(records[0].llm_calls, 0)
+        self.assertGreaterEqual(records[1].duration_ms, 0)
+
+    def test_prometheus_sink_cache_hit_ratio(self):
+        sink = PrometheusSink()
+        record = NodeRecord(
+            request_id="r",
+            thread_id="t",
+            node="responder",
+            step=3,
+            input_tokens=2000,
+            cached_tokens=1500,
+        )
+        self.assertEqual(record.cache_hit_rate, 0.75)
+        sink.emit([record, NodeRecord("r", "t", "responder", 5, input_tokens=2000)])
+        self.assertIn(
+            'rag_node_prompt_cache_hit_ratio{node="responder"} 0.375', sink.render()
+        )
+
+    def test_prometheus_sink_render(self):
+        sink = PrometheusSink()
+        sink.emit(
+            [
+                NodeRecord(
+                    request_id="r",
+                    thread_id="t",
+                    node="responder",
+                    step=3,
+                    duration_ms=300,
+                    input_tokens=100,
+                    tool_latency_ms={"web_search": 1500},
+                    route="__end__",
+                )
+            ]
+        )
+        text = sink.render()
+        self.assertIn(
+            'rag_node_duration_seconds_bucket{node="responder",le="0.5"} 1', text
+        )
+        self.assertIn(
+            'rag_node_duration_seconds_bucket{node="responder",le="0.25"} 0', text
+        )
+        self.assertIn('rag_node_tokens_total{node="responder",type="input"} 100', text)
+        self.assertIn('rag_tool_duration_seconds_total{tool="web_search"} 1.5', text)
+
+    def test_database_sink(self):
+        DatabaseSink().emit(
+            [NodeRecord(request_id="r", thread_id="t", node="responder", step=1)]
+        )
+        self.assertEqual(NodeMetric.objects.get().node, "responder")
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+import httpx
+from django.conf import settings
+from RAG.benchmarks.loadtest import (
+    LatencyHistogram,
+    RecordedRequest,
+    TokenPool,
+    load_postman_collection,
+    load_recording,
+    run_load,
+    summarize_load,
+)
+
+
+def fake_api(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/api/auth/token/":
+        return httpx.Response(200, json={"access": "expired", "refresh": "r1"})
+    if request.url.path == "/api/auth/token/refresh/":
+        return httpx.Response(200, json={"access": "fresh"})
+    if request.headers.get("Authorization") != "Bearer fresh":
+        return httpx.Response(401)
+    if request.url.path == "/api/ask/":
+        return httpx.Response(500)
+    return httpx.Response(200, json=[])
+
+
+class TestLoadTest(TestCase):
+    def setUp(self):
+        self.client = httpx.Client(
+            base_url="http://testserver", transport=httpx.MockTransport(fake_api)
+        )
+        self.addCleanup(self.client.close)
+
+    def test_load_postman_collection(self):
+        """Test that the shipped collection becomes replayable requests"""
+        requests = load_postman_collection(
+            os.path.join(settings.BASE_DIR, "RAG_Backend_V2.postman_collection.json")
+        )
+        paths = [request.path for request in requests]
+        self.assertNotIn("/api/auth/token/", paths)
+        ask = next(request for request in requests if request.path == "/api/ask/")
+        self.assertEqual(ask.json["question"], "what is corrective rag?")
+        self.assertTrue(ask.auth)
+
+    def test_load_recording(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write(json.dumps({"method": "GET", "path": "/api/documents/12/"}) + "\n")
+        self.addCleanup(os.remove, f.name)
+        (request,) = load_recording(f.name)
+        self.assertEqual(request.endpoint, "GET /api/documents/{id}/")
+
+    def test_token_refreshed_on_401(self):
+        token_pool = TokenPool(self.client)
+        token_pool.login("user", "password")
+        result = run_load(
+            self.client,
+            [
+                RecordedRequest("GET", "/api/documents/"),
+                RecordedRequest("POST", "/api/ask/", json={"question": "?"}),
+            ],
+            concurrency=2,
+            iterations=3,
+            token_pool=token_pool,
+        )
+        summary = summarize_load(result)
+        self.assertEqual(summary["GET /api/documents/"]["requests"], 3)
+        self.assertEqual(summary["GET /api/documents/"]["errors"], {})
+        self.assertEqual(summary["POST /api/ask/"]["errors"], {"500": 3})
+
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        for latency in (1, 7, 7, 40000):
+            histogram.add(latency)
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(histogram.counts[1], 2)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(len(histogram.render()), 3)
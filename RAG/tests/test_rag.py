@@ -22,11 +22,10 @@ class TestRAG(TestCase):
         self.assertEqual(len(pages), 2)
         self.assertEqual(pages[0].page_content, "Page 1 text")
 
-    @patch("RAG.rag.RecursiveCharacterTextSplitter")
-    def test_split_text(self, MockSplitter):
+    @patch("RAG.rag.split_documents")
+    def test_split_text(self, mock_split_documents):
         """Test splitting text into chunks"""
-        mock_splitter = MockSplitter.return_value
-        mock_splitter.split_documents.return_value = [
+        mock_split_documents.return_value = [
             Document(page_content="Chunk 1"),
             Document(page_content="Chunk 2"),
         ]
@@ -36,10 +35,10 @@ class TestRAG(TestCase):
         self.assertEqual(len(chunks), 2)
         self.assertEqual(chunks[0].page_content, "Chunk 1")
 
-    @patch("RAG.rag.Chroma")
-    def test_add_documents_to_db(self, MockChroma):
+    @patch("RAG.rag.get_vector_store")
+    def test_add_documents_to_db(self, mock_get_vector_store):
         """Test adding documents to the vector database"""
-        mock_chroma = MockChroma.return_value
+        mock_chroma = mock_get_vector_store.return_value
         mock_chroma.add_documents.return_value = ["doc_1", "doc_2"]
 
         self.rag_module._RAG__vector_store = mock_chroma
@@ -51,10 +50,10 @@ class TestRAG(TestCase):
         doc_ids = self.rag_module._RAG__add_documents_to_db(docs)
         self.assertEqual(len(doc_ids), 2)
 
-    @patch("RAG.rag.Chroma")
-    def test_retrieve_relevant_documents_from_db(self, MockChroma):
+    @patch("RAG.rag.get_vector_store")
+    def test_retrieve_relevant_documents_from_db(self, mock_get_vector_store):
         """Test retrieving relevant documents from the vector store"""
-        mock_chroma = MockChroma.return_value
+        mock_chroma = mock_get_vector_store.return_value
         mock_chroma.similarity_search.return_value = [
             Document(page_content="Relevant Doc 1"),
             Document(page_content="Relevant Doc 2"),
@@ -68,11 +67,11 @@ class TestRAG(TestCase):
         # self.assertEqual(len(results), 2)
         self.assertEqual(results[0].page_content, "Relevant Doc 1")
 
-    @patch("RAG.rag.init_chat_model")
+    @patch("RAG.rag.get_gateway")
     @patch("RAG.rag.ChatPromptTemplate")
-    def test_ask_question(self, MockChatPromptTemplate, MockChatModel):
+    def test_ask_question(self, MockChatPromptTemplate, MockGateway):
         """Test asking a question and getting an AI-generated response"""
-        mock_llm = MockChatModel.return_value
+        mock_llm = MockGateway.return_value.chat_model.return_value
         mock_llm.invoke.return_value.content = "Generated answer"
 
         mock_prompt = MockChatPromptTemplate.return_value
@@ -89,10 +88,10 @@ class TestRAG(TestCase):
             response = self.rag_module.ask_question("What is RAG?")
             self.assertEqual(response, "Generated answer")
 
-    @patch("RAG.rag.Chroma")
-    def test_clear_vectors(self, MockChroma):
+    @patch("RAG.rag.get_vector_store")
+    def test_clear_vectors(self, mock_get_vector_store):
         """Test clearing all vectors in the database"""
-        mock_chroma = MockChroma.return_value
+        mock_chroma = mock_get_vector_store.return_value
 
         self.rag_module._RAG__vector_store = mock_chroma
 
@@ -0,0 +1,102 @@
+import importlib.util
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import TestCase
+import numpy as np
+from langchain_core.documents import Document
+from RAG.conf import DEFAULTS
+from RAG.reranking import CrossEncoderReranker, HybridReranker, get_reranker
+
+VOCAB = {"[PAD]": 0, "[UNK]": 1, "paris": 2, "slow": 3, "capital": 4}
+
+
+class FakeCrossEncoder:
+    """
+    ONNX session scoring a pair by how often "paris" occurs in it, and
+    taking its time over pairs mentioning "slow" unless terminated.
+    """
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids")]
+
+    def run(self, output_names, inputs, run_options=None):
+        ids = inputs["input_ids"]
+        if (ids == VOCAB["slow"]).any():
+            for _ in range(30):
+                if run_options is not None and run_options.terminate:
+                    raise RuntimeError("Exiting due to terminate flag")
+                time.sleep(0.01)
+        return [(ids == VOCAB["paris"]).sum(axis=1, keepdims=True).astype(np.float32)]
+
+
+def documents(*texts):
+    return [Document(id=str(i), page_content=text) for i, text in enumerate(texts)]
+
+
+class TestHybridReranker(TestCase):
+    def test_promotes_exact_terms(self):
+        docs = documents(
+            "The weather in France is mild.",
+            "Lyon is a large city.",
+            "Order 4711 ships on Monday.",
+        )
+        reranked = HybridReranker().rerank("When does order 4711 ship?", docs, k=2)
+        self.assertEqual([doc.id for doc in reranked], ["2", "0"])
+
+    def test_keeps_vector_order_without_matches(self):
+        docs = documents("alpha", "beta", "gamma")
+        reranked = HybridReranker().rerank("delta", docs, k=3)
+        self.assertEqual([doc.id for doc in reranked], ["0", "1", "2"])
+
+    def test_get_reranker(self):
+        options = DEFAULTS["RERANKING"]
+        self.assertIsNone(get_reranker(options))
+        self.assertIsInstance(
+            get_reranker({**options, "MODE": "hybrid"}), HybridReranker
+        )
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("tokenizers"),
+    "The cross-encoder requires `pip install onnxruntime tokenizers`",
+)
+class TestCrossEncoderReranker(TestCase):
+    def make_reranker(self, **kwargs):
+        from tokenizers import Tokenizer
+        from tokenizers.models import WordLevel
+        from tokenizers.pre_tokenizers import Whitespace
+
+        tokenizer = Tokenizer(WordLevel(VOCAB, unk_token="[UNK]"))
+        tokenizer.pre_tokenizer = Whitespace()
+        return CrossEncoderReranker(
+            "unused", session=FakeCrossEncoder(), tokenizer=tokenizer, **kwargs
+        )
+
+    def test_orders_by_score(self):
+        reranker = self.make_reranker(batch_size=2)
+        docs = documents("lyon", "paris capital", "paris paris", "capital")
+        reranked = reranker.rerank("capital", docs, k=3)
+        self.assertEqual([doc.id for doc in reranked], ["2", "1", "0"])
+
+    def test_timeout_keeps_unscored_candidates_in_vector_order(self):
+        reranker = self.make_reranker(batch_size=1, threads=3, timeout_ms=100)
+        docs = documents("lyon", "slow paris paris", "paris")
+        started = time.perf_counter()
+        reranked = reranker.rerank("capital", docs, k=3)
+        self.assertLess(time.perf_counter() - started, 0.25)
+        self.assertEqual([doc.id for doc in reranked], ["2", "0", "1"])
+        self.assertEqual(reranker.stats["timeouts"], 1)
+        self.assertEqual(reranker.stats["skipped_batches"], 1)
+
+    def test_stale_batches_are_skipped(self):
+        reranker = self.make_reranker(batch_size=1, threads=1, timeout_ms=100)
+        docs = documents("slow", "paris", "paris paris", "capital")
+        reranker.rerank("capital", docs, k=4)
+        # The slow batch is terminated and the ones left queued are dropped,
+        # so the next call is scored within its own budget
+        reranked = reranker.rerank("capital", documents("lyon", "paris"), k=2)
+        self.assertEqual([doc.id for doc in reranked], ["1", "0"])
+        self.assertEqual(reranker.stats["reranks"], 2)
+        self.assertEqual(reranker.stats["timeouts"], 1)
+        self.assertEqual(reranker.stats["skipped_batches"], 4)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from RAG.retrieval import (
+    build_metadata_filter,
+    reciprocal_rank_fusion,
+    search_by_vectors,
+)
+
+
+class TestRetrieval(TestCase):
+    def test_build_metadata_filter_without_selection(self):
+        self.assertEqual(build_metadata_filter(7), {"user_id": "7"})
+
+    def test_build_metadata_filter_with_selection(self):
+        self.assertEqual(
+            build_metadata_filter("7", [1, 2]),
+            {"$and": [{"user_id": "7"}, {"document_id": {"$in": [1, 2]}}]},
+        )
+
+    def test_reciprocal_rank_fusion_dedupes(self):
+        """Test that documents found by several queries are ranked first, once"""
+        a = Document(id="a", page_content="A")
+        b = Document(id="b", page_content="B")
+        c = Document(id="c", page_content="C")
+        fused = reciprocal_rank_fusion([[a, b], [b, c], [b]])
+        self.assertEqual([doc.id for doc in fused], ["b", "a", "c"])
+        self.assertEqual(len(reciprocal_rank_fusion([[a, b], [b, c]], limit=2)), 2)
+
+    def test_search_by_vectors_keeps_order(self):
+        vector_store = MagicMock()
+        vector_store.similarity_search_by_vector.side_effect = lambda vector, **_: [
+            Document(page_content=str(vector))
+        ]
+        results = search_by_vectors(vector_store, [[1.0], [2.0], [3.0]], k=1)
+        self.assertEqual(
+            [docs[0].page_content for docs in results], ["[1.0]", "[2.0]", "[3.0]"]
+        )
@@ -0,0 +1,102 @@
+import tempfile
+from io import StringIO
+from unittest import TestCase
+import chromadb
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test.utils import override_settings
+from RAG.management.commands.tune_vector_index import (
+    choose_parameters,
+    exact_neighbors,
+)
+from RAG.vector_store import get_client, get_hnsw_parameters
+
+
+class TestTuneVectorIndex(TestCase):
+    def test_exact_neighbors(self):
+        vectors = np.array([[0, 1], [1, 0], [3, 0], [-1, 0]], dtype=np.float32)
+        queries = np.array([[2.5, 0]], dtype=np.float32)
+        self.assertEqual(set(exact_neighbors(vectors, queries, 2)[0]), {1, 2})
+        # By angle, [1, 0] and [3, 0] are as close as the query
+        self.assertEqual(
+            set(exact_neighbors(vectors, queries, 2, space="cosine")[0]), {1, 2}
+        )
+        self.assertEqual(exact_neighbors(vectors, queries, 1, space="ip")[0], [2])
+
+    def test_choose_parameters(self):
+        results = [
+            {"M": 16, "SEARCH_EF": 20, "recall": 0.90, "p50_ms": 0.3},
+            {"M": 16, "SEARCH_EF": 40, "recall": 0.96, "p50_ms": 0.5},
+            # Faster by noise, but its smaller SEARCH_EF already reaches the target
+            {"M": 16, "SEARCH_EF": 100, "recall": 0.99, "p50_ms": 0.45},
+            {"M": 32, "SEARCH_EF": 20, "recall": 0.97, "p50_ms": 0.6},
+        ]
+        self.assertEqual(choose_parameters(results, 0.95)["SEARCH_EF"], 40)
+        self.assertEqual(choose_parameters(results, 0.995)["SEARCH_EF"], 100)
+
+    def test_tunes_and_rebuilds(self):
+        path = tempfile.mkdtemp(prefix="rag-hnsw-")
+        collection = chromadb.PersistentClient(path=f"{path}/rag_db").create_collection(
+            "rag_db", metadata={"embedding_model": "fake"}, embedding_function=None
+        )
+        vectors = np.random.default_rng(0).normal(size=(300, 8)).astype(np.float32)
+        collection.add(
+            ids=[str(i) for i in range(300)],
+            embeddings=vectors,
+            documents=[f"chunk {i}" for i in range(300)],
+            metadatas=[{"user_id": "1"}] * 300,
+        )
+        out = StringIO()
+        with override_settings(RAG_VECTOR_STORE={"PATH": path}):
+            call_command(
+                "tune_vector_index",
+                "--queries=20",
+                "--search-ef",
+                "10",
+                "--m",
+                "8",
+                "--target-recall=0",
+                "--apply",
+                stdout=out,
+            )
+            collection = get_client("rag_db").get_collection("rag_db")
+        self.assertIn("Suggested: M=8, SEARCH_EF=10", out.getvalue())
+        self.assertEqual(
+            get_hnsw_parameters(collection),
+            {"SPACE": "l2", "M": 8, "CONSTRUCTION_EF": 100, "SEARCH_EF": 10},
+        )
+        self.assertEqual(collection.count(), 300)
+        self.assertEqual(collection.get(ids=["7"])["metadatas"], [{"user_id": "1"}])
+
+    def test_rebuild_recovers_from_interrupted_swap(self):
+        path = tempfile.mkdtemp(prefix="rag-hnsw-")
+        client = chromadb.PersistentClient(path=f"{path}/rag_db")
+        vectors = np.random.default_rng(0).normal(size=(20, 8)).astype(np.float32)
+        for name, count in (("rag_db-old", 20), ("rag_db-rebuild", 5)):
+            client.create_collection(name, embedding_function=None).add(
+                ids=[str(i) for i in range(count)], embeddings=vectors[:count]
+            )
+        out = StringIO()
+        with override_settings(RAG_VECTOR_STORE={"PATH": path}, RAG_HNSW={"M": 8}):
+            # The live collection was moved aside, the partial copy is dropped
+            call_command("tune_vector_index", "--rebuild", stdout=out)
+            client = get_client("rag_db")
+            self.assertEqual(
+                sorted(collection.name for collection in client.list_collections()),
+                ["rag_db"],
+            )
+            collection = client.get_collection("rag_db")
+            self.assertEqual(collection.count(), 20)
+            self.assertEqual(get_hnsw_parameters(collection)["M"], 8)
+
+            # A copy is never dropped while the collection is empty
+            client.delete_collection("rag_db")
+            client.create_collection("rag_db", embedding_function=None)
+            client.create_collection("rag_db-rebuild", embedding_function=None).add(
+                ids=["1"], embeddings=vectors[:1]
+            )
+            with self.assertRaises(CommandError):
+                call_command("tune_vector_index", "--rebuild", stdout=out)
+            self.assertEqual(client.get_collection("rag_db-rebuild").count(), 1)
+        self.assertIn("Restored 'rag_db' from 'rag_db-old'", out.getvalue())
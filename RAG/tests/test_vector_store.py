@@ -0,0 +1,110 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from django.core.exceptions import ImproperlyConfigured
+from django.test.utils import override_settings
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from RAG.vector_store import (
+    get_client,
+    get_hnsw_configuration,
+    get_hnsw_parameters,
+    get_vector_store,
+)
+
+
+class TestClientFactory(TestCase):
+    def test_embedded_clients_are_shared_per_collection(self):
+        path = tempfile.mkdtemp(prefix="rag-vector-store-")
+        with override_settings(RAG_VECTOR_STORE={"PATH": path}):
+            client = get_client("first")
+            self.assertIs(get_client("first"), client)
+            self.assertIsNot(get_client("second"), client)
+        self.assertTrue(os.path.isdir(os.path.join(path, "first")))
+
+    @override_settings(RAG_VECTOR_STORE={"MODE": "http", "HOST": "chroma"})
+    @patch.dict("RAG.vector_store._clients")
+    @patch("RAG.vector_store.chromadb.HttpClient")
+    def test_http_client_is_created_once(self, mock_http_client):
+        self.assertIs(get_client("first"), get_client("second"))
+        mock_http_client.assert_called_once()
+        self.assertEqual(mock_http_client.call_args.kwargs["host"], "chroma")
+
+    @override_settings(RAG_VECTOR_STORE={"MODE": "grpc"})
+    def test_unsupported_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_client("first")
+
+
+class TestVectorStoreEmbeddingModel(TestCase):
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp(prefix="rag-vector-store-"))
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+
+    def open(self, model, name="collection"):
+        return get_vector_store(name, embeddings=self.embeddings, embedding_model=model)
+
+    def test_records_model_and_rejects_another(self):
+        vector_store = self.open("fake:a")
+        self.assertEqual(vector_store._collection.metadata["embedding_model"], "fake:a")
+        vector_store.add_texts(["text"])
+        self.open("fake:a")
+        with self.assertRaises(ImproperlyConfigured):
+            self.open("fake:b")
+
+    def test_legacy_collections(self):
+        for name in ("empty", "filled"):
+            vector_store = Chroma(
+                collection_name=name,
+                embedding_function=self.embeddings,
+                persist_directory=f"./{name}",
+            )
+        vector_store.add_texts(["text"])
+        # Empty collections are adopted by the configured model
+        self.open("fake:a", name="empty")
+        with self.assertRaises(ImproperlyConfigured):
+            self.open("fake:b", name="empty")
+        # Filled ones were embedded with OpenAI
+        with self.assertRaises(ImproperlyConfigured):
+            self.open("fake:a", name="filled")
+        self.open("openai:text-embedding-3-large", name="filled")
+
+
+class TestVectorStoreHnsw(TestCase):
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp(prefix="rag-vector-store-"))
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+
+    def open(self, name="collection"):
+        return get_vector_store(
+            name, embeddings=self.embeddings, embedding_model="fake"
+        )
+
+    @override_settings(RAG_HNSW={"M": 8, "COLLECTIONS": {"other": {"M": 32}}})
+    def test_configuration_per_collection(self):
+        self.assertEqual(get_hnsw_configuration("collection"), {"max_neighbors": 8})
+        self.assertEqual(get_hnsw_configuration("other"), {"max_neighbors": 32})
+
+    def test_new_and_existing_collections(self):
+        with override_settings(RAG_HNSW={"SPACE": "cosine", "SEARCH_EF": 20}):
+            collection = self.open()._collection
+        self.assertEqual(
+            get_hnsw_parameters(collection),
+            {"SPACE": "cosine", "M": 16, "CONSTRUCTION_EF": 100, "SEARCH_EF": 20},
+        )
+        # SEARCH_EF is updated, build parameters are only reported
+        with override_settings(RAG_HNSW={"M": 32, "SEARCH_EF": 40}):
+            with self.assertLogs("RAG.vector_store", "WARNING") as logs:
+                collection = self.open()._collection
+        self.assertIn("max_neighbors=16", logs.output[0])
+        self.assertEqual(get_hnsw_parameters(collection)["M"], 16)
+        self.assertEqual(get_hnsw_parameters(collection)["SEARCH_EF"], 40)
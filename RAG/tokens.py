@@ -0,0 +1,47 @@
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Rough characters-per-token ratio for English text, used when
+# the tiktoken encoding cannot be loaded (e.g. offline hosts).
+APPROX_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING):
+    """
+    Load a tiktoken encoding once per process.
+
+    :param encoding_name: Name of the tiktoken encoding.
+    :return: The encoding, or None if it is not available.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(
+            "Tokenizer '%s' unavailable (%s), falling back to approximate counts.",
+            encoding_name,
+            e,
+        )
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """
+    Count the number of tokens in a piece of text.
+
+    :param text: Text to measure.
+    :param encoding_name: Name of the tiktoken encoding.
+    :return: Number of tokens (approximate if no tokenizer is available).
+    """
+    if not text:
+        return 0
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -38,22 +38,42 @@ def get_web_search_tool():
     return news_search_tool
 
 
-wikipedia_tool = Tool(
-    name="wikipedia_search",
-    description="Useful for searching on Wikipedia.",
-    func=WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper()).run,
-)
+def get_wikipedia_tool():
+    wikipedia_tool = Tool(
+        name="wikipedia_search",
+        description="Useful for searching on Wikipedia.",
+        func=WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper()).run,
+    )
+    return wikipedia_tool
 
 
-wikidata_tool = Tool(
-    name="wikidata_search",
-    description="Useful for searching on Wikidata.",
-    func=WikidataQueryRun(api_wrapper=WikidataAPIWrapper()).run,
-)
+def get_wikidata_tool():
+    # Built on demand: the Wikidata wrapper makes a network call when created
+    wikidata_tool = Tool(
+        name="wikidata_search",
+        description="Useful for searching on Wikidata.",
+        func=WikidataQueryRun(api_wrapper=WikidataAPIWrapper()).run,
+    )
+    return wikidata_tool
 
 
-youtube_search_tool = Tool(
-    name="youtube_search",
-    description="Useful for searching on youtube.",
-    func=YouTubeSearchTool().run,
-)
+def get_youtube_search_tool():
+    youtube_search_tool = Tool(
+        name="youtube_search",
+        description="Useful for searching on youtube.",
+        func=YouTubeSearchTool().run,
+    )
+    return youtube_search_tool
+
+
+def get_default_tools():
+    """
+    Returns the search tools available to the CorrectiveRAG crawler agent.
+    """
+    return [
+        get_web_search_tool(),
+        get_wikipedia_tool(),
+        get_wikidata_tool(),
+        get_youtube_search_tool(),
+        get_news_search_tool(),
+    ]
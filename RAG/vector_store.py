@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+import chromadb
+from chromadb.api.client import SharedSystemClient
+from django.core.exceptions import ImproperlyConfigured
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from .conf import get_rag_settings
+from .embeddings import embedding_model_name, get_embedding_backend, get_embeddings
+from .gateway import Lane
+
+logger = logging.getLogger(__name__)
+
+# Chroma's shared client system is not safe to create from several threads
+# at once, which concurrent uploads would otherwise do
+_client_lock = threading.Lock()
+_clients = {}
+
+# Metadata key recording the model a collection's vectors were embedded with
+EMBEDDING_MODEL_KEY = "embedding_model"
+# Collections created before the model was recorded used OpenAI embeddings
+LEGACY_EMBEDDING_MODEL = "openai:text-embedding-3-large"
+
+# `RAG_HNSW` keys and the fields of Chroma's HNSW configuration they set
+HNSW_PARAMETERS = {
+    "SPACE": "space",
+    "M": "max_neighbors",
+    "CONSTRUCTION_EF": "ef_construction",
+    "SEARCH_EF": "ef_search",
+}
+# Fields fixed when the index is built; changing them requires a rebuild
+HNSW_BUILD_FIELDS = ("space", "max_neighbors", "ef_construction")
+
+
+class VectorStoreMode:
+    # A Chroma database per collection, opened inside every process
+    embedded = "embedded"
+    # One Chroma server shared by all processes
+    http = "http"
+
+
+def get_client(collection_name: str) -> chromadb.ClientAPI:
+    """
+    Returns the Chroma client of a collection as configured by
+    `RAG_VECTOR_STORE`, created once per process. The HTTP client keeps a
+    pool of keep-alive connections shared by all threads and collections.
+
+    :param collection_name: Name of the collection.
+    :return: The client.
+    """
+    options = get_rag_settings("VECTOR_STORE")
+    mode = options["MODE"]
+    if mode == VectorStoreMode.embedded:
+        path = os.path.abspath(os.path.join(options["PATH"] or ".", collection_name))
+        key = (mode, path)
+    elif mode == VectorStoreMode.http:
+        key = (
+            mode,
+            options["HOST"],
+            options["PORT"],
+            options["SSL"],
+            options["TENANT"],
+            options["DATABASE"],
+        )
+    else:
+        raise ImproperlyConfigured(
+            f"Unsupported RAG_VECTOR_STORE mode {mode!r}, use embedded or http."
+        )
+    with _client_lock:
+        if key not in _clients:
+            if mode == VectorStoreMode.embedded:
+                _clients[key] = chromadb.PersistentClient(path=path)
+            else:
+                _clients[key] = chromadb.HttpClient(
+                    host=options["HOST"],
+                    port=options["PORT"],
+                    ssl=options["SSL"],
+                    headers=options["HEADERS"],
+                    tenant=options["TENANT"],
+                    database=options["DATABASE"],
+                )
+        return _clients[key]
+
+
+def reset_clients():
+    """
+    Drops the clients of the process together with Chroma's cached systems,
+    which hold the loaded indexes, so collections opened afterwards are
+    loaded with their current configuration.
+    """
+    with _client_lock:
+        _clients.clear()
+        SharedSystemClient.clear_system_cache()
+
+
+def get_hnsw_configuration(collection_name: str) -> dict:
+    """
+    Returns the HNSW configuration of a collection set by `RAG_HNSW`, with
+    its per-collection overrides, in Chroma's terms. Unset parameters are
+    left out, so Chroma's defaults or the collection's values apply.
+
+    :param collection_name: Name of the collection.
+    :return: Chroma HNSW configuration, e.g. {"ef_search": 40}.
+    """
+    options = get_rag_settings("HNSW")
+    options = {**options, **options["COLLECTIONS"].get(collection_name, {})}
+    return {
+        field: options[key]
+        for key, field in HNSW_PARAMETERS.items()
+        if options[key] is not None
+    }
+
+
+def get_hnsw_parameters(collection: chromadb.Collection) -> dict:
+    """
+    Returns the HNSW parameters a collection was configured with.
+
+    :param collection: The Chroma collection.
+    :return: Parameters keyed like `RAG_HNSW`, e.g. {"M": 16, "SEARCH_EF": 100, ...}.
+    """
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    return {key: hnsw.get(field) for key, field in HNSW_PARAMETERS.items()}
+
+
+def get_vector_store(
+    collection_name: str = "rag_db",
+    lane: Lane = Lane.interactive,
+    embeddings: Embeddings | None = None,
+    embedding_model: str | None = None,
+) -> Chroma:
+    """
+    Opens a vector store collection with the embeddings it is configured
+    for (`RAG_EMBEDDINGS`). The embedding model is recorded in the metadata
+    of new collections, and opening a collection with another model fails,
+    since vectors of different models cannot be compared. New collections
+    are built with the HNSW parameters of `RAG_HNSW`.
+
+    :param collection_name: Name of the collection.
+    :param lane: Gateway lane of remote embedding calls.
+    :param embeddings: Embeddings to use instead of the configured backend.
+    :param embedding_model: Name recorded for `embeddings`.
+    :return: The vector store.
+    """
+    if embeddings is None:
+        backend = get_embedding_backend(collection_name)
+        embeddings = get_embeddings(backend, lane)
+        embedding_model = embedding_model_name(backend)
+    hnsw = get_hnsw_configuration(collection_name)
+    vector_store = Chroma(
+        collection_name=collection_name,
+        embedding_function=embeddings,
+        client=get_client(collection_name),
+        collection_metadata={EMBEDDING_MODEL_KEY: embedding_model},
+        collection_configuration={"hnsw": hnsw} if hnsw else None,
+    )
+    _check_embedding_model(vector_store, collection_name, embedding_model)
+    if hnsw:
+        _check_hnsw_configuration(vector_store, collection_name, hnsw)
+    return vector_store
+
+
+def _check_hnsw_configuration(vector_store: Chroma, collection_name: str, hnsw: dict):
+    # Existing collections keep the configuration they were created with
+    collection = vector_store._collection
+    current = (collection.configuration or {}).get("hnsw") or {}
+    if "ef_search" in hnsw and current.get("ef_search") != hnsw["ef_search"]:
+        # Persisted at once, used by processes (or a Chroma server) loading
+        # the index from now on
+        collection.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+    stale = [
+        field
+        for field in HNSW_BUILD_FIELDS
+        if field in hnsw and current.get(field) != hnsw[field]
+    ]
+    if stale:
+        logger.warning(
+            "Collection '%s' was built with %s; run `manage.py "
+            "tune_vector_index --collections %s --rebuild` to apply RAG_HNSW.",
+            collection_name,
+            ", ".join(f"{field}={current.get(field)}" for field in stale),
+            collection_name,
+        )
+
+
+def _check_embedding_model(
+    vector_store: Chroma, collection_name: str, embedding_model: str
+):
+    collection = vector_store._collection
+    metadata = collection.metadata or {}
+    recorded = metadata.get(EMBEDDING_MODEL_KEY)
+    if recorded is None:
+        # Collections created before models were recorded are adopted while
+        # empty; Chroma refuses to modify the distance function, so
+        # collections that set one keep their metadata as is
+        if collection.count() == 0 and not any(k.startswith("hnsw:") for k in metadata):
+            collection.modify(
+                metadata={**metadata, EMBEDDING_MODEL_KEY: embedding_model}
+            )
+            return
+        recorded = LEGACY_EMBEDDING_MODEL
+    if recorded != embedding_model:
+        raise ImproperlyConfigured(
+            f"Collection '{collection_name}' was embedded with '{recorded}', "
+            f"not the configured '{embedding_model}'. Re-ingest its documents "
+            f"into a new collection, or configure its backend in "
+            f"RAG_EMBEDDINGS['COLLECTIONS']."
+        )
@@ -26,7 +26,8 @@ class SelectedDocumentsAdmin(admin.ModelAdmin):
 
     list_display = (
         "selected_ids",
-        "created_at",
+        "version",
+        "updated_at",
         "user",
     )
-    list_filter = ("created_at", "user")
+    list_filter = ("updated_at", "user")
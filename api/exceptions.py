@@ -0,0 +1,38 @@
+import logging
+import openai
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+
+logger = logging.getLogger(__name__)
+
+
+def api_exception_handler(exc, context):
+    """
+    DRF exception handler that also answers LLM rate limits (from the
+    provider or the LLM gateway) with 429 and provider outages with 503,
+    passing on Retry-After, instead of failing with 500.
+    """
+    response = exception_handler(exc, context)
+    if response is not None:
+        return response
+
+    if isinstance(exc, openai.RateLimitError):
+        code = status.HTTP_429_TOO_MANY_REQUESTS
+        message = "Too many requests to the language model, retry later."
+    elif isinstance(exc, openai.APIConnectionError) or (
+        isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+    ):
+        code = status.HTTP_503_SERVICE_UNAVAILABLE
+        message = "The language model is unavailable, retry later."
+    else:
+        return None
+
+    logger.warning("LLM request failed: %r", exc)
+    headers = {}
+    retry_after = getattr(getattr(exc, "response", None), "headers", {}).get(
+        "retry-after"
+    )
+    if retry_after:
+        headers["Retry-After"] = retry_after
+    return Response({"error": message}, status=code, headers=headers)
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.cache import cache
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, callers arriving while it runs wait for and share its result
+    (or exception). Calls are only coalesced within one process.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+
+    def do(self, key, fn):
+        """
+        :param key: Hashable key identifying duplicate calls.
+        :param fn: Function without arguments doing the work.
+        :return: Tuple of the result and whether it was shared with a
+            call already in flight.
+        """
+        with self.__lock:
+            future = self.__calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.__calls[key] = future
+        if not leader:
+            return future.result(), True
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+        return future.result(), False
+
+    def __len__(self):
+        return len(self.__calls)
+
+
+def normalize_question(question: str) -> str:
+    """Case and whitespace insensitive form of a question."""
+    return " ".join(question.split()).casefold()
+
+
+def ask_key(user_id, thread_id: str, question: str, selection_version: int) -> tuple:
+    """
+    Key under which duplicate questions are coalesced. The selection version
+    is part of it, so a question asked again after the selection changed is
+    answered anew.
+    """
+    return (str(user_id), thread_id, normalize_question(question), selection_version)
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """A completed response kept for replay under its Idempotency-Key."""
+
+    fingerprint: str
+    status: int
+    data: dict
+
+
+def get_idempotency_ttl() -> int:
+    return getattr(settings, "IDEMPOTENCY_KEY_TTL", 600)
+
+
+def idempotency_cache_key(user_id, key: str) -> str:
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"api:idempotency:{user_id}:{digest}"
+
+
+def request_fingerprint(request) -> str:
+    """
+    Hash of the method, path and body of a request, to detect an
+    Idempotency-Key reused for a different request.
+    """
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(
+        f"{request.method} {request.path} {body}".encode()
+    ).hexdigest()
+
+
+def get_stored_response(user_id, key: str) -> StoredResponse | None:
+    return cache.get(idempotency_cache_key(user_id, key))
+
+
+def store_response(user_id, key: str, response: StoredResponse):
+    cache.set(idempotency_cache_key(user_id, key), response, get_idempotency_ttl())
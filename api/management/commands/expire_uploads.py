@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.uploads import expire_uploads, get_expiry
+
+
+class Command(BaseCommand):
+    help = (
+        "Abort chunked uploads that received no part for CHUNKED_UPLOAD_EXPIRY "
+        "seconds and remove their temporary files. Uploads are also swept "
+        "whenever one is started; run this periodically (e.g. from cron) to "
+        "reclaim space when none are."
+    )
+
+    def handle(self, *args, **options):
+        expired = expire_uploads()
+        self.stdout.write(
+            f"Aborted {expired} upload(s) idle for over {get_expiry()} seconds."
+        )
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_document_uploaded_by_selecteddocuments_user"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="selecteddocuments",
+            options={
+                "verbose_name": "Selected Documents",
+                "verbose_name_plural": "Selected Documents",
+            },
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="chunking_strategy",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("characters", "characters"),
+                    ("tokens", "tokens"),
+                    ("pages", "pages"),
+                    ("headings", "headings"),
+                ],
+                default="",
+                max_length=20,
+            ),
+        ),
+    ]
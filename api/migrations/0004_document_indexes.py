@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_selections(apps, schema_editor):
+    """
+    Keep only the most recent selection of each user, so the unique
+    constraint can be added.
+    """
+    SelectedDocuments = apps.get_model("api", "SelectedDocuments")
+    seen_users = set()
+    for selection in SelectedDocuments.objects.order_by(
+        "user_id", "-created_at", "-id"
+    ):
+        if selection.user_id in seen_users:
+            selection.delete()
+        else:
+            seen_users.add(selection.user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_document_chunking_strategy"),
+        ("token_blacklist", "0012_alter_outstandingtoken_user"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(
+                fields=["uploaded_by", "-uploaded_at"], name="document_owner_recent_idx"
+            ),
+        ),
+        migrations.RunPython(remove_duplicate_selections, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="selecteddocuments",
+            constraint=models.UniqueConstraint(
+                fields=("user",), name="unique_selection_per_user"
+            ),
+        ),
+        # Blacklist lookups go through the unique `jti` column, but
+        # `flushexpiredtokens` scans outstanding tokens by expiry. Created
+        # after the last migration that rebuilds the table on SQLite.
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS outstandingtoken_expires_idx "
+            "ON token_blacklist_outstandingtoken (expires_at)",
+            "DROP INDEX IF EXISTS outstandingtoken_expires_idx",
+        ),
+    ]
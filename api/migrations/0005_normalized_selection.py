@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_selected_ids(apps, schema_editor):
+    """
+    Move the JSON list of selected IDs into the join table, dropping IDs of
+    documents that no longer exist or belong to someone else.
+    """
+    SelectedDocuments = apps.get_model("api", "SelectedDocuments")
+    SelectedDocument = apps.get_model("api", "SelectedDocument")
+    Document = apps.get_model("api", "Document")
+    for selection in SelectedDocuments.objects.all():
+        document_ids = Document.objects.filter(
+            id__in=selection.selected_ids or [], uploaded_by_id=selection.user_id
+        ).values_list("id", flat=True)
+        SelectedDocument.objects.bulk_create(
+            [
+                SelectedDocument(selection_id=selection.id, document_id=document_id)
+                for document_id in document_ids
+            ]
+        )
+        selection.version = 1
+        selection.save(update_fields=["version"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_document_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="selecteddocuments",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="selecteddocuments",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="SelectedDocument",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.document"
+                    ),
+                ),
+                (
+                    "selection",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="api.selecteddocuments",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="selecteddocuments",
+            name="documents",
+            field=models.ManyToManyField(
+                related_name="selections",
+                through="api.SelectedDocument",
+                to="api.document",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="selecteddocument",
+            constraint=models.UniqueConstraint(
+                fields=("selection", "document"), name="unique_selected_document"
+            ),
+        ),
+        migrations.RunPython(copy_selected_ids, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="selecteddocuments",
+            name="selected_ids",
+        ),
+    ]
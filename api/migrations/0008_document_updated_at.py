@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_upload_session_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
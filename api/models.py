@@ -1,6 +1,15 @@
-from django.db import models
+import uuid
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.core.validators import FileExtensionValidator
 from users.models import User
+from RAG.chunking import ChunkingStrategy
 
 
 # Create your models here.
@@ -8,19 +17,176 @@ class Document(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by every save, so edits change the ETag of the document list
+    updated_at = models.DateTimeField(auto_now=True)
     file = models.FileField(
         upload_to="documents/", validators=[FileExtensionValidator(["pdf"])]
     )
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Empty means the globally configured strategy (settings.RAG_CHUNKING)
+    chunking_strategy = models.CharField(
+        max_length=20,
+        blank=True,
+        default="",
+        choices=[(strategy.value, strategy.value) for strategy in ChunkingStrategy],
+    )
+    # SHA-256 of the file, when computed during upload
+    sha256 = models.CharField(max_length=64, blank=True, default="")
 
     def __str__(self):
         return self.title
 
+    class Meta:
+        indexes = [
+            # Listing a user's documents, most recent first
+            models.Index(
+                fields=["uploaded_by", "-uploaded_at"], name="document_owner_recent_idx"
+            ),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload: parts of `part_size` bytes are written at their
+    offset in a temporary file, and a Document is created on completion.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    chunking_strategy = models.CharField(
+        max_length=20,
+        blank=True,
+        default="",
+        choices=[(strategy.value, strategy.value) for strategy in ChunkingStrategy],
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    part_size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Time the last part was received, abandoned uploads expire after it
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @property
+    def total_parts(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    def expected_part_size(self, index: int) -> int:
+        if index == self.total_parts - 1:
+            return self.size - index * self.part_size
+        return self.part_size
+
+    def __str__(self):
+        return f"Upload of {self.filename} by {self.user}"
+
+
+class UploadPart(models.Model):
+    session = models.ForeignKey(
+        UploadSession, on_delete=models.CASCADE, related_name="parts"
+    )
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session", "index"], name="unique_upload_part"
+            ),
+        ]
+
+
+@dataclass(frozen=True)
+class Selection:
+    """A user's selected document IDs and the version of that selection."""
+
+    version: int
+    document_ids: tuple
+
+
+def selection_cache_key(user_id) -> str:
+    return f"api:selection:{user_id}"
+
+
+def invalidate_selection_cache(user_id):
+    """
+    Discard a user's cached selection now and once the transaction commits,
+    so a copy cached from the old rows in between is discarded as well.
+    Only readers fill the cache, from committed rows and without replacing
+    an existing copy, so concurrent writers can't cache their results in
+    the wrong order.
+    """
+    key = selection_cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class SelectedDocumentsManager(models.Manager):
+    def select(self, user, document_ids) -> Selection:
+        """
+        Replace a user's selection in one transaction: only the rows that
+        changed are deleted or bulk inserted, and the version is bumped.
+
+        :param user: Owner of the selection, a User or a stateless TokenUser.
+        :param document_ids: IDs of the selected `Document` objects.
+        :return: The new Selection.
+        """
+        document_ids = list(dict.fromkeys(document_ids))
+        with transaction.atomic():
+            selection, _ = self.get_or_create(user_id=user.pk)
+            # Serializes concurrent updates of the same user's selection
+            selection = self.select_for_update().get(pk=selection.pk)
+            selection.items.exclude(document_id__in=document_ids).delete()
+            SelectedDocument.objects.bulk_create(
+                [
+                    SelectedDocument(selection=selection, document_id=document_id)
+                    for document_id in document_ids
+                ],
+                ignore_conflicts=True,
+            )
+            self.filter(pk=selection.pk).update(
+                version=F("version") + 1, updated_at=timezone.now()
+            )
+            selection.refresh_from_db(fields=["version"])
+            invalidate_selection_cache(user.pk)
+        return Selection(selection.version, tuple(sorted(document_ids)))
+
+    def get_selection(self, user) -> Selection:
+        """
+        A user's current selection, served from the cache when possible so
+        the ask path usually needs no database query.
+
+        :param user: Owner of the selection, a User or a stateless TokenUser.
+        :return: The Selection, with version 0 if the user never selected documents.
+        """
+        key = selection_cache_key(user.pk)
+        result = cache.get(key)
+        if result is None:
+            selection = self.filter(user_id=user.pk).first()
+            if selection is None:
+                result = Selection(0, ())
+            else:
+                result = Selection(selection.version, tuple(selection.selected_ids))
+            cache.add(key, result, getattr(settings, "SELECTION_CACHE_TIMEOUT", 300))
+        return result
+
 
 class SelectedDocuments(models.Model):
-    selected_ids = models.JSONField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    documents = models.ManyToManyField(
+        Document, through="SelectedDocument", related_name="selections"
+    )
+    # Incremented on every change, so it can key caches of selection-scoped results
+    version = models.PositiveIntegerField(default=0)
+
+    objects = SelectedDocumentsManager()
+
+    @property
+    def selected_ids(self):
+        return sorted(self.items.values_list("document_id", flat=True))
 
     def __str__(self):
         return f"Selected Documents for {self.user} - {self.selected_ids}"
@@ -28,3 +194,32 @@ class SelectedDocuments(models.Model):
     class Meta:
         verbose_name = "Selected Documents"
         verbose_name_plural = "Selected Documents"
+        constraints = [
+            models.UniqueConstraint(fields=["user"], name="unique_selection_per_user"),
+        ]
+
+
+class SelectedDocument(models.Model):
+    selection = models.ForeignKey(
+        SelectedDocuments, on_delete=models.CASCADE, related_name="items"
+    )
+    document = models.ForeignKey(Document, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["selection", "document"], name="unique_selected_document"
+            ),
+        ]
+
+
+@receiver(post_delete, sender=Document)
+def remove_deleted_document_from_selection(sender, instance, **kwargs):
+    """
+    The cascade drops the document from its owner's selection, so the
+    selection changes version and its cached copy is discarded.
+    """
+    SelectedDocuments.objects.filter(user_id=instance.uploaded_by_id).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    invalidate_selection_cache(instance.uploaded_by_id)
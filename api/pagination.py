@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DocumentCursorPagination(CursorPagination):
+    """
+    Cursor pagination over a user's documents, newest first. The ordering
+    matches the (uploaded_by, -uploaded_at) index, and `id` breaks ties
+    between documents uploaded in the same instant. Requests without a
+    `cursor` or `page_size` parameter get the bare list of all documents the
+    API returned before lists were paginated.
+    """
+
+    ordering = ("-uploaded_at", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        paging = (self.cursor_query_param, self.page_size_query_param)
+        if not any(param in request.query_params for param in paging):
+            return None
+        return super().paginate_queryset(queryset, request, view)
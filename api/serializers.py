@@ -1,8 +1,18 @@
 from rest_framework import serializers
-from .models import Document, SelectedDocuments
+from .models import Document, SelectedDocuments, UploadSession
+from .uploads import get_max_size, get_part_size
+from RAG.conf import get_rag_settings
 
 
 class DocumentSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        # Optional subset of fields to serialize, e.g. from `?fields=id,title`
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Document
         fields = [
@@ -11,8 +21,50 @@ class DocumentSerializer(serializers.ModelSerializer):
             "description",
             "uploaded_at",
             "file",
+            "chunking_strategy",
+        ]
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    part_size = serializers.IntegerField(required=False, min_value=1024)
+    total_parts = serializers.ReadOnlyField()
+    missing_parts = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            "id",
+            "title",
+            "description",
+            "chunking_strategy",
+            "filename",
+            "size",
+            "part_size",
+            "total_parts",
+            "missing_parts",
+            "created_at",
         ]
 
+    def get_missing_parts(self, session):
+        received = {part.index for part in session.parts.all()}
+        return [i for i in range(session.total_parts) if i not in received]
+
+    def validate_filename(self, value):
+        if not value.lower().endswith(".pdf"):
+            raise serializers.ValidationError("Only PDF files can be uploaded.")
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= get_max_size():
+            raise serializers.ValidationError(
+                f"Size must be between 1 and {get_max_size()} bytes."
+            )
+        return value
+
+    def validate(self, attrs):
+        attrs.setdefault("part_size", get_part_size())
+        return attrs
+
 
 class DocumentSelectionSerializer(serializers.Serializer):
     document_ids = serializers.ListField(
@@ -21,11 +73,25 @@ class DocumentSelectionSerializer(serializers.Serializer):
 
 
 class SelectedDocumentsSerializer(serializers.ModelSerializer):
+    selected_ids = serializers.ReadOnlyField()
+
     class Meta:
         model = SelectedDocuments
-        fields = ["id", "selected_ids", "created_at"]
+        fields = ["id", "selected_ids", "version", "created_at", "updated_at"]
 
 
 class QuestionSerializer(serializers.Serializer):
     question = serializers.CharField()
     thread_id = serializers.CharField()
+
+
+class BatchQuestionSerializer(serializers.Serializer):
+    questions = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+    def validate_questions(self, value):
+        max_questions = get_rag_settings("BATCH")["MAX_QUESTIONS"]
+        if len(value) > max_questions:
+            raise serializers.ValidationError(
+                f"At most {max_questions} questions can be asked at once."
+            )
+        return value
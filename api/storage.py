@@ -0,0 +1,262 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+import uuid
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+
+# Bytes hashed or copied at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedMixin:
+    """
+    Store files under the SHA-256 of their content, e.g.
+    `documents/3f/3fa9...c1.pdf`. Uploading the same bytes twice keeps one
+    copy, and names never collide, so no worker has to check for free names.
+    Files are shared by name and therefore never rewritten.
+    """
+
+    def content_name(self, name: str, sha256: str) -> str:
+        """
+        :param name: Name requested by the caller, e.g. `documents/report.pdf`.
+        :param sha256: Hex digest of the file.
+        :return: Content-addressed name in the same directory.
+        """
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, sha256[:2], f"{sha256}{extension}")
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed in _save
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        if content.seekable():
+            content.seek(0)
+            for chunk in content.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+            content.seek(0)
+        else:
+            spooled = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16)
+            for chunk in content.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                spooled.write(chunk)
+            spooled.seek(0)
+            content = File(spooled, name=content.name)
+        name = self.content_name(name, digest.hexdigest())
+        if self.exists(name):
+            return name
+        try:
+            return self._save_new(name, content)
+        except FileExistsError:
+            # Saved concurrently by another upload of the same bytes
+            return name
+
+    def _save_new(self, name, content):
+        """
+        Store a file under a name that didn't exist, raising FileExistsError
+        if it was created in the meantime.
+        """
+        return super()._save(name, content)
+
+
+@deconstructible(path="api.storage.ContentAddressedStorage")
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    """
+    Content-addressed local disk storage rooted at MEDIA_ROOT.
+    """
+
+    def _save_new(self, name, content):
+        # Written under a temporary name and linked into place, so the file
+        # appears complete or not at all, and a concurrent save of the same
+        # name fails instead of being given another one
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        temp_path = f"{full_path}.{uuid.uuid4().hex}.part"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.link(temp_path, full_path)
+        finally:
+            os.remove(temp_path)
+        return name
+
+
+class S3File(File):
+    """
+    Read-only file streamed from an object's body. The body is not seekable,
+    so it is read front to back (ingestion spools it if it has to seek).
+    """
+
+    def __init__(self, body, name, size):
+        super().__init__(body, name)
+        self._size = size
+
+    @property
+    def size(self):
+        return self._size
+
+    def seekable(self):
+        return False
+
+    def chunks(self, chunk_size=None):
+        # StreamingBody can't seek back to the start like File.chunks does
+        while True:
+            data = self.read(chunk_size or self.DEFAULT_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+
+def is_not_found(error: Exception) -> bool:
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+def is_write_conflict(error: Exception) -> bool:
+    # Conditional writes lost to a concurrent upload of the same key
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("412", "PreconditionFailed", "ConditionalRequestConflict")
+
+
+@deconstructible(path="api.storage.S3Storage")
+class S3Storage(Storage):
+    """
+    Storage in an S3-compatible bucket (AWS S3, MinIO, Ceph, ...), so API
+    and ingestion workers on different nodes share the uploaded documents.
+    Requires `boto3`.
+    """
+
+    def __init__(
+        self,
+        bucket=None,
+        endpoint_url=None,
+        access_key=None,
+        secret_key=None,
+        region=None,
+        prefix=None,
+        url_expiry=3600,
+        client=None,
+    ):
+        """
+        Unset options default to the `S3_*` settings.
+
+        :param bucket: Bucket name.
+        :param endpoint_url: Endpoint of S3-compatible servers, e.g. MinIO.
+        :param access_key: Access key ID.
+        :param secret_key: Secret access key.
+        :param region: Region name.
+        :param prefix: Key prefix prepended to every file name.
+        :param url_expiry: Lifetime of presigned URLs in seconds.
+        :param client: boto3 S3 client to use instead of creating one.
+        """
+        self.bucket = bucket or getattr(settings, "S3_BUCKET", None)
+        if not self.bucket:
+            raise ImproperlyConfigured("S3Storage requires a bucket (S3_BUCKET).")
+        self.endpoint_url = endpoint_url or getattr(settings, "S3_ENDPOINT_URL", None)
+        self.access_key = access_key or getattr(settings, "S3_ACCESS_KEY_ID", None)
+        self.secret_key = secret_key or getattr(settings, "S3_SECRET_ACCESS_KEY", None)
+        self.region = region or getattr(settings, "S3_REGION", None)
+        self.prefix = (prefix or getattr(settings, "S3_PREFIX", "")).strip("/")
+        self.url_expiry = url_expiry
+        self.__client = client
+
+    @property
+    def client(self):
+        if self.__client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImproperlyConfigured(
+                    "S3Storage requires boto3, install it with `pip install boto3`."
+                )
+            self.__client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                region_name=self.region,
+            )
+        return self.__client
+
+    def __key(self, name):
+        name = name.replace("\\", "/").lstrip("/")
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def _open(self, name, mode="rb"):
+        if "w" in mode or "a" in mode:
+            raise ValueError("S3Storage files can only be opened for reading.")
+        response = self.client.get_object(Bucket=self.bucket, Key=self.__key(name))
+        return S3File(response["Body"], name, response["ContentLength"])
+
+    def _save(self, name, content):
+        if content.seekable():
+            content.seek(0)
+        # Multipart upload read from the stream, never buffered as a whole.
+        # Unconditional uploads of the same key replace it atomically;
+        # conditional ones (e.g. required by a bucket policy) lose the race
+        try:
+            self.client.upload_fileobj(
+                content,
+                self.bucket,
+                self.__key(name),
+                ExtraArgs={"ContentType": "application/pdf"},
+            )
+        except Exception as e:
+            if is_write_conflict(e):
+                raise FileExistsError(name) from e
+            raise
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.__key(name))
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.__key(name))
+        except Exception as e:
+            if is_not_found(e):
+                return False
+            raise
+        return True
+
+    def size(self, name):
+        response = self.client.head_object(Bucket=self.bucket, Key=self.__key(name))
+        return response["ContentLength"]
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.__key(name)},
+            ExpiresIn=self.url_expiry,
+        )
+
+    def listdir(self, path):
+        prefix = self.__key(path).rstrip("/") + "/" if path else self.__key("")
+        directories, files = [], []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket, Prefix=prefix, Delimiter="/"
+        ):
+            for common in page.get("CommonPrefixes", []):
+                directories.append(common["Prefix"][len(prefix) :].rstrip("/"))
+            for item in page.get("Contents", []):
+                files.append(item["Key"][len(prefix) :])
+        return directories, files
+
+
+@deconstructible(path="api.storage.ContentAddressedS3Storage")
+class ContentAddressedS3Storage(ContentAddressedMixin, S3Storage):
+    """
+    Content-addressed storage in an S3-compatible bucket.
+    """
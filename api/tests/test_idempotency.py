@@ -0,0 +1,55 @@
+import threading
+import time
+from unittest import TestCase
+from api.idempotency import SingleFlight, ask_key
+
+
+class SingleFlightTest(TestCase):
+    def test_concurrent_calls_share_one_result(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "answer"
+
+        def ask():
+            results.append(flight.do("key", work))
+
+        threads = [threading.Thread(target=ask) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Giving the duplicates time to find the call in flight
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("answer", False)] + [("answer", True)] * 3)
+        self.assertEqual(len(flight), 0)
+
+    def test_failed_call_is_not_kept(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", lambda: "retried"), ("retried", False))
+
+    def test_ask_key_normalizes_question(self):
+        self.assertEqual(
+            ask_key(1, "t", "  What is  RAG? ", 3),
+            ask_key("1", "t", "what is rag?", 3),
+        )
+        # A new selection gets a new answer
+        self.assertNotEqual(ask_key(1, "t", "q", 3), ask_key(1, "t", "q", 4))
@@ -3,7 +3,9 @@ from users.models import User
 from django.test import TestCase
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ValidationError
-from ..models import Document, SelectedDocuments
+from django.core.cache import cache
+from django.db import IntegrityError
+from ..models import Document, SelectedDocuments, Selection, selection_cache_key
 
 
 class BaseDBTest(TestCase):
@@ -65,22 +67,68 @@ class DocumentModelTest(BaseDBTest):
 class SelectedDocumentsModelTest(BaseDBTest):
     def setUp(self):
         super().setUp()
+        cache.clear()
+        test_file = SimpleUploadedFile("test.pdf", b"PDF content")
+        self.docs = [
+            Document.objects.create(
+                title=f"Doc {i}", file=test_file, uploaded_by=self.user
+            )
+            for i in range(3)
+        ]
+        self.ids = [doc.id for doc in self.docs]
 
-    def test_selected_documents_creation(self):
-        """Test if a SelectedDocuments object can be created successfully"""
-        ids = [1, 2, 3]
-        doc = SelectedDocuments.objects.create(selected_ids=ids, user=self.user)
-        self.assertEqual(doc.selected_ids, ids)
-        self.assertTrue(doc.created_at)  # Should be auto-generated
+    def test_select(self):
+        """Test that selecting documents stores them and bumps the version"""
+        selection = SelectedDocuments.objects.select(self.user, self.ids)
+        self.assertEqual(selection.document_ids, tuple(self.ids))
+        self.assertEqual(selection.version, 1)
+
+        selection = SelectedDocuments.objects.select(self.user, self.ids[1:])
+        self.assertEqual(selection.document_ids, tuple(self.ids[1:]))
+        self.assertEqual(selection.version, 2)
+        self.assertEqual(SelectedDocuments.objects.count(), 1)
+        self.assertEqual(
+            SelectedDocuments.objects.get(user=self.user).selected_ids, self.ids[1:]
+        )
+
+    def test_get_selection(self):
+        """Test the selection is cached and defaults to an empty one"""
+        self.assertEqual(SelectedDocuments.objects.get_selection(self.user).version, 0)
+        SelectedDocuments.objects.select(self.user, self.ids)
+        with self.assertNumQueries(2):
+            SelectedDocuments.objects.get_selection(self.user)
+        with self.assertNumQueries(0):
+            selection = SelectedDocuments.objects.get_selection(self.user)
+        self.assertEqual(selection.document_ids, tuple(self.ids))
+
+    def test_select_discards_copies_cached_before_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SelectedDocuments.objects.select(self.user, self.ids)
+            # Cached by a reader that loaded the previous rows
+            cache.set(selection_cache_key(self.user.pk), Selection(0, ()))
+        self.assertEqual(SelectedDocuments.objects.get_selection(self.user).version, 1)
+
+    def test_deleting_document_updates_selection(self):
+        SelectedDocuments.objects.select(self.user, self.ids)
+        self.docs[0].delete()
+        selection = SelectedDocuments.objects.get_selection(self.user)
+        self.assertEqual(selection.document_ids, tuple(self.ids[1:]))
+        self.assertEqual(selection.version, 2)
 
     def test_created_at_auto_now_add(self):
         """Test if 'created_at' is automatically set on creation"""
-        doc = SelectedDocuments.objects.create(selected_ids=[10, 20], user=self.user)
+        doc = SelectedDocuments.objects.create(user=self.user)
         self.assertIsInstance(doc.created_at, datetime.datetime)
 
     def test_str_method(self):
         """Test the __str__ method"""
-        ids = [1, 2, 3]
-        doc = SelectedDocuments.objects.create(selected_ids=ids, user=self.user)
-        expected_str = f"Selected Documents for {self.user} - {ids}"
+        SelectedDocuments.objects.select(self.user, self.ids)
+        doc = SelectedDocuments.objects.get(user=self.user)
+        expected_str = f"Selected Documents for {self.user} - {self.ids}"
         self.assertEqual(str(doc), expected_str)
+
+    def test_one_selection_per_user(self):
+        """Test that a user cannot have two SelectedDocuments rows"""
+        SelectedDocuments.objects.create(user=self.user)
+        with self.assertRaises(IntegrityError):
+            SelectedDocuments.objects.create(user=self.user)
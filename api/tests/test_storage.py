@@ -0,0 +1,150 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+from unittest.mock import patch
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+from api.storage import ContentAddressedS3Storage, ContentAddressedStorage
+from RAG.benchmarks.corpus import generate_document, write_pdf
+from RAG.data_injector import DataInjector
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        self.response = {"Error": {"Code": code}}
+
+
+class NonSeekableBody(io.BytesIO):
+    def seekable(self):
+        return False
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client used."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None):
+        self.objects[(bucket, key)] = fileobj.read()
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("NoSuchKey")
+        data = self.objects[(Bucket, Key)]
+        return {"Body": NonSeekableBody(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("404")
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.storage = ContentAddressedStorage(location=self.root)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save("documents/a.pdf", ContentFile(b"%PDF-1 one"))
+        second = self.storage.save("documents/b.pdf", ContentFile(b"%PDF-1 one"))
+        third = self.storage.save("documents/a.pdf", ContentFile(b"%PDF-1 two"))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+        self.assertRegex(first, r"^documents/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$")
+        self.assertEqual(len(os.listdir(os.path.join(self.root, "documents"))), 2)
+
+    def test_concurrent_saves_of_the_same_content(self):
+        content = b"%PDF-1 " + os.urandom(256 * 1024)
+        names = []
+        barrier = threading.Barrier(8)
+
+        def save():
+            barrier.wait()
+            names.append(self.storage.save("documents/a.pdf", ContentFile(content)))
+
+        # Every save misses the others' files when checking for them
+        with patch.object(ContentAddressedStorage, "exists", return_value=False):
+            threads = [threading.Thread(target=save) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+        self.assertEqual(len(names), 8)
+        self.assertEqual(len(set(names)), 1)
+        directory = os.path.dirname(self.storage.path(names[0]))
+        self.assertEqual(os.listdir(directory), [os.path.basename(names[0])])
+        with self.storage.open(names[0]) as f:
+            self.assertEqual(f.read(), content)
+
+
+class S3StorageTest(SimpleTestCase):
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.storage = ContentAddressedS3Storage(
+            bucket="documents", prefix="tenant", client=self.client
+        )
+
+    def test_save_and_stream(self):
+        name = self.storage.save("documents/a.pdf", ContentFile(b"%PDF-1 data"))
+        self.assertEqual(
+            self.storage.save("documents/b.pdf", ContentFile(b"%PDF-1 data")), name
+        )
+        self.assertEqual(list(self.client.objects), [("documents", f"tenant/{name}")])
+        self.assertTrue(self.storage.exists(name))
+        self.assertFalse(self.storage.exists("documents/missing.pdf"))
+        with self.storage.open(name) as f:
+            self.assertEqual(b"".join(f.chunks(4)), b"%PDF-1 data")
+
+    def test_conditional_write_conflict(self):
+        name = self.storage.save("documents/a.pdf", ContentFile(b"%PDF-1 data"))
+        # A concurrent upload created the object after the existence check
+        with patch.object(self.storage, "exists", return_value=False), patch.object(
+            self.client, "upload_fileobj", side_effect=FakeS3Error("PreconditionFailed")
+        ):
+            self.assertEqual(
+                self.storage.save("documents/b.pdf", ContentFile(b"%PDF-1 data")), name
+            )
+        self.assertEqual(self.storage.size(name), 11)
+
+    def test_ingestion_reads_non_seekable_stream(self):
+        """Test that a PDF streamed from object storage is parsed into pages"""
+        path = os.path.join(tempfile.mkdtemp(), "doc.pdf")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        write_pdf(path, generate_document(num_pages=2, seed=1).pages)
+        with open(path, "rb") as f:
+            name = self.storage.save("documents/doc.pdf", f)
+
+        injector = DataInjector.__new__(DataInjector)
+        with self.storage.open(name) as f:
+            pages = injector._DataInjector__data_extracter(f)
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pages[0].metadata["source"], name)
+
+
+@unittest.skipUnless(
+    os.environ.get("S3_TEST_ENDPOINT_URL"),
+    "Set S3_TEST_ENDPOINT_URL (and S3_TEST_BUCKET, credentials) to run against e.g. MinIO",
+)
+class S3StorageIntegrationTest(SimpleTestCase):
+    def test_round_trip(self):
+        storage = ContentAddressedS3Storage(
+            bucket=os.environ.get("S3_TEST_BUCKET", "rag-test"),
+            endpoint_url=os.environ["S3_TEST_ENDPOINT_URL"],
+            access_key=os.environ.get("S3_TEST_ACCESS_KEY_ID", "minioadmin"),
+            secret_key=os.environ.get("S3_TEST_SECRET_ACCESS_KEY", "minioadmin"),
+            prefix=f"test-{uuid.uuid4().hex[:8]}",
+        )
+        content = os.urandom(1024)
+        name = storage.save("documents/a.pdf", ContentFile(content))
+        self.addCleanup(storage.delete, name)
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), content)
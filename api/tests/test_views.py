@@ -1,15 +1,36 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+import chromadb
+import httpx
+import openai
 from users.models import User
+from django.conf import settings
+from django.core.management import call_command
 from django.test import TestCase
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from ..models import Document, SelectedDocuments
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from ..models import Document, SelectedDocuments, UploadSession
+from ..uploads import expire_uploads, get_expiry
 from unittest.mock import patch
+from RAG.instrumentation import get_sinks
 
 
 class BaseAPITest(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="testuser", password="password")
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
@@ -47,6 +68,162 @@ class DocumentUploadViewTest(BaseAPITest):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class ChunkedUploadViewTest(BaseAPITest):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.content = b"%PDF-1.4\n" + os.urandom(2500)
+
+    def start_upload(self):
+        response = self.client.post(
+            reverse("upload-start"),
+            {
+                "title": "Large Document",
+                "filename": "large.pdf",
+                "size": len(self.content),
+                "part_size": 1024,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["total_parts"], 3)
+        return response.data["id"]
+
+    def put_part(self, upload_id, index):
+        return self.client.put(
+            reverse("upload-part", args=[upload_id, index]),
+            self.content[index * 1024 : (index + 1) * 1024],
+            content_type="application/octet-stream",
+        )
+
+    @patch("RAG.data_injector.DataInjector.add_document")
+    def test_resume_and_complete(self, mock_rag_add_document):
+        upload_id = self.start_upload()
+        for index in (2, 0):
+            self.assertEqual(self.put_part(upload_id, index).status_code, 200)
+
+        # An interrupted client asks which parts are still missing
+        response = self.client.get(reverse("upload-detail", args=[upload_id]))
+        self.assertEqual(response.data["missing_parts"], [1])
+        response = self.client.post(reverse("upload-complete", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.put_part(upload_id, 1)
+        response = self.client.post(
+            reverse("upload-complete", args=[upload_id]),
+            {"sha256": hashlib.sha256(self.content).hexdigest()},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        document = Document.objects.get(id=response.data["data"]["id"])
+        with document.file.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(document.sha256, hashlib.sha256(self.content).hexdigest())
+        mock_rag_add_document.assert_called_once()
+        response = self.client.get(reverse("upload-detail", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rejects_wrong_part_size_and_checksum(self):
+        upload_id = self.start_upload()
+        response = self.client.put(
+            reverse("upload-part", args=[upload_id, 0]),
+            b"short",
+            content_type="application/octet-stream",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for index in range(3):
+            self.put_part(upload_id, index)
+        response = self.client.post(
+            reverse("upload-complete", args=[upload_id]), {"sha256": "0" * 64}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+
+    def test_rejects_missing_body_and_declared_size(self):
+        upload_id = self.start_upload()
+        url = reverse("upload-part", args=[upload_id, 0])
+        response = self.client.put(url, b"", content_type="application/octet-stream")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # The body has the session's part size, its Content-Length doesn't
+        response = self.client.put(
+            url,
+            self.content[:1024],
+            content_type="application/octet-stream",
+            CONTENT_LENGTH="512",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("upload-detail", args=[upload_id]))
+        self.assertEqual(response.data["missing_parts"], [0, 1, 2])
+
+    def test_uploads_are_private(self):
+        upload_id = self.start_upload()
+        other = User.objects.create_user(username="other", password="password")
+        self.client.force_authenticate(user=other)
+        response = self.put_part(upload_id, 0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(reverse("upload-detail", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @patch("RAG.data_injector.DataInjector.add_document")
+    def test_concurrent_completion_conflicts(self, mock_rag_add_document):
+        upload_id = self.start_upload()
+        for index in range(3):
+            self.put_part(upload_id, index)
+        # Loaded by requests racing the completion below
+        stale = UploadSession.objects.get(id=upload_id)
+        url = reverse("upload-complete", args=[upload_id])
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_201_CREATED)
+
+        with patch("api.views.UploadSessionView.get_session", return_value=stale):
+            response = self.client.post(url)
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            response = self.put_part(upload_id, 0)
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            response = self.client.delete(reverse("upload-detail", args=[upload_id]))
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Document.objects.count(), 1)
+
+    @override_settings(CHUNKED_UPLOAD_MAX_OPEN=2)
+    def test_limits_open_uploads(self):
+        first = self.start_upload()
+        self.start_upload()
+        response = self.client.post(
+            reverse("upload-start"),
+            {"title": "Third", "filename": "third.pdf", "size": 10},
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.client.delete(reverse("upload-detail", args=[first]))
+        self.start_upload()
+
+    def test_expires_abandoned_uploads(self):
+        idle = self.start_upload()
+        active = self.start_upload()
+        orphan = os.path.join(settings.MEDIA_ROOT, "partial", f"{uuid.uuid4()}.part")
+        open(orphan, "wb").close()
+        # A part received later keeps its upload alive past the expiry
+        later = timezone.now() + timedelta(seconds=get_expiry() + 60)
+        with patch("api.uploads.timezone.now", return_value=later):
+            self.put_part(active, 0)
+
+        call_command("expire_uploads", stdout=io.StringIO())
+        self.assertEqual(UploadSession.objects.count(), 2)
+
+        os.utime(orphan, (0, 0))
+        now = timezone.now() + timedelta(seconds=get_expiry() + 1)
+        self.assertEqual(expire_uploads(now=now), 1)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(UploadSession.objects.filter(id=idle).exists())
+        self.assertTrue(UploadSession.objects.filter(id=active).exists())
+        self.assertEqual(
+            os.listdir(os.path.join(settings.MEDIA_ROOT, "partial")),
+            [f"{active}.part"],
+        )
+        response = self.put_part(idle, 1)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class GenericDocumentsViewTest(BaseAPITest):
     def setUp(self):
         super().setUp()
@@ -63,6 +240,53 @@ class GenericDocumentsViewTest(BaseAPITest):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
+    def test_list_is_cursor_paginated(self):
+        for i in range(3):
+            Document.objects.create(
+                title=f"Doc {i}",
+                file=SimpleUploadedFile("sample.pdf", b"x"),
+                uploaded_by=self.user,
+            )
+        response = self.client.get(self.list_url, {"page_size": 3})
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(response.data["results"][0]["title"], "Doc 2")
+        response = self.client.get(response.data["next"])
+        self.assertEqual([doc["id"] for doc in response.data["results"]], [self.doc.id])
+        # Without paging parameters the bare list of the original API is kept
+        response = self.client.get(self.list_url)
+        self.assertEqual(
+            [doc["title"] for doc in response.data],
+            ["Doc 2", "Doc 1", "Doc 0", "Sample Document"],
+        )
+
+    def test_list_selected_fields(self):
+        response = self.client.get(self.list_url, {"fields": "id,title"})
+        self.assertEqual(response.data, [{"id": self.doc.id, "title": self.doc.title}])
+        response = self.client.get(self.list_url, {"fields": "id,owner"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_etag(self):
+        etag = self.client.get(self.list_url)["ETag"]
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Document.objects.create(
+            title="New Document",
+            file=SimpleUploadedFile("sample.pdf", b"x"),
+            uploaded_by=self.user,
+        )
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_etag_changes_on_edit(self):
+        etag = self.client.get(self.list_url)["ETag"]
+        self.doc.title = "Renamed Document"
+        self.doc.save()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["title"], "Renamed Document")
+
     def test_get_single_user_document(self):
         response = self.client.get(self.detail_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -85,30 +309,102 @@ class DocumentSelectionViewTest(BaseAPITest):
         )
         self.select_url = reverse("document-selection")
 
+    @patch("RAG.data_injector.DataInjector.has_document")
     @patch("RAG.data_injector.DataInjector.clear_vectors")
     @patch("RAG.data_injector.DataInjector.add_document")
     def test_select_documents_success(
-        self, mock_rag_add_document, mock_rag_clear_vectors
+        self, mock_rag_add_document, mock_rag_clear_vectors, mock_rag_has_document
     ):
+        mock_rag_has_document.return_value = True
         data = {"document_ids": [self.doc1.id, self.doc2.id]}
         response = self.client.post(self.select_url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(SelectedDocuments.objects.filter(user=self.user).count(), 1)
+        # Selection is applied as a retrieval filter, without re-indexing
+        mock_rag_clear_vectors.assert_not_called()
+        mock_rag_add_document.assert_not_called()
+
+    @patch("RAG.data_injector.DataInjector.add_document")
+    @patch("RAG.data_injector.get_vector_store")
+    def test_select_documents_tags_legacy_chunks(
+        self, mock_get_vector_store, mock_rag_add_document
+    ):
+        vector_store = Chroma(
+            collection_name=f"legacy-{self.doc1.id}",
+            embedding_function=DeterministicFakeEmbedding(size=8),
+            client=chromadb.EphemeralClient(),
+        )
+        mock_get_vector_store.return_value = vector_store
+        # Chunks indexed before document_id existed, on upload and selection
+        vector_store.add_texts(
+            ["page 1", "page 2", "other user"],
+            metadatas=[
+                {"source": self.doc1.file.path, "user_id": str(self.user.id)},
+                {"source": self.doc1.file.path, "user_id": self.user.id},
+                {"source": self.doc1.file.path, "user_id": str(self.user.id + 1)},
+            ],
+        )
+
+        data = {"document_ids": [self.doc1.id, self.doc2.id]}
+        response = self.client.post(self.select_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # doc1 keeps its chunks instead of being embedded twice
+        mock_rag_add_document.assert_called_once()
+        self.assertEqual(
+            mock_rag_add_document.call_args.kwargs["document_id"], self.doc2.id
+        )
+        tagged = vector_store.get(where={"document_id": self.doc1.id})
+        self.assertEqual(sorted(tagged["documents"]), ["page 1", "page 2"])
+        self.assertEqual(
+            {metadata["user_id"] for metadata in tagged["metadatas"]},
+            {str(self.user.id)},
+        )
+        self.assertEqual(len(vector_store.get()["ids"]), 3)
+
+    @patch("RAG.data_injector.DataInjector.has_document")
+    @patch("RAG.data_injector.DataInjector.add_document")
+    def test_select_documents_indexes_legacy_documents(
+        self, mock_rag_add_document, mock_rag_has_document
+    ):
+        mock_rag_has_document.side_effect = lambda doc_id: doc_id == self.doc1.id
+        data = {"document_ids": [self.doc1.id, self.doc2.id]}
+        response = self.client.post(self.select_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_rag_add_document.assert_called_once()
+        self.assertEqual(
+            mock_rag_add_document.call_args.kwargs["document_id"], self.doc2.id
+        )
+
+    @patch("RAG.data_injector.DataInjector.has_document")
+    def test_select_documents_updates_selection(self, mock_rag_has_document):
+        mock_rag_has_document.return_value = True
+        self.client.post(
+            self.select_url, {"document_ids": [self.doc1.id]}, format="json"
+        )
+        self.client.post(
+            self.select_url, {"document_ids": [self.doc2.id]}, format="json"
+        )
+        selection = SelectedDocuments.objects.get(user=self.user)
+        self.assertEqual(selection.selected_ids, [self.doc2.id])
 
     def test_get_selected_documents(self):
-        SelectedDocuments.objects.create(user=self.user, selected_ids=[self.doc1.id])
+        SelectedDocuments.objects.select(self.user, [self.doc1.id])
         response = self.client.get(self.select_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("selected_documents", response.data)
+        self.assertEqual(response.data["selected_documents"], [self.doc1.id])
+        self.assertEqual(response.data["version"], 1)
 
 
 class QnAViewTest(BaseAPITest):
     def setUp(self):
         super().setUp()
         self.qna_url = reverse("qna")
-        self.selected_doc = SelectedDocuments.objects.create(
-            selected_ids=[1, 2], user=self.user
-        )
+        test_file = SimpleUploadedFile("test.pdf", b"file_content")
+        self.docs = [
+            Document.objects.create(title=title, file=test_file, uploaded_by=self.user)
+            for title in ("Doc 1", "Doc 2")
+        ]
+        SelectedDocuments.objects.select(self.user, [doc.id for doc in self.docs])
 
     @patch("RAG.corrective_rag.CorrectiveRAG.run")
     def test_qna_success(self, mock_rag_ask_question):
@@ -117,3 +413,132 @@ class QnAViewTest(BaseAPITest):
         response = self.client.post(self.qna_url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("answer", response.data)
+        self.assertEqual(
+            mock_rag_ask_question.call_args.kwargs["document_ids"],
+            [doc.id for doc in self.docs],
+        )
+
+    @patch("RAG.data_injector.DataInjector.has_document", return_value=True)
+    @patch("RAG.corrective_rag.CorrectiveRAG.run")
+    def test_qna_reads_selection_from_cache(self, mock_rag_ask_question, _):
+        mock_rag_ask_question.return_value = "This is a test answer."
+        data = {"question": "What is AI?", "thread_id": "test-thread"}
+        self.client.post(self.qna_url, data, format="json")
+        with self.assertNumQueries(0):
+            response = self.client.post(self.qna_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # A new selection is seen by the next question
+        response = self.client.post(
+            reverse("document-selection"),
+            {"document_ids": [self.docs[1].id]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.post(self.qna_url, data, format="json")
+        self.assertEqual(
+            mock_rag_ask_question.call_args.kwargs["document_ids"], [self.docs[1].id]
+        )
+
+    @patch("RAG.corrective_rag.CorrectiveRAG.run")
+    def test_qna_idempotency_key(self, mock_rag_ask_question):
+        mock_rag_ask_question.return_value = "This is a test answer."
+        data = {"question": "What is AI?", "thread_id": "test-thread"}
+        for _ in range(2):
+            response = self.client.post(
+                self.qna_url, data, format="json", HTTP_IDEMPOTENCY_KEY="key-1"
+            )
+            self.assertEqual(response.data["answer"], "This is a test answer.")
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        mock_rag_ask_question.assert_called_once()
+
+        data["question"] = "What is ML?"
+        response = self.client.post(
+            self.qna_url, data, format="json", HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    @patch("RAG.corrective_rag.CorrectiveRAG.run_batch")
+    def test_batch_streams_answers(self, mock_run_batch):
+        mock_run_batch.return_value = iter([(1, "Answer B"), (0, ValueError("x"))])
+        data = {"questions": ["Question A?", "Question B?"]}
+        response = self.client.post(reverse("qna-batch"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            lines[0], {"index": 1, "question": "Question B?", "answer": "Answer B"}
+        )
+        self.assertEqual(lines[1]["index"], 0)
+        self.assertIn("error", lines[1])
+        self.assertEqual(
+            mock_run_batch.call_args.kwargs["document_ids"],
+            [doc.id for doc in self.docs],
+        )
+
+    @patch("RAG.corrective_rag.CorrectiveRAG.run_batch")
+    def test_batch_llm_errors(self, mock_run_batch):
+        data = {"questions": ["Question A?", "Question B?"]}
+        # Grading is rate limited before the response starts
+        mock_run_batch.side_effect = openai.RateLimitError(
+            "Rate limited",
+            response=httpx.Response(
+                429,
+                headers={"retry-after": "3"},
+                request=httpx.Request("POST", "https://api.openai.com/v1"),
+            ),
+            body=None,
+        )
+        response = self.client.post(reverse("qna-batch"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "3")
+
+        # A failure escaping the batch after the first answer was streamed
+        def results():
+            yield 1, "Answer B"
+            raise openai.APIConnectionError(request=httpx.Request("POST", "/"))
+
+        mock_run_batch.side_effect = None
+        mock_run_batch.return_value = results()
+        response = self.client.post(reverse("qna-batch"), data, format="json")
+        lines = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(lines[0]["answer"], "Answer B")
+        self.assertEqual(lines[1], {"error": "The batch could not be completed."})
+
+    def test_batch_rejects_empty(self):
+        response = self.client.post(
+            reverse("qna-batch"), {"questions": []}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MetricsViewTest(TestCase):
+    def setUp(self):
+        self.metrics_url = reverse("metrics")
+        get_sinks.cache_clear()
+
+    def tearDown(self):
+        get_sinks.cache_clear()
+
+    def test_metrics_disabled_by_default(self):
+        response = self.client.get(self.metrics_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(
+        RAG_INSTRUMENTATION={
+            "SINKS": ["RAG.instrumentation.PrometheusSink"],
+            "METRICS_TOKEN": "secret",
+        }
+    )
+    def test_metrics_require_token(self):
+        response = self.client.get(self.metrics_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.get(self.metrics_url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b"rag_node_duration_seconds", response.content)
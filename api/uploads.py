@@ -0,0 +1,273 @@
+import datetime
+import hashlib
+import os
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from users.models import User
+from .models import Document, UploadPart, UploadSession
+
+# Bytes read from the request or the disk at a time
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Raised when a part or a completed upload is invalid."""
+
+
+class TooManyUploads(UploadError):
+    """Raised when a user starts more uploads than may be open at once."""
+
+
+class UploadConflict(UploadError):
+    """Raised when another request completed or aborted the upload."""
+
+
+def get_part_size() -> int:
+    return getattr(settings, "CHUNKED_UPLOAD_PART_SIZE", 8 * 1024 * 1024)
+
+
+def get_max_size() -> int:
+    return getattr(settings, "CHUNKED_UPLOAD_MAX_SIZE", 1024 * 1024 * 1024)
+
+
+def get_expiry() -> int:
+    return getattr(settings, "CHUNKED_UPLOAD_EXPIRY", 24 * 60 * 60)
+
+
+def get_max_open_uploads() -> int:
+    return getattr(settings, "CHUNKED_UPLOAD_MAX_OPEN", 5)
+
+
+def get_temp_dir() -> str:
+    return os.path.join(settings.MEDIA_ROOT, "partial")
+
+
+def get_temp_path(session: UploadSession) -> str:
+    return os.path.join(get_temp_dir(), f"{session.id}.part")
+
+
+def create_temp_file(session: UploadSession):
+    """
+    Create the (sparse) file parts are written into.
+    """
+    path = get_temp_path(session)
+    os.makedirs(get_temp_dir(), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(session.size)
+
+
+def start_upload(serializer, user_id: int) -> UploadSession:
+    """
+    Save a new upload session and create its temporary file. Expired
+    uploads are swept first, so they neither hold disk space nor count
+    toward the `CHUNKED_UPLOAD_MAX_OPEN` uploads a user may have open.
+
+    :param serializer: Validated UploadSessionSerializer.
+    :param user_id: ID of the user starting the upload.
+    :return: The created UploadSession.
+    """
+    expire_uploads()
+    with transaction.atomic():
+        # Locking the user serializes their concurrent starts, so the cap holds
+        User.objects.select_for_update().filter(id=user_id).first()
+        max_open = get_max_open_uploads()
+        if UploadSession.objects.filter(user_id=user_id).count() >= max_open:
+            raise TooManyUploads(
+                f"At most {max_open} uploads can be open at once; complete or "
+                f"abort one first."
+            )
+        session = serializer.save(user_id=user_id)
+    create_temp_file(session)
+    return session
+
+
+def lock_session(session: UploadSession) -> UploadSession:
+    """
+    Lock the row of an upload session until the current transaction ends,
+    serializing the requests that change it.
+
+    :param session: The upload session, possibly loaded before the lock.
+    :return: The session as currently stored.
+    """
+    try:
+        return UploadSession.objects.select_for_update().get(pk=session.pk)
+    except UploadSession.DoesNotExist:
+        raise UploadConflict("The upload was already completed or aborted.")
+
+
+def write_part(
+    session: UploadSession, index: int, stream, content_length: int | None
+) -> UploadPart:
+    """
+    Stream one part from the request body to its offset in the temporary
+    file, hashing it on the way. Re-sending a part overwrites it.
+
+    :param session: The upload session.
+    :param index: Zero-based part index.
+    :param stream: File-like request body, None if the body is empty.
+    :param content_length: Declared size of the request body.
+    :return: The stored UploadPart.
+    """
+    if index >= session.total_parts:
+        raise UploadError(f"Part index must be below {session.total_parts}.")
+    expected_size = session.expected_part_size(index)
+    if stream is None or content_length != expected_size:
+        # Rejected before anything is written
+        raise UploadError(
+            f"Part {index} must be sent as a body of {expected_size} bytes "
+            f"with a Content-Length header."
+        )
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        f = open(get_temp_path(session), "r+b")
+    except FileNotFoundError:
+        # Moved into place or removed by a concurrent completion or abort
+        raise UploadConflict("The upload was already completed or aborted.")
+    with f:
+        f.seek(index * session.part_size)
+        while size <= expected_size:
+            data = stream.read(min(COPY_BUFFER_SIZE, expected_size + 1 - size))
+            if not data:
+                break
+            size += len(data)
+            if size > expected_size:
+                break
+            digest.update(data)
+            f.write(data)
+    if size != expected_size:
+        raise UploadError(f"Part {index} must be {expected_size} bytes.")
+    with transaction.atomic():
+        lock_session(session)
+        part, _ = UploadPart.objects.update_or_create(
+            session=session,
+            index=index,
+            defaults={"size": size, "sha256": digest.hexdigest()},
+        )
+        UploadSession.objects.filter(id=session.id).update(updated_at=timezone.now())
+    return part
+
+
+def missing_parts(session: UploadSession) -> list:
+    received = set(session.parts.values_list("index", flat=True))
+    return [index for index in range(session.total_parts) if index not in received]
+
+
+def complete_upload(session: UploadSession, sha256: str | None = None) -> Document:
+    """
+    Check that every part was received, hash the assembled file and turn it
+    into a Document. On local storage the file is moved, not copied.
+
+    :param session: The upload session.
+    :param sha256: Expected SHA-256 of the whole file, if the client sent one.
+    :return: The created Document.
+    """
+    with transaction.atomic():
+        # Concurrent completions and aborts wait here, then find it gone
+        session = lock_session(session)
+        return _assemble_upload(session, sha256)
+
+
+def _assemble_upload(session: UploadSession, sha256: str | None) -> Document:
+    missing = missing_parts(session)
+    if missing:
+        raise UploadError(f"Missing parts: {missing}.")
+    path = get_temp_path(session)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        header = f.read(5)
+        digest.update(header)
+        for data in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(data)
+    if header != b"%PDF-":
+        raise UploadError("The uploaded file is not a PDF.")
+    if sha256 and sha256.lower() != digest.hexdigest():
+        raise UploadError("SHA-256 of the uploaded file does not match.")
+
+    sha256 = digest.hexdigest()
+    # The session ID keeps names unique, so the move can't overwrite a file
+    stem, extension = os.path.splitext(os.path.basename(session.filename))
+    name = default_storage.generate_filename(
+        f"documents/{stem}_{session.id.hex[:8]}{extension}"
+    )
+    # Content-addressed storage names files by their (already known) hash
+    content_name = getattr(default_storage, "content_name", None)
+    if content_name is not None:
+        name = content_name(name, sha256)
+    if content_name is not None and default_storage.exists(name):
+        # The same bytes are already stored
+        os.remove(path)
+    else:
+        try:
+            target = default_storage.path(name)
+        except NotImplementedError:
+            target = None
+        if target is not None:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        else:
+            with open(path, "rb") as f:
+                name = default_storage.save(name, File(f))
+            os.remove(path)
+
+    document = Document(
+        title=session.title,
+        description=session.description,
+        chunking_strategy=session.chunking_strategy,
+        uploaded_by=session.user,
+        sha256=sha256,
+    )
+    document.file.name = name
+    document.save()
+    session.delete()
+    return document
+
+
+def abort_upload(session: UploadSession):
+    with transaction.atomic():
+        try:
+            session = lock_session(session)
+        except UploadConflict:
+            # Completed or aborted meanwhile, nothing is left to remove
+            return
+        try:
+            os.remove(get_temp_path(session))
+        except FileNotFoundError:
+            pass
+        session.delete()
+
+
+def expire_uploads(now: datetime.datetime | None = None) -> int:
+    """
+    Abort the uploads that received no part for `CHUNKED_UPLOAD_EXPIRY`
+    seconds, and remove temporary files of that age left without a session
+    (e.g. by a worker that died while starting an upload).
+
+    :param now: Current time, defaults to now.
+    :return: Number of uploads aborted.
+    """
+    cutoff = (now or timezone.now()) - datetime.timedelta(seconds=get_expiry())
+    expired = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in expired:
+        abort_upload(session)
+
+    try:
+        names = os.listdir(get_temp_dir())
+    except FileNotFoundError:
+        names = []
+    open_ids = {str(id) for id in UploadSession.objects.values_list("id", flat=True)}
+    for name in names:
+        path = os.path.join(get_temp_dir(), name)
+        stem, extension = os.path.splitext(name)
+        if extension != ".part" or stem in open_ids:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff.timestamp():
+                os.remove(path)
+        except FileNotFoundError:
+            # Removed by a concurrent sweep or completed meanwhile
+            pass
+    return len(expired)
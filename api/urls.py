@@ -2,9 +2,14 @@ from django.urls import path, include
 from rest_framework import routers
 from .views import (
     QnAView,
+    BatchQnAView,
     DocumentUploadView,
     DocumentSelectionView,
     GenericUserDocumentsView,
+    MetricsView,
+    UploadSessionView,
+    UploadPartView,
+    UploadCompleteView,
 )
 
 
@@ -15,12 +20,30 @@ urlpatterns = [
         DocumentUploadView.as_view(),
         name="document-upload",
     ),
+    path("documents/uploads/", UploadSessionView.as_view(), name="upload-start"),
+    path(
+        "documents/uploads/<uuid:id>/",
+        UploadSessionView.as_view(),
+        name="upload-detail",
+    ),
+    path(
+        "documents/uploads/<uuid:id>/parts/<int:index>/",
+        UploadPartView.as_view(),
+        name="upload-part",
+    ),
+    path(
+        "documents/uploads/<uuid:id>/complete/",
+        UploadCompleteView.as_view(),
+        name="upload-complete",
+    ),
     path(
         "documents/selection/",
         DocumentSelectionView.as_view(),
         name="document-selection",
     ),
     path("ask/", QnAView.as_view(), name="qna"),
+    path("ask/batch/", BatchQnAView.as_view(), name="qna-batch"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
     path("documents/", GenericUserDocumentsView.as_view(), name="documents-list"),
     path(
         "documents/<int:id>/",
@@ -1,18 +1,87 @@
+import hashlib
+import hmac
+import json
+import logging
+from django.db.models import Count, Max
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_list_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.permissions import AllowAny
 from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
-from .models import Document, SelectedDocuments
+from .models import Document, SelectedDocuments, UploadSession
+from .idempotency import (
+    SingleFlight,
+    StoredResponse,
+    ask_key,
+    get_stored_response,
+    request_fingerprint,
+    store_response,
+)
+from .pagination import DocumentCursorPagination
 from .serializers import (
+    BatchQuestionSerializer,
     DocumentSelectionSerializer,
     DocumentSerializer,
     QuestionSerializer,
+    UploadSessionSerializer,
+)
+from .uploads import (
+    TooManyUploads,
+    UploadConflict,
+    UploadError,
+    abort_upload,
+    complete_upload,
+    start_upload,
+    write_part,
 )
 from RAG.data_injector import DataInjector
-from RAG.corrective_rag import CorrectiveRAG
+from RAG.corrective_rag import get_corrective_rag
+from RAG.conf import get_rag_settings
+from RAG.instrumentation import PrometheusSink, get_sink
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_document(document: Document, injector: DataInjector | None = None):
+    """
+    Inject a stored document into the vector DB, scoped to its owner. The
+    file is read as a stream, so it can live on any storage backend.
+
+    :param document: The document to ingest.
+    :param injector: DataInjector to reuse, a new one by default.
+    """
+    injector = injector or DataInjector()
+    with document.file.open("rb") as f:
+        injector.add_document(
+            f,
+            user_id=str(document.uploaded_by_id),
+            document_id=document.id,
+            chunking_strategy=document.chunking_strategy or None,
+        )
+
+
+def adopt_legacy_chunks(document: Document, injector: DataInjector) -> int:
+    """
+    Tag the chunks a document was indexed into before `document_id`
+    metadata existed, which recorded its owner and local file path only.
+
+    :param document: The document whose chunks to tag.
+    :param injector: DataInjector of the collection.
+    :return: Number of chunks tagged, 0 if none were found.
+    """
+    try:
+        path = document.file.path
+    except NotImplementedError:
+        # Legacy chunks were only ever loaded from local files
+        return 0
+    return injector.adopt_legacy_chunks(
+        path, user_id=str(document.uploaded_by_id), document_id=document.id
+    )
 
 
 # Create your views here.
@@ -30,10 +99,9 @@ class DocumentUploadView(APIView):
         serializer = DocumentSerializer(data=request.data)
         if serializer.is_valid():
             # Saving the valid document to the database
-            document = serializer.save(uploaded_by=curr_user)
-            injector = DataInjector()
+            document = serializer.save(uploaded_by_id=curr_user.id)
             # Injecting document into vector DB with user_id
-            injector.add_document(document.file.path, user_id=str(curr_user.id))
+            ingest_document(document)
             return Response(
                 {
                     "upload_status": "success",
@@ -45,20 +113,162 @@ class DocumentUploadView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UploadSessionView(APIView):
+    """
+    View for starting, inspecting and aborting chunked uploads. Large files
+    are sent as fixed-size parts, so an interrupted upload only resends the
+    parts that are missing.
+    """
+
+    def get_session(self, request, id):
+        try:
+            return UploadSession.objects.get(id=id, user_id=request.user.id)
+        except UploadSession.DoesNotExist:
+            raise NotFound("Upload not found.")
+
+    def post(self, request, *args, **kwargs):
+        """
+        Start an upload of `size` bytes, returning its ID and part layout.
+        """
+        serializer = UploadSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            try:
+                session = start_upload(serializer, request.user.id)
+            except TooManyUploads as e:
+                return Response(
+                    {"error": str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS
+                )
+            return Response(
+                UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def get(self, request, id, *args, **kwargs):
+        """
+        Report the parts still missing, to resume an interrupted upload.
+        """
+        session = self.get_session(request, id)
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, id, *args, **kwargs):
+        abort_upload(self.get_session(request, id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadPartView(UploadSessionView):
+    """
+    View receiving one part of a chunked upload as the raw request body.
+    """
+
+    def put(self, request, id, index, *args, **kwargs):
+        session = self.get_session(request, id)
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = None
+        try:
+            part = write_part(session, index, request.stream, content_length)
+        except UploadConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"index": part.index, "size": part.size, "sha256": part.sha256},
+            status=status.HTTP_200_OK,
+        )
+
+
+class UploadCompleteView(UploadSessionView):
+    """
+    View assembling a chunked upload into a document and ingesting it.
+    """
+
+    def post(self, request, id, *args, **kwargs):
+        session = self.get_session(request, id)
+        try:
+            document = complete_upload(session, sha256=request.data.get("sha256"))
+        except UploadConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        ingest_document(document)
+        return Response(
+            {
+                "upload_status": "success",
+                "message": "Document uploaded successfully",
+                "data": DocumentSerializer(document).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
 class GenericUserDocumentsView(GenericAPIView, ListModelMixin, RetrieveModelMixin):
     """
     View to list and retrieve user's document instances.
+    Lists are cursor paginated when a `cursor` or `page_size` is given,
+    `?fields=id,title` limits the returned (and loaded) fields, and list
+    responses carry an ETag.
     """
 
     serializer_class = DocumentSerializer
     queryset = Document.objects.all()
     lookup_field = "id"
+    pagination_class = DocumentCursorPagination
+
+    def get_fields(self):
+        """
+        Fields requested with `?fields=`, or None for all of them.
+        """
+        fields = self.request.query_params.get("fields")
+        if not fields:
+            return None
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(fields) - set(DocumentSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError(
+                {"fields": f"Unknown fields: {', '.join(sorted(unknown))}"}
+            )
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_fields())
+        return super().get_serializer(*args, **kwargs)
 
     def get_queryset(self):
         """
-        Return documents that belong only to the currently authenticated user.
+        Return documents that belong only to the currently authenticated user,
+        loading only the columns that are serialized.
+        """
+        fields = self.get_fields() or DocumentSerializer.Meta.fields
+        # `id` and `uploaded_at` are also needed to build pagination cursors
+        return (
+            Document.objects.filter(uploaded_by_id=self.request.user.id)
+            .only("id", "uploaded_at", *fields)
+            .order_by(*DocumentCursorPagination.ordering)
+        )
+
+    def get_list_etag(self):
+        """
+        Every save of a document bumps its `updated_at`, so the latest
+        modification time and the document count (for deletions) identify
+        the state of a user's library.
         """
-        return Document.objects.filter(uploaded_by=self.request.user)
+        state = Document.objects.filter(uploaded_by_id=self.request.user.id).aggregate(
+            latest=Max("updated_at"), count=Count("id")
+        )
+        key = f"{self.request.user.pk}:{state['latest']}:{state['count']}:{self.request.get_full_path()}"
+        return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag()
+        if_none_match = request.headers.get("If-None-Match", "")
+        if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
     def get(self, request, id=None):
         """
@@ -83,11 +293,13 @@ class DocumentSelectionView(APIView):
         curr_user = request.user
         serializer = DocumentSelectionSerializer(data=request.data)
         if serializer.is_valid():
-            doc_ids = serializer.validated_data["document_ids"]
+            doc_ids = list(dict.fromkeys(serializer.validated_data["document_ids"]))
 
             # Validating document existence
             # documents = get_list_or_404(Document, id__in=doc_ids)
-            documents = Document.objects.filter(id__in=doc_ids, uploaded_by=curr_user)
+            documents = Document.objects.filter(
+                id__in=doc_ids, uploaded_by_id=curr_user.id
+            )
 
             # Check if all provided IDs are valid and owned by user
             if documents.count() != len(doc_ids):
@@ -98,28 +310,23 @@ class DocumentSelectionView(APIView):
                     status=status.HTTP_403_FORBIDDEN,
                 )
 
-            injector = DataInjector()
-            injector.clear_vectors()
-
-            # Creating or Updating selection
-            try:
-                selected_docs_obj = SelectedDocuments.objects.get(user=curr_user)
-                selected_docs_obj.selected_ids = doc_ids
-                selected_docs_obj.save()
-            except SelectedDocuments.DoesNotExist:
-                selected_docs_obj = SelectedDocuments.objects.create(
-                    user=curr_user,
-                    selected_ids=doc_ids,
-                )
+            # Replacing the selection (one row per user) and its version
+            selection = SelectedDocuments.objects.select(curr_user, doc_ids)
 
-            for doc_id in doc_ids:
-                document = Document.objects.get(id=doc_id)
-                injector.add_document(document.file.path, user_id=curr_user.id)
+            # Retrieval is scoped by document_id metadata, so only documents
+            # indexed before that metadata existed need attention: their
+            # chunks are tagged in place, or ingested if none are found
+            injector = DataInjector()
+            for document in documents:
+                if not injector.has_document(document.id):
+                    if not adopt_legacy_chunks(document, injector):
+                        ingest_document(document, injector)
 
             return Response(
                 {
                     "message": "Documents selected successfully",
-                    "selected_documents": selected_docs_obj.selected_ids,
+                    "selected_documents": list(selection.document_ids),
+                    "version": selection.version,
                 },
                 status=status.HTTP_200_OK,
             )
@@ -130,53 +337,157 @@ class DocumentSelectionView(APIView):
         """
         Retrieve the IDs of selected documents.
         """
-        try:
-            # Getting the most recent user's selection
-            selected_docs = SelectedDocuments.objects.get(user=request.user)
-
-            if selected_docs:
-                return Response(
-                    {"selected_documents": selected_docs.selected_ids},
-                    status=status.HTTP_200_OK,
-                )
-            raise SelectedDocuments.DoesNotExist
-        except SelectedDocuments.DoesNotExist:
-            return Response({"selected_documents": []}, status=status.HTTP_200_OK)
+        selection = SelectedDocuments.objects.get_selection(request.user)
+        return Response(
+            {
+                "selected_documents": list(selection.document_ids),
+                "version": selection.version,
+            },
+            status=status.HTTP_200_OK,
+        )
 
 
 class QnAView(APIView):
     """
     View to handle Q&A requests based on selected documents.
+    Identical questions in flight are answered once, and responses to
+    requests with an `Idempotency-Key` header are replayed for a while.
     """
 
+    # Shared by the request threads of this process
+    in_flight = SingleFlight()
+
     def post(self, request, *args, **kwargs):
         """
         Generate an answer for a given question based on the selected documents.
         """
         curr_user = request.user
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+            return Response(
+                {"error": "Idempotency-Key must be 1 to 255 characters long."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if idempotency_key:
+            stored = get_stored_response(curr_user.id, idempotency_key)
+            if stored is not None:
+                if stored.fingerprint != request_fingerprint(request):
+                    return Response(
+                        {
+                            "error": "Idempotency-Key was already used for a different request."
+                        },
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                return Response(
+                    stored.data,
+                    status=stored.status,
+                    headers={"Idempotent-Replayed": "true"},
+                )
+
         # Validating incoming question data
         serializer = QuestionSerializer(data=request.data)
         if serializer.is_valid():
             question = serializer.validated_data["question"]
             thread_id = serializer.validated_data["thread_id"]
+            thread_id = thread_id if len(thread_id) > 0 else "default"
 
-            # Fetching selected documents from DB
-            try:
-                selected_docs = SelectedDocuments.objects.get(user=curr_user)
-                doc_ids = selected_docs.selected_ids
-            except SelectedDocuments.DoesNotExist:
-                print("No selected documents found.")
-
-            crag = CorrectiveRAG()
-            # Generating Answer using RAG
-            answer = crag.run(
-                question,
-                user_id=str(curr_user.id),
-                thread_id=(thread_id if len(thread_id) > 0 else "default"),
-            )
+            # Fetching selected documents (usually from the cache), searching
+            # all of the user's documents if nothing is selected
+            selection = SelectedDocuments.objects.get_selection(curr_user)
+            doc_ids = list(selection.document_ids) or None
 
-            return Response(
-                {"question": question, "answer": answer}, status=status.HTTP_200_OK
+            crag = get_corrective_rag()
+            # Generating Answer using RAG, once for duplicates in flight
+            answer, shared = self.in_flight.do(
+                ask_key(curr_user.id, thread_id, question, selection.version),
+                lambda: crag.run(
+                    question,
+                    user_id=str(curr_user.id),
+                    thread_id=thread_id,
+                    document_ids=doc_ids,
+                ),
             )
+            if shared:
+                logger.info("Coalesced duplicate question of user %s", curr_user.id)
+
+            data = {"question": question, "answer": answer}
+            if idempotency_key:
+                store_response(
+                    curr_user.id,
+                    idempotency_key,
+                    StoredResponse(
+                        request_fingerprint(request), status.HTTP_200_OK, data
+                    ),
+                )
+            return Response(data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BatchQnAView(APIView):
+    """
+    View answering many independent questions against the selected documents
+    in one request. Answers are streamed as newline-delimited JSON, one
+    `{"index", "question", "answer"}` object per question as it completes.
+    Retrieval and grading run before the response starts, so LLM rate
+    limits and outages there are answered with 429/503.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = BatchQuestionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        questions = serializer.validated_data["questions"]
+        selection = SelectedDocuments.objects.get_selection(request.user)
+        results = get_corrective_rag().run_batch(
+            questions,
+            user_id=str(request.user.id),
+            document_ids=list(selection.document_ids) or None,
+        )
+
+        def stream():
+            # Questions fail one by one; anything escaping the batch after the
+            # response started is reported in a final line instead of
+            # silently truncating the stream
+            try:
+                for index, answer in results:
+                    line = {"index": index, "question": questions[index]}
+                    if isinstance(answer, Exception):
+                        logger.error("Batch question %d failed: %r", index, answer)
+                        line["error"] = "The question could not be answered."
+                    else:
+                        line["answer"] = answer
+                    yield json.dumps(line) + "\n"
+            except Exception as e:
+                logger.error("Batch failed: %r", e)
+                yield json.dumps({"error": "The batch could not be completed."}) + "\n"
+
+        response = StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+        # Stops proxies such as nginx from holding back streamed lines
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class MetricsView(APIView):
+    """
+    View exposing CorrectiveRAG node metrics in the Prometheus text format.
+    """
+
+    # Scrapers authenticate with a static bearer token instead of a JWT
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Render the metrics aggregated by the PrometheusSink of this process.
+        """
+        token = get_rag_settings("INSTRUMENTATION")["METRICS_TOKEN"]
+        sink = get_sink(PrometheusSink)
+        if not token or sink is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization, f"Bearer {token}"):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        return HttpResponse(
+            sink.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
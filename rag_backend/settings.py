@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from datetime import timedelta
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -57,11 +58,27 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Stateless JWT authentication builds the request user from the token's
+# claims, checking the user's active status and the token blacklist against
+# in-process caches instead of loading the user row on every request.
+# Set JWT_STATELESS_AUTH=0 to load the full user from the database.
+JWT_STATELESS_AUTH = os.environ.get("JWT_STATELESS_AUTH", "1") != "0"
+# Seconds a user's active status and the blacklist are cached per process,
+# i.e. how long a deactivated user or revoked token may still be accepted
+AUTH_USER_STATUS_TTL = int(os.environ.get("AUTH_USER_STATUS_TTL", 60))
+AUTH_BLACKLIST_TTL = int(os.environ.get("AUTH_BLACKLIST_TTL", 30))
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        (
+            "users.authentication.CachedJWTAuthentication"
+            if JWT_STATELESS_AUTH
+            else "rest_framework_simplejwt.authentication.JWTAuthentication"
+        ),
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    # LLM rate limits and outages become 429/503 responses
+    "EXCEPTION_HANDLER": "api.exceptions.api_exception_handler",
 }
 
 SIMPLE_JWT = {
@@ -96,12 +113,65 @@ WSGI_APPLICATION = "rag_backend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Set DB_ENGINE=postgresql (with DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and
+# DB_PORT) to use a server database. SQLite remains the default, in WAL mode
+# so reads don't block on the single writer.
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite3")
+# Seconds a connection is reused across requests (0 closes it after each one)
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+# Size of the psycopg connection pool; 0 uses persistent connections instead
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 0))
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "rag_backend"),
+            "USER": os.environ.get("DB_USER", ""),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "localhost"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            "CONN_HEALTH_CHECKS": True,
+            # Django doesn't allow persistent connections together with a pool
+            "CONN_MAX_AGE": 0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+            "OPTIONS": (
+                {
+                    "pool": {
+                        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+                        "max_size": DB_POOL_MAX_SIZE,
+                        "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+                    }
+                }
+                if DB_POOL_MAX_SIZE
+                else {}
+            ),
+        }
     }
-}
+elif DB_ENGINE == "sqlite3":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DB_NAME", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "OPTIONS": {
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA cache_size=-20000;"
+                ),
+                # Seconds a writer waits for the lock before "database is locked"
+                "timeout": int(os.environ.get("DB_BUSY_TIMEOUT", 20)),
+                # Take the write lock when a transaction starts, so concurrent
+                # transactions wait on the busy timeout instead of failing
+                # when upgrading from a read lock
+                "transaction_mode": "IMMEDIATE",
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(
+        f"Unsupported DB_ENGINE {DB_ENGINE!r}, use sqlite3 or postgresql"
+    )
 
 
 # Password validation
@@ -144,6 +214,91 @@ STATIC_URL = "static/"
 MEDIA_URL = "/uploads/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "uploads")
 
+# Where uploaded documents are stored. "local" keeps them content-addressed
+# (named by SHA-256) under MEDIA_ROOT, "s3" in an S3-compatible bucket
+# (S3_BUCKET, S3_ENDPOINT_URL for e.g. MinIO, S3_ACCESS_KEY_ID,
+# S3_SECRET_ACCESS_KEY, S3_REGION, S3_PREFIX) shared by all nodes.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+STORAGE_BACKENDS = {
+    "local": "api.storage.ContentAddressedStorage",
+    "s3": "api.storage.ContentAddressedS3Storage",
+}
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"Unsupported STORAGE_BACKEND {STORAGE_BACKEND!r}, use local or s3"
+    )
+STORAGES = {
+    "default": {"BACKEND": STORAGE_BACKENDS[STORAGE_BACKEND]},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+S3_ACCESS_KEY_ID = os.environ.get("S3_ACCESS_KEY_ID")
+S3_SECRET_ACCESS_KEY = os.environ.get("S3_SECRET_ACCESS_KEY")
+S3_REGION = os.environ.get("S3_REGION")
+S3_PREFIX = os.environ.get("S3_PREFIX", "")
+
+# Vector store. "embedded" opens the Chroma collections (./rag_db) inside
+# every process, which suits development; with several workers, use "http"
+# to connect them all to one Chroma server (`chroma run --path ... --port 8001`)
+# at CHROMA_HOST:CHROMA_PORT, so the index is loaded once and writes are
+# immediately visible to every worker.
+RAG_VECTOR_STORE = {
+    "MODE": os.environ.get("VECTOR_STORE_MODE", "embedded"),
+    "HOST": os.environ.get("CHROMA_HOST", "localhost"),
+    "PORT": int(os.environ.get("CHROMA_PORT", 8001)),
+    "SSL": os.environ.get("CHROMA_SSL", "0") == "1",
+    "HEADERS": (
+        {"Authorization": f"Bearer {os.environ['CHROMA_AUTH_TOKEN']}"}
+        if os.environ.get("CHROMA_AUTH_TOKEN")
+        else None
+    ),
+}
+
+# Seconds a user's document selection stays in the cache. The default
+# local-memory cache is per process: with several workers, configure a shared
+# CACHES backend (e.g. Redis) so a new selection is seen by all of them.
+SELECTION_CACHE_TIMEOUT = int(os.environ.get("SELECTION_CACHE_TIMEOUT", 300))
+
+# Seconds a completed /api/ask/ response is replayed for requests repeating
+# its Idempotency-Key header. Stored in CACHES, so use a shared backend to
+# replay across worker processes.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 600))
+
+# Chunked uploads: default part size and largest accepted file, in bytes.
+# Parts are written straight to MEDIA_ROOT/partial/ while they arrive, so with
+# several API nodes that directory must be on storage shared by all of them.
+CHUNKED_UPLOAD_PART_SIZE = int(
+    os.environ.get("CHUNKED_UPLOAD_PART_SIZE", 8 * 1024 * 1024)
+)
+CHUNKED_UPLOAD_MAX_SIZE = int(
+    os.environ.get("CHUNKED_UPLOAD_MAX_SIZE", 1024 * 1024 * 1024)
+)
+# Seconds after its last part an abandoned upload is aborted, and uploads a
+# user may have open at once
+CHUNKED_UPLOAD_EXPIRY = int(os.environ.get("CHUNKED_UPLOAD_EXPIRY", 24 * 60 * 60))
+CHUNKED_UPLOAD_MAX_OPEN = int(os.environ.get("CHUNKED_UPLOAD_MAX_OPEN", 5))
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "simple": {"format": "{asctime} {levelname} {name} {message}", "style": "{"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "simple"},
+    },
+    "loggers": {
+        "RAG": {
+            "handlers": ["console"],
+            "level": os.environ.get("RAG_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,168 @@
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache whose entries expire after `ttl`
+    seconds. Each worker process keeps its own copy, so changes made by
+    other processes are seen after at most `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self.__entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            # Drop expired entries now and then, so the cache stays small
+            if len(self.__entries) > 10000:
+                now = time.monotonic()
+                self.__entries = {
+                    k: v for k, v in self.__entries.items() if v[0] >= now
+                }
+
+    def delete(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+
+# User ID -> is_active, or None for deleted users
+user_status_cache = TTLCache(getattr(settings, "AUTH_USER_STATUS_TTL", 60))
+# Single entry holding the JTIs of blacklisted, unexpired access tokens
+blacklist_cache = TTLCache(getattr(settings, "AUTH_BLACKLIST_TTL", 30))
+BLACKLIST_KEY = "jtis"
+
+
+def get_user_status(user_id) -> bool | None:
+    """
+    Whether a user is active, cached for `AUTH_USER_STATUS_TTL` seconds.
+
+    :param user_id: ID of the user.
+    :return: `is_active` of the user, or None if the user doesn't exist.
+    """
+    # Tokens carry the ID as a string
+    user_id = str(user_id)
+    missing = object()
+    status = user_status_cache.get(user_id, missing)
+    if status is missing:
+        status = (
+            get_user_model()
+            .objects.filter(pk=user_id)
+            .values_list("is_active", flat=True)
+            .first()
+        )
+        user_status_cache.set(user_id, status)
+    return status
+
+
+def may_be_access_token(outstanding: OutstandingToken) -> bool:
+    """
+    Whether an outstanding token expires within an access token's lifetime.
+    Refresh tokens, blacklisted on every rotation, live far longer and can't
+    authenticate requests, so they are left out of the cached blacklist.
+    """
+    return outstanding.expires_at <= timezone.now() + api_settings.ACCESS_TOKEN_LIFETIME
+
+
+def get_blacklisted_jtis() -> frozenset:
+    """
+    JTIs of blacklisted access tokens that haven't expired, loaded in one
+    query and cached for `AUTH_BLACKLIST_TTL` seconds.
+    """
+    jtis = blacklist_cache.get(BLACKLIST_KEY)
+    if jtis is None:
+        now = timezone.now()
+        jtis = frozenset(
+            BlacklistedToken.objects.filter(
+                token__expires_at__gt=now,
+                token__expires_at__lte=now + api_settings.ACCESS_TOKEN_LIFETIME,
+            ).values_list("token__jti", flat=True)
+        )
+        blacklist_cache.set(BLACKLIST_KEY, jtis)
+    return jtis
+
+
+def blacklist_access_token(token):
+    """
+    Blacklist an access token, so it stops working before it expires (e.g.
+    on logout). Simple JWT only blacklists refresh tokens itself.
+
+    :param token: Validated access token.
+    """
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti=token[api_settings.JTI_CLAIM],
+        defaults={
+            "user_id": token.get(api_settings.USER_ID_CLAIM),
+            "token": str(token),
+            "created_at": timezone.now(),
+            "expires_at": datetime_from_epoch(token["exp"]),
+        },
+    )
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+
+
+class CachedJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication without a per-request database query. The user is a
+    `TokenUser` built from the token's claims, the user's active status
+    and the token blacklist come from in-process TTL caches.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        status = get_user_status(user.id)
+        if status is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not status:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if validated_token.get(api_settings.JTI_CLAIM) in get_blacklisted_jtis():
+            raise InvalidToken(_("Token is blacklisted"))
+        return user
+
+
+def forget_user_status(sender, instance, **kwargs):
+    user_status_cache.delete(str(instance.pk))
+
+
+def forget_blacklist(sender, instance, **kwargs):
+    # Blacklisting refresh tokens on rotation keeps the cached set
+    if may_be_access_token(instance.token):
+        blacklist_cache.clear()
+
+
+def forget_blacklist_entries(sender, **kwargs):
+    # Rows are only deleted when expired tokens are flushed
+    blacklist_cache.clear()
+
+
+post_save.connect(forget_user_status, sender=settings.AUTH_USER_MODEL)
+post_delete.connect(forget_user_status, sender=settings.AUTH_USER_MODEL)
+post_save.connect(forget_blacklist, sender=BlacklistedToken)
+post_delete.connect(forget_blacklist_entries, sender=BlacklistedToken)
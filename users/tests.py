@@ -1,3 +1,60 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import blacklist_cache, get_blacklisted_jtis, user_status_cache
+from .models import User
 
-# Create your tests here.
+
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_status_cache.clear()
+        blacklist_cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="password")
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}"
+        )
+
+    def test_no_queries_once_cached(self):
+        url = reverse("document-selection")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_inactive_user_rejected(self):
+        url = reverse("document-selection")
+        self.client.get(url)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_access_token(self):
+        url = reverse("document-selection")
+        self.client.get(url)
+        response = self.client.post(
+            reverse("logout"), {"refresh_token": str(self.refresh)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rotation_keeps_cached_blacklist(self):
+        url = reverse("document-selection")
+        self.client.get(url)
+        # Rotating blacklists the old refresh token, which can't authenticate
+        response = self.client.post(
+            reverse("token_refresh"), {"refresh": str(self.refresh)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        blacklist_cache.clear()
+        self.assertNotIn(self.refresh["jti"], get_blacklisted_jtis())
@@ -6,9 +6,10 @@ from rest_framework.authentication import (
 )
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from rest_framework import status
 from rest_framework.views import APIView
+from .authentication import blacklist_access_token
 from .serializers import LoginSerializer, SignupSerializer
 
 
@@ -54,6 +55,9 @@ class LogoutView(APIView):
             refresh_token = request.data["refresh_token"]
             token = RefreshToken(refresh_token)
             token.blacklist()
+            # The access token used to log out stops working right away too
+            if isinstance(request.auth, AccessToken):
+                blacklist_access_token(request.auth)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except Exception as e:
             return Response(